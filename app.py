@@ -1,34 +1,87 @@
 # flask 프레임워크를 이용한 ,  Restful API 서버 개발
 
-from flask import Flask
+import time
+import uuid
+
+from flask import Flask, g, request
 from flask_jwt_extended import JWTManager
 from flask_restful import Api
+from app_logging import get_logger, setup_logging
 from config import Config
-from resources.follow import FollowResource
+from json_encoder import output_json
+import image_pipeline
+import metrics
+from mysql_connection import get_connection
+import read_after_write
+from resources.follow import FollowCountResource, FolloweeListResource, FollowerListResource, FollowResource
 from resources.like import LikeResource
+from resources.metrics import MetricsResource
 from resources.posting import PostingListResource, PostingResource
+from resources.tag import PopularTagResource, TagPostingResource
+from tag_names import warm_tag_cache
 
 
 #  로그 아웃 관련된 임포트문. 
-from resources.user import UserLoginResource, UserLogoutResource, UserRegisterResource, jwt_blocklist
+from resources.user import UserLoginResource, UserLogoutResource, UserRegisterResource
+from token_blocklist import is_token_revoked, start_purge_thread
+
 
+# 로그 설정. print 대신 JSON 로그를 별도 스레드에서 출력한다.
+setup_logging()
+logger = get_logger('access')
 
 app = Flask(__name__)
 
-api = Api(app)
+# 커넥션 풀이 DB_POOL_TIMEOUT 초 안에 커넥션을 못 빌려주면 PoolError. 잠시후 다시 시도하도록 503
+api = Api(app, errors={'PoolError' : {'status' : 503,
+                                      'message' : 'DB 가 바쁩니다. 잠시후 다시 시도하세요.'}})
+
+# JSON 응답은 json_encoder 로 만든다. (orjson 이 있으면 orjson, datetime 도 처리)
+api.representation('application/json')(output_json)
 
 # 환경변수 셋팅
 
 app.config.from_object(Config)
+# 이 크기를 넘는 요청은 본문을 읽기 전에 413 으로 거절한다.
+# (Flask 기본 설정에 None 으로 들어있으므로 setdefault 로는 바뀌지 않는다.)
+if app.config.get('MAX_CONTENT_LENGTH') is None:
+    app.config['MAX_CONTENT_LENGTH'] = image_pipeline.MAX_UPLOAD_SIZE
 # JWT 매니저를 초기화
 jwt = JWTManager(app) 
 
+# 자주 쓰는 태그 이름을 캐시에 미리 읽어둔다.
+if getattr(Config, 'TAG_CACHE_WARM', False):
+    connection = get_connection()
+    warm_tag_cache(connection)
+    connection.close()
+
 # 로그 아웃 된 토큰으로 요청하는 경우,
 # 실행되지 않도록 처리하는 코드.
 @jwt.token_in_blocklist_loader
 def check_if_token_is_revoked(jwt_header,jwt_payload):
     jti = jwt_payload['jti']
-    return jti in jwt_blocklist
+    return is_token_revoked(jti)
+
+# 만료된 토큰은 주기적으로 목록에서 지운다.
+start_purge_thread()
+
+# 요청마다 아이디를 붙여서, 그 요청에서 남긴 로그를 같이 찾을수 있게 한다.
+@app.before_request
+def start_request():
+    g.request_id = request.headers.get('X-Request-Id') or uuid.uuid4().hex
+    g.start_time = time.perf_counter()
+
+@app.after_request
+def log_request(response):
+    elapsed = time.perf_counter() - g.start_time
+    elapsed_ms = elapsed * 1000
+    metrics.observe_request(request.endpoint, request.method, response.status_code, elapsed)
+    logger.info('%s %s %s', request.method, request.path, response.status_code,
+                extra={'status' : response.status_code,
+                       'elapsed_ms' : round(elapsed_ms, 2)})
+    response.headers['X-Request-Id'] = g.request_id
+    read_after_write.set_marker(response)
+    return response
 
 # API를 구분해서 실행시키는 것은,
 # HTTP METHOD 와 URL의 조합 이다.
@@ -42,11 +95,24 @@ api.add_resource( UserLogoutResource ,'/user/logout')
 api.add_resource( PostingListResource,'/posting') #포스팅 작성 , 팔로워한 포스팅 보기 
 api.add_resource( PostingResource ,'/posting/<int:posting_id>') # 포스팅 삭제 , 수정 ,상세보기
 
-api.add_resource( FollowResource , '/follow/<int:followee_id>') #친구 추가, 삭제 
+api.add_resource( FollowResource , '/follow/<int:followee_id>') #친구 추가, 삭제, 팔로우 여부
+api.add_resource( FolloweeListResource , '/user/<int:user_id>/followee') # 팔로우한 유저 목록
+api.add_resource( FollowerListResource , '/user/<int:user_id>/follower') # 팔로워 목록
+api.add_resource( FollowCountResource , '/user/<int:user_id>/follow/count') # 팔로위, 팔로워 수
 api.add_resource( LikeResource , '/like/<int:posting_id>') # 좋아요 ,좋아요 취소 
 
+api.add_resource( TagPostingResource , '/tag/<string:name>/posting') # 해시태그로 포스팅 검색
+api.add_resource( PopularTagResource , '/tag/popular') # 인기 태그
+
+api.add_resource( MetricsResource , '/metrics') # 응답시간, SQL 시간 등 통계
+
 if __name__ == '__main__':
-    app.run()
+    # SERVER_MODE 가 'asgi' 면 비동기 서버(asgi.py)로 실행한다.
+    if getattr(Config, 'SERVER_MODE', 'wsgi') == 'asgi':
+        import asgi
+        asgi.run()
+    else:
+        app.run()
 
 
 
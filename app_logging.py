@@ -0,0 +1,95 @@
+# 서버 로그 설정.
+#
+# print() 대신 레벨이 있는 로거를 쓰고, 한줄에 JSON 하나로 기록한다.
+# 요청 스레드는 큐에 넣기만 하고(QueueHandler), 실제 출력은
+# 별도 스레드(QueueListener)가 하므로 출력이 느려도 요청이 멈추지 않는다.
+# 요청 안에서 남긴 로그에는 request_id, user_id, endpoint 가 자동으로 들어간다.
+
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+from flask_jwt_extended import get_jwt_identity
+
+from config import Config
+
+
+LOG_LEVEL = getattr(Config, 'LOG_LEVEL', 'INFO')
+LOGGER_NAME = 'posting-server'
+
+# LogRecord 가 원래 가지고 있는 속성들. 이것 외의 값은 extra 로 보고 JSON 에 넣는다.
+_RESERVED = set(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'asctime'}
+
+
+class RequestContextFilter(logging.Filter):
+    '''요청 안에서 남긴 로그에 request_id, user_id, endpoint 를 붙인다.'''
+
+    def filter(self, record):
+        if has_request_context():
+            if not hasattr(record, 'request_id'):
+                record.request_id = g.get('request_id')
+            if not hasattr(record, 'endpoint'):
+                record.endpoint = request.endpoint
+            if not hasattr(record, 'user_id'):
+                try:
+                    record.user_id = get_jwt_identity()
+                except Exception:
+                    record.user_id = None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        data = {'time' : datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+                'level' : record.levelname,
+                'logger' : record.name,
+                'message' : record.getMessage()}
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and value is not None:
+                data[key] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+_listener = None
+
+
+# 서버 시작할때 한번 호출한다.
+def setup_logging(level=LOG_LEVEL, stream=None):
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    log_queue = queue.Queue(-1)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # 요청 정보는 요청 스레드에서 붙여야 하므로, 큐에 넣기 전에 필터를 건다.
+    queue_handler.addFilter(RequestContextFilter())
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level)
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# 모듈별 로거.  logger = get_logger(__name__)
+def get_logger(name):
+    return logging.getLogger(LOGGER_NAME + '.' + name)
@@ -0,0 +1,481 @@
+# 비동기(ASGI) 서버 모드.
+#
+#   uvicorn asgi:application --workers 4
+#   또는 config.py 에 SERVER_MODE = 'asgi' 로 두고  python app.py
+#
+# 요청이 많은 읽기/쓰기 API (피드, 포스팅 상세, 좋아요, 친구추가)는
+# 이벤트 루프에서 aiomysql 커넥션 풀로 직접 처리한다. DB 를 기다리는 동안
+# 스레드를 잡고 있지 않으므로, 워커 수보다 훨씬 많은 요청을 동시에 처리할수 있다.
+# 나머지 API 는 기존 Flask 앱(app.py)에 그대로 넘긴다. (asgiref 가 스레드풀에서 실행)
+# 복제 DB(DB_REPLICA_HOSTS)가 있으면 피드와 포스팅 상세는 복제본마다 둔 aiomysql 풀에서
+# 읽는다. 돌아가며 쓰고 장애난 복제본을 빼두는 방식, 쓰기 직후 primary 에서 읽는
+# 표시(read_after_write)는 Flask 쪽(mysql_connection.get_read_connection)과 같다.
+# URL 과 JWT 처리는 Flask 앱과 같다.
+#
+# S3 업로드와 Rekognition 은 원래 image_pipeline 의 백그라운드 워커에서 처리하므로
+# 이벤트 루프를 막지 않는다.
+#
+# 필요한 패키지 : aiomysql, asgiref, uvicorn
+
+import asyncio
+import contextlib
+import contextvars
+import re
+import time
+import uuid
+from urllib.parse import parse_qs
+
+import aiomysql
+from asgiref.wsgi import WsgiToAsgi
+from flask_jwt_extended import decode_token
+from pymysql.err import MySQLError
+
+from app import app as flask_app
+from app_logging import get_logger
+from config import Config
+import follow_graph
+from json_encoder import dumps_bytes
+import like_buffer
+import metrics
+from mysql_connection import (REPLICA_HOSTS, REPLICA_POOL_SIZE, REPLICA_RETRY_AFTER,
+                              ReplicaSet, _replica_config)
+import posting_cache
+import read_after_write
+import timeline
+from resources.posting import feed_query
+from token_blocklist import is_token_revoked
+from utils import decode_cursor, encode_cursor
+
+
+POOL_MIN = getattr(Config, 'ASYNC_DB_POOL_MIN', 5)
+POOL_MAX = getattr(Config, 'ASYNC_DB_POOL_MAX', 50)
+HOST = getattr(Config, 'ASGI_HOST', '127.0.0.1')
+PORT = getattr(Config, 'ASGI_PORT', 5000)
+
+logger = get_logger('access')
+
+wsgi_fallback = WsgiToAsgi(flask_app)
+
+_pool = None
+_pool_lock = asyncio.Lock()
+_replicas = None
+
+# 이 요청은 primary 에서 읽는다. (방금 쓰기를 한 유저. Flask 쪽의 g 와 같은 역할)
+_read_primary = contextvars.ContextVar('read_primary', default=False)
+
+
+async def get_pool():
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await aiomysql.create_pool(minsize = POOL_MIN,
+                                                   maxsize = POOL_MAX,
+                                                   host = Config.HOST,
+                                                   db = Config.DATABASE,
+                                                   user = Config.DB_USER,
+                                                   password = Config.DB_PASSWORD,
+                                                   autocommit = False)
+    return _pool
+
+
+class AsyncReplicaSet(ReplicaSet):
+    '''ReplicaSet 의 aiomysql 버전. 돌아가며 고르기와 장애난 복제본 빼두기는 그대로 쓴다.'''
+
+    # 쓸수 있는 복제본의 (풀, 커넥션). 모두 안되면 None.
+    async def acquire(self):
+        for i in self._candidates():
+            pool = self.pools[i]
+            if pool.freesize == 0 and pool.size >= pool.maxsize:
+                # 풀이 가득찬 것은 장애가 아니므로 빼지 않고 다음 복제본을 본다.
+                continue
+            try:
+                connection = await pool.acquire()
+            except (MySQLError, OSError):
+                self.eject(i)
+                continue
+            with self._lock:
+                self._stats['checkouts'] += 1
+            return pool, connection
+
+        with self._lock:
+            self._stats['fallbacks'] += 1
+        return None
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._stats)
+            stats['replicas'] = len(self.pools)
+            stats['healthy'] = len([until for until in self._ejected_until if until <= now])
+        for i, pool in enumerate(self.pools):
+            stats['replica' + str(i) + '_in_use'] = pool.size - pool.freesize
+        return stats
+
+
+# 복제 DB 가 설정되어 있지 않으면 None
+async def get_replicas():
+    global _replicas
+    if _replicas is None and len(REPLICA_HOSTS) != 0:
+        async with _pool_lock:
+            if _replicas is None:
+                pools = []
+                for replica in REPLICA_HOSTS:
+                    db_config = _replica_config(replica)
+                    db_config['db'] = db_config.pop('database')
+                    # minsize 0 : 만들때 접속하지 않으므로, 죽은 복제본이 있어도 시작할수 있다.
+                    pools.append(await aiomysql.create_pool(minsize = 0,
+                                                            maxsize = REPLICA_POOL_SIZE,
+                                                            autocommit = False,
+                                                            **db_config))
+                _replicas = AsyncReplicaSet(pools, REPLICA_RETRY_AFTER)
+    return _replicas
+
+
+# 읽기 전용 커넥션. mysql_connection.get_read_connection 과 같이
+# 복제본에서 빌려오고, 없거나 모두 장애거나 방금 쓰기를 한 유저면 primary 에서 빌려온다.
+@contextlib.asynccontextmanager
+async def read_connection():
+    replicas = await get_replicas()
+    if replicas is not None and not _read_primary.get():
+        found = await replicas.acquire()
+        if found is not None:
+            pool, connection = found
+            connection.replica = True
+            try:
+                yield connection
+            finally:
+                pool.release(connection)
+            return
+
+    pool = await get_pool()
+    async with pool.acquire() as connection:
+        yield connection
+
+
+async def close_pool():
+    global _pool, _replicas
+    if _pool is not None:
+        _pool.close()
+        await _pool.wait_closed()
+        _pool = None
+    if _replicas is not None:
+        for pool in _replicas.pools:
+            pool.close()
+            await pool.wait_closed()
+        _replicas = None
+
+
+class HTTPError(Exception):
+
+    def __init__(self, body, status):
+        self.body = body
+        self.status = status
+
+
+# ---------- JWT ----------
+
+# Flask 쪽 @jwt_required() 와 같은 검사를 한다.
+# 토큰이 없거나 잘못되면 flask_jwt_extended 와 같은 {"msg" : ...} 로 401.
+async def authenticate(headers):
+    authorization = headers.get('authorization', '')
+    if not authorization.startswith('Bearer '):
+        raise HTTPError({'msg' : 'Missing Authorization Header'}, 401)
+    token = authorization[len('Bearer '):]
+
+    try:
+        with flask_app.app_context():
+            payload = decode_token(token)
+    except Exception as e:
+        raise HTTPError({'msg' : str(e)}, 401)
+
+    if payload.get('type') != 'access':
+        raise HTTPError({'msg' : 'Only non-refresh tokens are allowed'}, 401)
+
+    # 블랙리스트 확인은 대부분 로컬 캐시에서 끝나지만, DB 를 볼수도 있으므로 스레드에서 실행한다.
+    if await asyncio.to_thread(is_token_revoked, payload['jti']):
+        raise HTTPError({'msg' : 'Token has been revoked'}, 401)
+
+    return payload[flask_app.config.get('JWT_IDENTITY_CLAIM', 'sub')]
+
+
+# ---------- API ----------
+
+# Flask 쪽의 InstrumentedCursor 처럼 쿼리 시간과 행 수를 /metrics 에 기록한다.
+# (aiomysql 기본 커서는 결과를 한번에 받아오므로 rowcount 가 정확하다)
+async def execute(cursor, query, record=None):
+    start = time.perf_counter()
+    try:
+        await cursor.execute(query, record)
+    finally:
+        metrics.observe_query(query, time.perf_counter() - start, cursor.rowcount)
+
+
+async def get_feed(user_id, args):
+    limit = args.get('limit')
+    offset = args.get('offset')
+    try:
+        limit = int(limit) if limit is not None else 20
+        offset = int(offset) if offset is not None else 0
+    except ValueError:
+        raise HTTPError({"error" : "offset, limit 은 숫자여야 합니다."}, 400)
+    if limit <= 0 or offset < 0:
+        raise HTTPError({"error" : "offset, limit 값이 올바르지 않습니다."}, 400)
+
+    before = None
+    if args.get('cursor') is not None:
+        try:
+            before = decode_cursor(args['cursor'])
+        except ValueError as e:
+            raise HTTPError({"error" : str(e)}, 400)
+
+    # 팔로우한 유저 목록이 캐시에 있으면 follow 조인 대신 쓴다.
+    followee_ids = None
+    if follow_graph.FEED_ENABLED:
+        followee_ids = follow_graph.cached_followees(user_id)
+        if followee_ids is not None and (len(followee_ids) == 0 or
+                                         len(followee_ids) > follow_graph.FEED_MAX_IDS):
+            followee_ids = None
+
+    query, record = feed_query(user_id, before, offset, limit, followee_ids)
+    async with read_connection() as connection:
+        async with connection.cursor(aiomysql.DictCursor) as cursor:
+            await execute(cursor, query, record)
+            result_list = await cursor.fetchall()
+        await connection.rollback()
+
+    next_cursor = None
+    if len(result_list) == limit:
+        last = result_list[-1]
+        next_cursor = encode_cursor(last['createdAt'], last['postId'])
+
+    return {"result " : "success",
+            "items" : result_list,
+            "count " : len(result_list),
+            "next_cursor" : next_cursor}, 200
+
+
+# 포스팅 여러개의 상세 정보 (posting_cache.get_details 와 같다)
+async def get_details(user_id, posting_ids):
+    details, missing = posting_cache.lookup(posting_ids)
+
+    async with read_connection() as connection:
+        if len(missing) != 0:
+            query, record = posting_cache.details_query(missing)
+            async with connection.cursor(aiomysql.DictCursor) as cursor:
+                await execute(cursor, query, record)
+                ttl = posting_cache.REPLICA_TTL if getattr(connection, 'replica', False) else None
+                details.update(posting_cache.store_rows(list(await cursor.fetchall()), ttl))
+
+        liked = set()
+        if len(details) != 0:
+            query, record = posting_cache.liked_query(user_id, list(details))
+            async with connection.cursor() as cursor:
+                await execute(cursor, query, record)
+                liked = set(row[0] for row in await cursor.fetchall())
+        await connection.rollback()
+
+    return posting_cache.overlay_likes(details, liked)
+
+
+async def get_posting(user_id, posting_id):
+    details = await get_details(user_id, [posting_id])
+    if posting_id not in details:
+        raise HTTPError({'error' : '데이터 없음'}, 400)
+
+    detail = details[posting_id]
+    return {"post" : detail['post'],
+            "tag " : detail['tag']}, 200
+
+
+# GET /posting?ids=1,2,3  (PostingListResource.get_bulk 와 같은 응답)
+async def get_bulk(user_id, ids):
+    try:
+        posting_ids = posting_cache.parse_ids(ids)
+    except ValueError as e:
+        raise HTTPError({"error" : str(e)}, 400)
+
+    details = await get_details(user_id, posting_ids)
+
+    # 요청한 순서대로 돌려준다.
+    items = []
+    for posting_id in posting_ids:
+        if posting_id in details:
+            item = details[posting_id]['post']
+            item['tag'] = details[posting_id]['tag']
+            items.append(item)
+
+    return {"result " : "success",
+            "items" : items,
+            "count " : len(items)}, 200
+
+
+async def like(user_id, posting_id, liked):
+    if like_buffer.ENABLED:
+        like_buffer.submit(user_id, posting_id, liked)
+        return {"Result " : "Success"}, 200
+
+    pool = await get_pool()
+    async with pool.acquire() as connection:
+        async with connection.cursor() as cursor:
+            if liked:
+                await execute(cursor, '''insert ignore into likes
+                                        (userId, postingId)
+                                        values
+                                        (%s,%s);''', (user_id, posting_id))
+                if cursor.rowcount > 0:
+                    await execute(cursor, '''update posting
+                                            set likeCnt = likeCnt + 1
+                                            where id = %s;''', (posting_id,))
+            else:
+                await execute(cursor, '''delete from likes
+                                        where userId = %s and postingId = %s;''',
+                              (user_id, posting_id))
+                if cursor.rowcount > 0:
+                    await execute(cursor, '''update posting
+                                            set likeCnt = greatest(likeCnt - %s, 0)
+                                            where id = %s;''', (cursor.rowcount, posting_id))
+        await connection.commit()
+
+    posting_cache.invalidate(posting_id)
+    return {"Result " : "Success"}, 200
+
+
+async def follow(user_id, followee_id, following):
+    pool = await get_pool()
+    async with pool.acquire() as connection:
+        async with connection.cursor() as cursor:
+            if following:
+                await execute(cursor, '''insert ignore into follow
+                                        (followerId,followeeId)
+                                        values
+                                        (%s,%s);''', (user_id, followee_id))
+            else:
+                await execute(cursor, '''delete from follow
+                                        where followerId =%s and followeeId =%s;''',
+                              (user_id, followee_id))
+            changed = cursor.rowcount > 0
+        await connection.commit()
+    if changed:
+        follow_graph.invalidate(user_id, followee_id)
+    return {"Result " : "Success"}, 200
+
+
+# (메소드, 경로, Flask 엔드포인트 이름, 처리 함수)
+# 처리 함수가 None 을 리턴하면 Flask 앱으로 넘긴다.
+def _feed_route(user_id, args, match):
+    # Flask 쪽과 같이 ids 가 있으면(빈 값이어도) 상세 여러개로 처리한다.
+    if 'ids' in args:
+        return get_bulk(user_id, args['ids'])
+    # 스트리밍 / 타임라인 모드는 Flask 쪽에서 처리한다.
+    if timeline.ENABLED or 'stream' in args:
+        return None
+    return get_feed(user_id, args)
+
+ROUTES = [
+    ('GET', re.compile(r'^/posting$'), 'postinglistresource', _feed_route),
+    ('GET', re.compile(r'^/posting/(\d+)$'), 'postingresource',
+     lambda user_id, args, match: get_posting(user_id, int(match.group(1)))),
+    ('POST', re.compile(r'^/like/(\d+)$'), 'likeresource',
+     lambda user_id, args, match: like(user_id, int(match.group(1)), True)),
+    ('DELETE', re.compile(r'^/like/(\d+)$'), 'likeresource',
+     lambda user_id, args, match: like(user_id, int(match.group(1)), False)),
+    # 타임라인 모드에서는 친구추가할때 타임라인도 바꿔야 하므로 Flask 쪽에서 처리한다.
+    ('POST', re.compile(r'^/follow/(\d+)$'), 'followresource',
+     lambda user_id, args, match: None if timeline.ENABLED else follow(user_id, int(match.group(1)), True)),
+    ('DELETE', re.compile(r'^/follow/(\d+)$'), 'followresource',
+     lambda user_id, args, match: None if timeline.ENABLED else follow(user_id, int(match.group(1)), False)),
+]
+
+
+def _match(method, path):
+    for route_method, pattern, endpoint, handler in ROUTES:
+        if route_method == method:
+            match = pattern.match(path)
+            if match is not None:
+                return endpoint, handler, match
+    return None
+
+
+async def send_json(send, body, status, request_id, extra_headers=()):
+    data = dumps_bytes(body)
+    await send({'type' : 'http.response.start',
+                'status' : status,
+                'headers' : [(b'content-type', b'application/json'),
+                             (b'content-length', str(len(data)).encode('ascii')),
+                             (b'x-request-id', request_id.encode('ascii'))] + list(extra_headers)})
+    await send({'type' : 'http.response.body', 'body' : data})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await get_pool()
+            await get_replicas()
+            await send({'type' : 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_pool()
+            await send({'type' : 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return await wsgi_fallback(scope, receive, send)
+
+    found = _match(scope['method'], scope['path'])
+    if found is None:
+        return await wsgi_fallback(scope, receive, send)
+    endpoint, handler, match = found
+
+    start = time.perf_counter()
+    headers = {key.decode('latin-1').lower() : value.decode('latin-1')
+               for key, value in scope['headers']}
+    request_id = headers.get('x-request-id') or uuid.uuid4().hex
+    args = {key : values[0] for key, values in
+            parse_qs(scope.get('query_string', b'').decode('utf-8'),
+                     keep_blank_values=True).items()}
+
+    try:
+        user_id = await authenticate(headers)
+        # 방금 친구추가를 한 유저의 GET 은, 캐시된 팔로위 목록 대신
+        # primary 에서 다시 읽도록 Flask 쪽에서 처리한다.
+        if scope['method'] == 'GET' and read_after_write.followed.check_headers(headers, user_id):
+            return await wsgi_fallback(scope, receive, send)
+        # 방금 쓰기를 한 유저는 복제 DB 대신 primary 에서 읽는다.
+        _read_primary.set(read_after_write.written.check_headers(headers, user_id))
+        coroutine = handler(user_id, args, match)
+        if coroutine is None:
+            return await wsgi_fallback(scope, receive, send)
+        body, status = await coroutine
+    except HTTPError as e:
+        body, status = e.body, e.status
+    except MySQLError as e:
+        logger.error(str(e), extra={'request_id' : request_id, 'endpoint' : endpoint})
+        body, status = {"ERROR" : str(e)}, 500
+
+    # 좋아요 / 친구추가를 했으면, 다음 요청이 복제 DB 나 캐시된 팔로위 목록 대신
+    # primary 에서 읽도록 표시를 붙인다.
+    extra_headers = []
+    if scope['method'] != 'GET' and status == 200:
+        if len(REPLICA_HOSTS) != 0:
+            extra_headers.extend(read_after_write.written.asgi_headers(user_id))
+        if endpoint == 'followresource':
+            extra_headers.extend(read_after_write.followed.asgi_headers(user_id))
+
+    await send_json(send, body, status, request_id, extra_headers)
+
+    elapsed = time.perf_counter() - start
+    metrics.observe_request(endpoint, scope['method'], status, elapsed)
+    logger.info('%s %s %s', scope['method'], scope['path'], status,
+                extra={'request_id' : request_id, 'endpoint' : endpoint,
+                       'status' : status, 'elapsed_ms' : round(elapsed * 1000, 2),
+                       'server' : 'asgi'})
+
+
+def run(host=HOST, port=PORT):
+    import uvicorn
+    uvicorn.run(application, host=host, port=port)
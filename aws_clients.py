@@ -0,0 +1,81 @@
+# S3, Rekognition 클라이언트를 프로세스에서 한번만 만들어서 같이 쓴다.
+# boto3 클라이언트는 만들때 비용이 크고(서비스 정의 로딩, 커넥션 풀 생성),
+# 만들어진 클라이언트는 여러 스레드에서 같이 써도 안전하다.
+#
+# 테스트에서는 set_clients() 로 moto 나 Stubber 를 붙인 클라이언트를 넣을수 있다.
+
+import threading
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config as BotoConfig
+
+from config import Config
+
+
+REGION = getattr(Config, 'AWS_REGION', 'ap-northeast-2')
+MAX_POOL_CONNECTIONS = getattr(Config, 'AWS_MAX_POOL_CONNECTIONS', 20)
+CONNECT_TIMEOUT = getattr(Config, 'AWS_CONNECT_TIMEOUT', 5)
+READ_TIMEOUT = getattr(Config, 'AWS_READ_TIMEOUT', 30)
+
+# S3 업로드 설정. 이 크기보다 큰 파일은 여러 조각으로 나눠서 동시에 올린다.
+MULTIPART_THRESHOLD = getattr(Config, 'S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024)
+MULTIPART_CHUNKSIZE = getattr(Config, 'S3_MULTIPART_CHUNKSIZE', 8 * 1024 * 1024)
+MAX_CONCURRENCY = getattr(Config, 'S3_MAX_CONCURRENCY', 4)
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _boto_config():
+    return BotoConfig(max_pool_connections = MAX_POOL_CONNECTIONS,
+                      connect_timeout = CONNECT_TIMEOUT,
+                      read_timeout = READ_TIMEOUT,
+                      retries = {'max_attempts' : 3, 'mode' : 'standard'})
+
+
+def _get_client(service_name, region_name=None):
+    client = _clients.get(service_name)
+    if client is not None:
+        return client
+    with _lock:
+        if service_name not in _clients:
+            _clients[service_name] = boto3.session.Session().client(
+                service_name,
+                region_name,
+                aws_access_key_id = Config.AWS_ACCESS_KEY_ID,
+                aws_secret_access_key = Config.AWS_SECRET_ACCESS_KEY,
+                config = _boto_config())
+        return _clients[service_name]
+
+
+def get_s3_client():
+    return _get_client('s3')
+
+
+def get_rekognition_client():
+    return _get_client('rekognition', REGION)
+
+
+# upload_fileobj 에 넘기는 전송 설정. 한번만 만들어서 같이 쓴다.
+# 동시에 올리는 조각 수가 커넥션 풀보다 많지 않도록 한다.
+_transfer_config = TransferConfig(multipart_threshold = MULTIPART_THRESHOLD,
+                                  multipart_chunksize = MULTIPART_CHUNKSIZE,
+                                  max_concurrency = min(MAX_CONCURRENCY, MAX_POOL_CONNECTIONS),
+                                  use_threads = True)
+
+
+def get_transfer_config():
+    return _transfer_config
+
+
+# 클라이언트를 바꿔 끼운다. (테스트용)
+# None 을 넘기면 그 클라이언트는 다음에 다시 만든다.
+def set_clients(s3=None, rekognition=None):
+    with _lock:
+        _clients.pop('s3', None)
+        _clients.pop('rekognition', None)
+        if s3 is not None:
+            _clients['s3'] = s3
+        if rekognition is not None:
+            _clients['rekognition'] = rekognition
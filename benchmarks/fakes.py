@@ -0,0 +1,41 @@
+# 부하 테스트용 가짜 S3 / Rekognition 클라이언트.
+# aws_clients.set_clients(s3=FakeS3(), rekognition=FakeRekognition()) 로 넣어서 쓴다.
+
+import random
+import threading
+import time
+
+
+class FakeS3:
+    '''업로드된 파일을 읽기만 하고 버린다. latency 초 만큼 기다린다.'''
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.uploads = 0
+        self._lock = threading.Lock()
+
+    def upload_fileobj(self, file, bucket, key, ExtraArgs=None, Config=None):
+        while file.read(1024 * 1024):
+            pass
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.uploads += 1
+
+
+class FakeRekognition:
+    '''정해진 라벨 중에서 몇개를 골라서 돌려준다.'''
+
+    LABELS = ['Person', 'Food', 'Dog', 'Cat', 'Car', 'Tree', 'Sky', 'Building',
+              'Beach', 'Flower', 'Coffee', 'Book', 'Phone', 'Mountain', 'Bicycle']
+
+    def __init__(self, latency=0.0, labels_per_image=5):
+        self.latency = latency
+        self.labels_per_image = labels_per_image
+
+    def detect_labels(self, Image=None, MaxLabels=5, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        count = min(self.labels_per_image, MaxLabels)
+        return {'Labels' : [{'Name' : name, 'Confidence' : 95.0}
+                            for name in random.sample(self.LABELS, count)]}
@@ -0,0 +1,59 @@
+# 피드 100개 응답을 JSON 으로 만드는 시간 비교.
+#   1. 예전 방식 : 행마다 isoformat() 한 뒤 표준 json
+#   2. json_encoder (표준 json + datetime 처리)
+#   3. json_encoder (orjson, 설치되어 있을때)
+#
+#   python benchmarks/json_bench.py
+
+import copy
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import json_encoder
+
+
+def make_feed(count=100):
+    now = datetime(2024, 1, 1, 12, 0, 0)
+    items = []
+    for i in range(count):
+        items.append({'postId' : i,
+                      'imgUrl' : 'https://bucket.s3.ap-northeast-2.amazonaws.com/2024-01-01T12_00_00.' + str(i) + '.jpg',
+                      'content' : '오늘 점심 #food ' * 5,
+                      'userId' : i % 17,
+                      'email' : 'user' + str(i % 17) + '@naver.com',
+                      'createdAt' : now - timedelta(minutes=i),
+                      'likeCnt' : i * 3,
+                      'isLike' : i % 2})
+    return items
+
+
+def old_way(items):
+    items = copy.copy(items)
+    for i, row in enumerate(items):
+        row = dict(row)
+        row['createdAt'] = row['createdAt'].isoformat()
+        items[i] = row
+    return json.dumps({'result ' : 'success', 'items' : items, 'count ' : len(items)}).encode('utf-8')
+
+
+def main():
+    items = make_feed()
+    data = {'result ' : 'success', 'items' : items, 'count ' : len(items)}
+    number = 2000
+
+    results = {'old (isoformat loop + json)' : timeit.timeit(lambda: old_way(items), number=number),
+               'json_encoder stdlib' : timeit.timeit(lambda: json_encoder._stdlib_dumps(data), number=number)}
+    if json_encoder.orjson is not None:
+        results['json_encoder orjson'] = timeit.timeit(lambda: json_encoder._orjson_dumps(data), number=number)
+
+    for name, seconds in results.items():
+        print('%-30s %8.1f us / response' % (name, seconds / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
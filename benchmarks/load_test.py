@@ -0,0 +1,415 @@
+# REST API 부하 테스트.
+#
+# 1. 가짜 소셜 그래프를 DB 에 만든다 (유저, 팔로우, 포스팅, 좋아요)
+# 2. S3 / Rekognition 을 가짜 클라이언트로 바꾼 서버를 이 프로세스 안에서 띄운다
+#    (--url 을 주면 이미 떠있는 서버를 사용한다. 이때는 가짜 클라이언트가 적용되지 않는다)
+# 3. 엔드포인트별로 동시에 요청을 보내서 req/s 와 p50/p95/p99 를 잰다
+# 4. 결과를 JSON 으로 저장해서, 다음 실행과 비교할수 있게 한다
+#
+#   python benchmarks/load_test.py seed --users 1000 --follows 50 --posts 10 --likes 20
+#   python benchmarks/load_test.py run --duration 20 --concurrency 32
+#   python benchmarks/load_test.py run --duration 20 --concurrency 32 --mode asgi
+#   python benchmarks/load_test.py compare benchmarks/results/a.json benchmarks/results/b.json
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from datetime import datetime, timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from fakes import FakeRekognition, FakeS3
+
+
+EMAIL_FORMAT = 'bench{}@example.com'
+PASSWORD = 'bench1234'
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+SCENARIOS = ['login', 'feed', 'detail', 'upload', 'follow', 'like']
+
+# 업로드용 작은 JPEG (1x1)
+TINY_JPEG = bytes.fromhex(
+    'ffd8ffe000104a46494600010100000100010000ffdb004300080606070605080707070909080a0c140d0c0b0b0c1912130f'
+    '141d1a1f1e1d1a1c1c20242e2720222c231c1c2837292c30313434341f27393d38323c2e333432ffc0000b080001000101'
+    '011100ffc4001f0000010501010101010100000000000000000102030405060708090a0bffc400b5100002010303020403'
+    '050504040000017d01020300041105122131410613516107227114328191a1082342b1c11552d1f02433627282090a1617'
+    '18191a25262728292a3435363738393a434445464748494a535455565758595a636465666768696a737475767778797a83'
+    '8485868788898a92939495969798999aa2a3a4a5a6a7a8a9aab2b3b4b5b6b7b8b9bac2c3c4c5c6c7c8c9cad2d3d4d5d6d7'
+    'd8d9dae1e2e3e4e5e6e7e8e9eaf1f2f3f4f5f6f7f8f9faffda0008010100003f00fbd3ffd9')
+
+
+# ---------- 1. 데이터 만들기 ----------
+
+def seed(args):
+    from mysql_connection import get_connection
+    from utils import hash_password
+
+    random.seed(args.seed)
+    connection = get_connection()
+    cursor = connection.cursor()
+
+    # 비밀번호 암호화는 느리므로, 같은 비밀번호를 한번만 암호화해서 모든 유저에게 쓴다.
+    password = hash_password(PASSWORD)
+    cursor.executemany('insert ignore into user (email, password) values (%s, %s)',
+                       [(EMAIL_FORMAT.format(i), password) for i in range(args.users)])
+    connection.commit()
+
+    cursor.execute('select id from user where email like %s', ('bench%@example.com',))
+    user_ids = [row[0] for row in cursor.fetchall()]
+
+    follows = []
+    for user_id in user_ids:
+        for followee_id in random.sample(user_ids, min(args.follows, len(user_ids) - 1)):
+            if followee_id != user_id:
+                follows.append((user_id, followee_id))
+    _insert_batches(connection, cursor,
+                    'insert ignore into follow (followerId, followeeId) values (%s, %s)', follows)
+
+    now = datetime.now()
+    postings = []
+    for user_id in user_ids:
+        for i in range(args.posts):
+            created_at = now - timedelta(minutes=random.randint(0, 60 * 24 * 30))
+            postings.append((user_id, 'https://example.com/bench/' + uuid.uuid4().hex + '.jpg',
+                             '부하 테스트 포스팅 ' + str(i), created_at))
+    _insert_batches(connection, cursor,
+                    'insert into posting (userId, imgUrl, content, createdAt) values (%s, %s, %s, %s)',
+                    postings)
+
+    cursor.execute('''select p.id from posting p join user u on p.userId = u.id
+                      where u.email like %s''', ('bench%@example.com',))
+    posting_ids = [row[0] for row in cursor.fetchall()]
+
+    likes = []
+    for posting_id in posting_ids:
+        for user_id in random.sample(user_ids, min(args.likes, len(user_ids))):
+            likes.append((user_id, posting_id))
+    _insert_batches(connection, cursor,
+                    'insert ignore into likes (userId, postingId) values (%s, %s)', likes)
+
+    # 좋아요 수 맞추기
+    cursor.execute('''update posting p
+                      join (select postingId, count(*) cnt from likes group by postingId) l
+                      on p.id = l.postingId
+                      set p.likeCnt = l.cnt''')
+    connection.commit()
+    cursor.close()
+    connection.close()
+
+    print(json.dumps({'users' : len(user_ids), 'follows' : len(follows),
+                      'postings' : len(posting_ids), 'likes' : len(likes)}))
+
+
+def _insert_batches(connection, cursor, query, rows, size=5000):
+    for start in range(0, len(rows), size):
+        cursor.executemany(query, rows[start:start + size])
+        connection.commit()
+
+
+# ---------- 2. 서버 ----------
+
+class AsgiServer:
+    '''uvicorn 을 스레드에서 실행한다. shutdown() 으로 멈춘다.'''
+
+    def __init__(self, port):
+        import uvicorn
+        import asgi
+        config = uvicorn.Config(asgi.application, host='127.0.0.1', port=port, log_level='warning')
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+
+    def shutdown(self):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+# mode 가 'wsgi' 면 werkzeug 스레드 서버, 'asgi' 면 uvicorn 으로 앱을 띄운다.
+def start_local_server(port, mode='wsgi'):
+    import aws_clients
+    aws_clients.set_clients(s3=FakeS3(), rekognition=FakeRekognition())
+
+    if mode == 'asgi':
+        return AsgiServer(port), 'http://127.0.0.1:' + str(port)
+
+    from werkzeug.serving import make_server
+
+    from app import app
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, 'http://127.0.0.1:' + str(port)
+
+
+# ---------- 3. 요청 ----------
+
+def request(url, method='GET', body=None, headers=None):
+    req = urllib.request.Request(url, data=body, headers=headers or {}, method=method)
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=30) as res:
+            data = res.read()
+            status = res.status
+    except urllib.error.HTTPError as e:
+        data = e.read()
+        status = e.code
+    except (urllib.error.URLError, OSError):
+        data = b''
+        status = 0
+    return status, time.perf_counter() - start, data
+
+
+def login(base_url, user_index):
+    body = json.dumps({'email' : EMAIL_FORMAT.format(user_index),
+                       'password' : PASSWORD}).encode('utf-8')
+    status, elapsed, data = request(base_url + '/user/login', 'POST', body,
+                                    {'Content-Type' : 'application/json'})
+    token = None
+    if status < 300:
+        token = json.loads(data).get('accessToken')
+    return status, elapsed, token
+
+
+def multipart(fields, file_field, file_name, file_data):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(('--' + boundary + '\r\nContent-Disposition: form-data; name="' + name +
+                      '"\r\n\r\n' + value + '\r\n').encode('utf-8'))
+    parts.append(('--' + boundary + '\r\nContent-Disposition: form-data; name="' + file_field +
+                  '"; filename="' + file_name + '"\r\nContent-Type: image/jpeg\r\n\r\n').encode('utf-8'))
+    parts.append(file_data + b'\r\n')
+    parts.append(('--' + boundary + '--\r\n').encode('utf-8'))
+    return b''.join(parts), 'multipart/form-data; boundary=' + boundary
+
+
+class Scenario:
+    '''유저 한명이 엔드포인트 하나를 호출하는 방법'''
+
+    def __init__(self, base_url, users, user_ids, posting_ids):
+        self.base_url = base_url
+        self.users = users
+        self.user_ids = user_ids
+        self.posting_ids = posting_ids
+        self.tokens = {}
+
+    def token(self, user_index):
+        if user_index not in self.tokens:
+            status, elapsed, token = login(self.base_url, user_index)
+            self.tokens[user_index] = token
+        return self.tokens[user_index]
+
+    def auth(self, user_index):
+        return {'Authorization' : 'Bearer ' + str(self.token(user_index))}
+
+    def login(self, user_index):
+        status, elapsed, token = login(self.base_url, user_index)
+        return status, elapsed
+
+    def feed(self, user_index):
+        status, elapsed, data = request(self.base_url + '/posting?limit=20', headers=self.auth(user_index))
+        return status, elapsed
+
+    def detail(self, user_index):
+        posting_id = random.choice(self.posting_ids)
+        status, elapsed, data = request(self.base_url + '/posting/' + str(posting_id),
+                                        headers=self.auth(user_index))
+        return status, elapsed
+
+    def upload(self, user_index):
+        body, content_type = multipart({'content' : '부하 테스트 업로드'}, 'image', 'bench.jpg', TINY_JPEG)
+        headers = self.auth(user_index)
+        headers['Content-Type'] = content_type
+        status, elapsed, data = request(self.base_url + '/posting', 'POST', body, headers)
+        return status, elapsed
+
+    def follow(self, user_index):
+        # 친구추가와 삭제를 번갈아 해서 데이터가 계속 늘어나지 않게 한다.
+        url = self.base_url + '/follow/' + str(random.choice(self.user_ids))
+        method = random.choice(['POST', 'DELETE'])
+        status, elapsed, data = request(url, method, headers=self.auth(user_index))
+        return status, elapsed
+
+    def like(self, user_index):
+        url = self.base_url + '/like/' + str(random.choice(self.posting_ids))
+        method = random.choice(['POST', 'DELETE'])
+        status, elapsed, data = request(url, method, headers=self.auth(user_index))
+        return status, elapsed
+
+
+def percentile(sorted_values, p):
+    if len(sorted_values) == 0:
+        return None
+    index = min(int(round(p / 100.0 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run_scenario(scenario, name, duration, concurrency, token_users):
+    call = getattr(scenario, name)
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    # 토큰은 측정 전에 미리 받아둔다. 측정 중에 로그인(비밀번호 암호화)이 섞이지 않도록
+    # 로그인 외 시나리오는 토큰을 받아둔 유저(bench0 ~ bench{token_users-1}) 중에서만 고른다.
+    users = scenario.users
+    if name != 'login':
+        users = min(scenario.users, token_users)
+        for user_index in range(users):
+            scenario.token(user_index)
+
+    deadline = time.perf_counter() + duration
+
+    def worker(worker_index):
+        local_latencies = []
+        local_statuses = {}
+        while time.perf_counter() < deadline:
+            user_index = random.randrange(users)
+            status, elapsed = call(user_index)
+            local_latencies.append(elapsed)
+            local_statuses[status] = local_statuses.get(status, 0) + 1
+        with lock:
+            latencies.extend(local_latencies)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {'requests' : len(latencies),
+            'req_per_sec' : round(len(latencies) / elapsed, 2),
+            'p50_ms' : _ms(percentile(latencies, 50)),
+            'p95_ms' : _ms(percentile(latencies, 95)),
+            'p99_ms' : _ms(percentile(latencies, 99)),
+            'statuses' : {str(status) : count for status, count in statuses.items()}}
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def load_ids(limit=10000):
+    from mysql_connection import get_connection
+    connection = get_connection()
+    cursor = connection.cursor()
+    cursor.execute('''select id from user where email like %s''', ('bench%@example.com',))
+    user_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute('''select p.id from posting p join user u on p.userId = u.id
+                      where u.email like %s limit %s''', ('bench%@example.com', limit))
+    posting_ids = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    connection.close()
+    return user_ids, posting_ids
+
+
+def run(args):
+    server = None
+    base_url = args.url
+    if base_url is None:
+        server, base_url = start_local_server(args.port, args.mode)
+
+    # 유저는 seed 에서 만든 범위(bench0 ~ bench{users-1})에서만 고른다.
+    user_ids, posting_ids = load_ids()
+    scenario = Scenario(base_url, args.users, user_ids, posting_ids)
+
+    results = {'time' : datetime.now().isoformat(),
+               'mode' : args.mode,
+               'base_url' : base_url,
+               'duration' : args.duration,
+               'concurrency' : args.concurrency,
+               'token_users' : args.token_users,
+               'scenarios' : {}}
+    for name in args.scenarios:
+        print('running', name, '...', flush=True)
+        results['scenarios'][name] = run_scenario(scenario, name, args.duration, args.concurrency,
+                                                     args.token_users)
+        print(json.dumps(results['scenarios'][name]), flush=True)
+
+    if server is not None:
+        server.shutdown()
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') +
+                              '-' + args.mode + '.json')
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2, ensure_ascii=False)
+    print('saved', output)
+
+
+# ---------- 4. 비교 ----------
+
+def compare(args):
+    with open(args.before, encoding='utf-8') as file:
+        before = json.load(file)
+    with open(args.after, encoding='utf-8') as file:
+        after = json.load(file)
+
+    print('%-8s %12s %12s %8s %10s %10s' % ('scenario', 'req/s before', 'req/s after',
+                                            'change', 'p99 before', 'p99 after'))
+    for name in after['scenarios']:
+        if name not in before['scenarios']:
+            continue
+        b = before['scenarios'][name]
+        a = after['scenarios'][name]
+        change = (a['req_per_sec'] / b['req_per_sec'] - 1) * 100 if b['req_per_sec'] else 0
+        print('%-8s %12.1f %12.1f %+7.1f%% %10s %10s' % (name, b['req_per_sec'], a['req_per_sec'],
+                                                         change, b['p99_ms'], a['p99_ms']))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = commands.add_parser('seed', help='가짜 소셜 그래프 만들기')
+    seed_parser.add_argument('--users', type=int, default=1000)
+    seed_parser.add_argument('--follows', type=int, default=50, help='유저당 팔로우 수')
+    seed_parser.add_argument('--posts', type=int, default=10, help='유저당 포스팅 수')
+    seed_parser.add_argument('--likes', type=int, default=20, help='포스팅당 좋아요 수')
+    seed_parser.add_argument('--seed', type=int, default=42)
+
+    run_parser = commands.add_parser('run', help='부하 테스트 실행')
+    run_parser.add_argument('--url', default=None, help='이미 떠있는 서버 주소. 없으면 이 프로세스에서 띄운다')
+    run_parser.add_argument('--port', type=int, default=5055)
+    run_parser.add_argument('--users', type=int, default=1000, help='seed 에서 만든 유저 수')
+    run_parser.add_argument('--duration', type=float, default=10, help='시나리오별 실행 시간(초)')
+    run_parser.add_argument('--concurrency', type=int, default=16)
+    run_parser.add_argument('--token-users', type=int, default=64,
+                            help='로그인 외 시나리오에서 쓸 유저 수. 측정 전에 모두 로그인해둔다')
+    run_parser.add_argument('--scenarios', nargs='+', default=SCENARIOS, choices=SCENARIOS)
+    run_parser.add_argument('--mode', default='wsgi', choices=['wsgi', 'asgi'],
+                            help='로컬 서버 모드. 결과 파일에도 기록한다')
+    run_parser.add_argument('--output', default=None)
+
+    compare_parser = commands.add_parser('compare', help='두 결과 파일 비교')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+
+    args = parser.parse_args()
+    if args.command == 'seed':
+        seed(args)
+    elif args.command == 'run':
+        run(args)
+    else:
+        compare(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# 로그인 처리량 측정.
+# 서버를 띄운 상태에서, 변경 전/후로 실행해서 비교한다.
+#
+#   python benchmarks/login_bench.py --url http://127.0.0.1:5000 \
+#          --email test@naver.com --password 1234 --requests 500 --concurrency 16
+
+import argparse
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def login(url, email, password):
+    body = json.dumps({'email' : email, 'password' : password}).encode('utf-8')
+    req = urllib.request.Request(url + '/user/login', data=body,
+                                 headers={'Content-Type' : 'application/json'},
+                                 method='POST')
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req) as res:
+            res.read()
+            status = res.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        results = list(executor.map(lambda i: login(args.url, args.email, args.password),
+                                    range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(result[1] for result in results)
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+
+    print(json.dumps({'requests' : args.requests,
+                      'concurrency' : args.concurrency,
+                      'req_per_sec' : args.requests / elapsed,
+                      'p50_ms' : latencies[len(latencies) // 2] * 1000,
+                      'p99_ms' : latencies[int(len(latencies) * 0.99) - 1] * 1000,
+                      'statuses' : statuses}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
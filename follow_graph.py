@@ -0,0 +1,121 @@
+# 팔로우 관계 캐시.
+#
+# 피드를 볼때마다 follow 테이블에서 내가 팔로우한 유저를 다시 찾지 않도록,
+# 유저별 팔로위(내가 팔로우한 유저) / 팔로워(나를 팔로우한 유저) 아이디를
+# 메모리에 들고 있는다. 처음 필요할때 DB 에서 읽고, 많이 쓰는 유저만 남긴다(LRU).
+#
+# 아이디 목록은 파이썬 int 리스트 대신 정렬된 array('i') 로 저장한다.
+# (아이디 하나에 4 바이트. 팔로우 여부는 bisect 로 찾는다.)
+# 친구추가 / 삭제를 하면 FollowResource 에서 invalidate() 를 호출한다.
+# 다른 서버 프로세스의 캐시는 TTL 이 지나야 바뀌므로, 친구추가 / 삭제를 한 유저에게는
+# read_after_follow 표시(read_after_write.followed)를 CACHE_TTL 초 동안 붙이고,
+# 표시가 있는 동안은 그 유저의 팔로위 목록을 캐시 대신 DB 에서 다시 읽는다.
+# 그 전에 캐시된 목록은 표시가 끝나기 전에 TTL 로 없어지므로, 어느 프로세스가
+# 요청을 받든 친구추가한 유저 자신에게는 바로 보인다.
+# (다른 유저가 보는 그 유저의 팔로워 목록은 TTL 이 지나야 바뀐다.)
+
+import bisect
+import threading
+from array import array
+
+from cache import LRUCache
+from config import Config
+import metrics
+from mysql_connection import get_read_connection
+import read_after_write
+
+
+FEED_ENABLED = getattr(Config, 'FOLLOW_GRAPH_FEED', True)   # 피드 쿼리에 캐시된 팔로위 목록을 쓸지
+CACHE_USERS = getattr(Config, 'FOLLOW_GRAPH_CACHE_USERS', 10000)
+CACHE_TTL = getattr(Config, 'FOLLOW_GRAPH_CACHE_TTL', 60)    # 초
+FEED_MAX_IDS = getattr(Config, 'FOLLOW_GRAPH_FEED_MAX_IDS', 1000)  # 이보다 많이 팔로우하면 피드는 조인으로
+
+FOLLOWEE_QUERY = '''select followeeId
+                    from follow
+                    where followerId = %s;'''
+FOLLOWER_QUERY = '''select followerId
+                    from follow
+                    where followeeId = %s;'''
+
+followee_cache = LRUCache(CACHE_USERS, CACHE_TTL)
+follower_cache = LRUCache(CACHE_USERS, CACHE_TTL)
+
+# DB 에서 읽는 도중에 친구추가 / 삭제가 있었으면, 읽은 값은 이미 옛날 값일수 있으므로
+# 캐시에 넣지 않는다. invalidate() 할때마다 1 씩 늘어난다.
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def _load(cache, query, user_id, connection):
+    generation = _generation
+
+    borrowed = connection is None
+    if borrowed:
+        connection = get_read_connection(user_id)
+    try:
+        cursor = connection.cursor()
+        cursor.execute(query, (user_id,))
+        ids = array('i', sorted(row[0] for row in cursor.fetchall()))
+        cursor.close()
+    finally:
+        if borrowed:
+            connection.close()
+
+    with _generation_lock:
+        if generation == _generation:
+            cache.set(user_id, ids)
+    return ids
+
+
+# 유저가 팔로우한 유저 아이디들. 정렬된 array('i')
+# connection 을 주지 않으면, 캐시에 없을때만 커넥션을 빌려온다.
+# 돌려준 array 는 캐시와 같이 쓰므로 바꾸면 안된다.
+def get_followees(user_id, connection=None):
+    if not read_after_write.followed.is_active(user_id):
+        ids = followee_cache.get(user_id)
+        if ids is not None:
+            return ids
+    return _load(followee_cache, FOLLOWEE_QUERY, user_id, connection)
+
+
+# 유저를 팔로우한 유저 아이디들. 정렬된 array('i')
+def get_followers(user_id, connection=None):
+    ids = follower_cache.get(user_id)
+    if ids is not None:
+        return ids
+    return _load(follower_cache, FOLLOWER_QUERY, user_id, connection)
+
+
+# 캐시에 있을때만 팔로위 목록, 없으면 None. DB 를 보지 않는다. (asgi.py 에서 쓴다)
+def cached_followees(user_id):
+    return followee_cache.get(user_id)
+
+
+def contains(ids, user_id):
+    i = bisect.bisect_left(ids, user_id)
+    return i < len(ids) and ids[i] == user_id
+
+
+def is_following(follower_id, followee_id, connection=None):
+    return contains(get_followees(follower_id, connection), followee_id)
+
+
+# 친구추가 / 삭제를 커밋한 후에 호출한다.
+def invalidate(follower_id, followee_id):
+    global _generation
+    with _generation_lock:
+        _generation += 1
+        followee_cache.delete(follower_id)
+        follower_cache.delete(followee_id)
+    read_after_write.followed.mark(follower_id)
+
+
+def follow_graph_stats():
+    stats = {}
+    for name, cache in (('followee', followee_cache), ('follower', follower_cache)):
+        for key, value in cache.stats().items():
+            stats[name + '_' + key] = value
+    return stats
+
+
+metrics.register_gauges('follow_graph', follow_graph_stats)
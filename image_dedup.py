@@ -0,0 +1,77 @@
+# 이미지 내용(sha256) 으로 중복 업로드를 찾는다.
+# 리포스트나 밈처럼 같은 이미지가 여러번 올라오는 경우가 많으므로,
+# 한번 처리한 이미지는 S3 파일과 리코그니션 태그를 그대로 다시 쓴다.
+#
+# 해시 -> (S3 파일명, 태그 목록, 썸네일 파일명) 은 image_hash 테이블에 저장하고,
+# 최근에 쓴 것은 메모리 캐시(크기 제한)에 둔다.
+
+import hashlib
+import json
+
+from cache import LRUCache
+from config import Config
+import metrics
+from mysql_connection import get_connection
+
+
+ENABLED = getattr(Config, 'IMAGE_DEDUP_ENABLED', True)
+CACHE_SIZE = getattr(Config, 'IMAGE_DEDUP_CACHE_SIZE', 10000)
+
+image_hash_cache = LRUCache(CACHE_SIZE)
+
+
+def new_hash():
+    return hashlib.sha256()
+
+
+# 해시로 (S3 파일명, 태그 목록, 썸네일 파일명) 을 찾는다. 처음 보는 이미지면 None.
+# 캐시에 없을때만 DB 를 본다.
+def find(digest):
+    if not ENABLED or digest is None:
+        return None
+
+    known = image_hash_cache.get(digest)
+    if known is not None:
+        return known
+
+    connection = get_connection()
+    try:
+        query = '''select fileName, labels, thumbFileName
+                    from image_hash
+                    where hash = %s;'''
+        cursor = connection.cursor()
+        cursor.execute(query, (digest,))
+        row = cursor.fetchone()
+        cursor.close()
+    finally:
+        connection.close()
+
+    if row is None:
+        return None
+    known = (row[0], json.loads(row[1]), row[2])
+    image_hash_cache.set(digest, known)
+    return known
+
+
+# 처리가 끝난 이미지를 기록한다. 커밋은 호출한 쪽에서 한다.
+# 같은 이미지가 동시에 처리되었으면 먼저 저장된 것을 그대로 둔다.
+def remember(connection, digest, file_name, labels, thumb_file_name=None):
+    if not ENABLED or digest is None:
+        return
+    query = '''insert ignore into image_hash
+                (hash, fileName, thumbFileName, labels)
+                values
+                (%s, %s, %s, %s);'''
+    cursor = connection.cursor()
+    cursor.execute(query, (digest, file_name, thumb_file_name, json.dumps(labels)))
+    inserted = cursor.rowcount > 0
+    cursor.close()
+    if inserted:
+        image_hash_cache.set(digest, (file_name, list(labels), thumb_file_name))
+
+
+def dedup_cache_stats():
+    return image_hash_cache.stats()
+
+
+metrics.register_gauges('image_dedup_cache', dedup_cache_stats)
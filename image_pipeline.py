@@ -0,0 +1,591 @@
+# 포스팅 이미지 처리 파이프라인.
+#
+# 포스팅 작성 요청에서는 posting 행을 'processing' 상태로 먼저 저장하고,
+# 파일은 로컬에 임시로 저장한 뒤 작업 큐에 넣고 바로 응답한다.
+# 백그라운드 워커가 큐에서 작업을 꺼내서
+#   1. S3 업로드
+#   2. Rekognition 으로 태그 추출
+#   3. tag_name / tag 테이블 저장, posting 상태를 'done' 으로 변경
+# 을 처리한다. 전에 처리한 적 있는 이미지(내용 해시가 같은)면 1, 2 는 건너뛴다.
+# IMAGE_THUMBNAIL_SIZE 가 있으면 1 에서 피드용 썸네일도 같이 만들어서 올린다. (Pillow 필요)
+# 실패하면 정해진 횟수만큼 다시 시도하고, 끝내 실패하면 'failed' 로 바꾼다.
+
+import io
+import json
+import os
+import queue
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from mysql.connector import Error
+
+from app_logging import get_logger
+from aws_clients import get_rekognition_client, get_s3_client, get_transfer_config
+from config import Config
+import image_dedup
+import metrics
+from mysql_connection import get_connection
+import posting_cache
+import tag_names
+import timeline
+
+
+ASYNC = getattr(Config, 'IMAGE_PIPELINE_ASYNC', True)            # False 면 요청 안에서 바로 처리
+QUEUE_BACKEND = getattr(Config, 'IMAGE_QUEUE_BACKEND', 'memory')  # 'memory' 또는 'sqlite'
+QUEUE_PATH = getattr(Config, 'IMAGE_QUEUE_PATH', 'image_jobs.sqlite3')
+WORKERS = getattr(Config, 'IMAGE_WORKERS', 4)
+MAX_ATTEMPTS = getattr(Config, 'IMAGE_JOB_MAX_ATTEMPTS', 3)
+RETRY_DELAY = getattr(Config, 'IMAGE_JOB_RETRY_DELAY', 1.0)      # 재시도 간격(초). 시도할때마다 2배
+JOB_LEASE = getattr(Config, 'IMAGE_JOB_LEASE', 300)    # sqlite 큐에서 가져간 작업을 다른 프로세스가 다시 가져가기까지의 시간(초)
+SPOOL_CHUNK_SIZE = getattr(Config, 'IMAGE_SPOOL_CHUNK_SIZE', 64 * 1024)
+SPOOL_DIR = getattr(Config, 'IMAGE_SPOOL_DIR',
+                    os.path.join(tempfile.gettempdir(), 'posting-server-uploads'))
+MAX_UPLOAD_SIZE = getattr(Config, 'MAX_CONTENT_LENGTH', 10 * 1024 * 1024)  # 바이트
+THUMBNAIL_SIZE = getattr(Config, 'IMAGE_THUMBNAIL_SIZE', None)   # 긴 변의 픽셀 수. None 이면 만들지 않는다
+THUMBNAIL_QUALITY = getattr(Config, 'IMAGE_THUMBNAIL_QUALITY', 85)
+THUMBNAIL_PREFIX = 'thumb/'
+# 썸네일을 만들 원본의 최대 픽셀 수. 업로드 크기 제한에 맞춘다.
+# (압축이 잘 된 JPEG 도 1 바이트에 몇 픽셀 이상은 잘 나오지 않는다)
+MAX_IMAGE_PIXELS = getattr(Config, 'IMAGE_MAX_PIXELS', MAX_UPLOAD_SIZE * 5)
+
+if Image is not None:
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+# 받는 이미지 형식. 파일 앞부분(매직 바이트)으로 구분한다.
+#   (매직 바이트, ContentType, 확장자)
+IMAGE_TYPES = [(b'\xff\xd8\xff', 'image/jpeg', '.jpg'),
+               (b'\x89PNG\r\n\x1a\n', 'image/png', '.png')]
+
+logger = get_logger(__name__)
+
+STATUS_PROCESSING = 'processing'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+class UploadRejected(Exception):
+    '''받을수 없는 업로드 파일. status 는 응답할 HTTP 상태 코드.'''
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class MemoryJobQueue:
+    '''프로세스 안에서만 쓰는 큐. 서버가 꺼지면 남은 작업은 사라진다.'''
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def put(self, job):
+        self._queue.put(job)
+
+    def get(self, timeout=None):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def renew(self, job):
+        pass
+
+    def done(self, job):
+        pass
+
+    def failed(self, job):
+        pass
+
+
+class SQLiteJobQueue:
+    '''SQLite 파일에 작업을 저장하는 큐. 서버가 재시작해도 작업이 남아있다.
+    여러 프로세스가 같은 파일을 같이 쓴다. 가져간 작업에는 가져간 프로세스(owner)와
+    lease 만료 시간을 적고, 처리하는 동안 renew() 로 늘린다.
+    lease 가 지난 작업(처리 도중 프로세스가 죽은 작업)만 다른 프로세스가 다시 가져간다.'''
+
+    def __init__(self, path, lease=JOB_LEASE):
+        self.path = path
+        self.lease = lease
+        self.owner = socket.gethostname() + ':' + str(os.getpid())
+        self._lock = threading.Lock()
+        connection = self._connect()
+        connection.execute('''create table if not exists image_job
+                            (id integer primary key autoincrement,
+                             payload text not null,
+                             status text not null default 'queued',
+                             owner text,
+                             leaseUntil real)''')
+        # 예전 버전에서 만든 파일에는 owner, leaseUntil 이 없다.
+        columns = [row[1] for row in connection.execute('pragma table_info(image_job)')]
+        if 'owner' not in columns:
+            connection.execute('alter table image_job add column owner text')
+        if 'leaseUntil' not in columns:
+            connection.execute('alter table image_job add column leaseUntil real')
+        connection.commit()
+        connection.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def put(self, job):
+        connection = self._connect()
+        connection.execute('insert into image_job (payload) values (?)',
+                           (json.dumps(job),))
+        connection.commit()
+        connection.close()
+
+    def get(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                connection = self._connect()
+                connection.isolation_level = None
+                connection.execute('begin immediate')
+                now = time.time()
+                row = connection.execute('''select id, payload from image_job
+                                          where status = 'queued'
+                                          or (status = 'running' and
+                                              (leaseUntil is null or leaseUntil < ?))
+                                          order by id limit 1''', (now,)).fetchone()
+                if row is not None:
+                    connection.execute('''update image_job
+                                        set status = 'running', owner = ?, leaseUntil = ?
+                                        where id = ?''',
+                                       (self.owner, now + self.lease, row[0]))
+                connection.execute('commit')
+                connection.close()
+
+            if row is not None:
+                job = json.loads(row[1])
+                job['queue_id'] = row[0]
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(0.2)
+
+    # 처리중인 작업의 lease 를 늘린다. (재시도 할때마다 호출)
+    def renew(self, job):
+        connection = self._connect()
+        connection.execute('''update image_job set leaseUntil = ?
+                            where id = ? and owner = ?''',
+                           (time.time() + self.lease, job['queue_id'], self.owner))
+        connection.commit()
+        connection.close()
+
+    def done(self, job):
+        connection = self._connect()
+        connection.execute('delete from image_job where id = ?', (job['queue_id'],))
+        connection.commit()
+        connection.close()
+
+    def failed(self, job):
+        connection = self._connect()
+        connection.execute('''update image_job set status = 'failed'
+                            where id = ?''', (job['queue_id'],))
+        connection.commit()
+        connection.close()
+
+
+def detect_labels(photo, bucket):
+
+    client = get_rekognition_client()
+
+    response = client.detect_labels(Image={'S3Object':{'Bucket':bucket,'Name':photo}},
+    MaxLabels=5,
+    # Uncomment to use image properties and filtration settings
+    #Features=["GENERAL_LABELS", "IMAGE_PROPERTIES"],
+    #Settings={"GeneralLabels": {"LabelInclusionFilters":["Cat"]},
+    # "ImageProperties": {"MaxDominantColors":10}}
+    )
+
+    logger.debug('detected labels', extra={'photo' : photo, 'labels' : response['Labels']})
+
+    label_list = []
+    for label in response['Labels']:
+        if label['Confidence'] >= 90: #Confidence 가 90 이상인것만 출력하도록 .
+            label_list.append(label['Name'])
+
+
+    return label_list
+
+
+# 리코그니션으로 받아온 태그들을 tag_name, tag 테이블에 저장한다.
+# 태그 갯수와 상관없이 쿼리 몇번으로 처리한다.
+#   1. 이미 있는 태그 이름은 캐시나 IN (...) 한번으로 아이디를 가져오고
+#   2. 없는 이름은 여러행 upsert 한번으로 넣고 다시 아이디를 가져온다
+#   3. tag 테이블은 executemany 로 한번에 넣는다
+# 커밋은 호출한 쪽에서 한다. 붙인 tag_name 아이디 목록을 리턴한다. (count_tags 에 넘긴다)
+def save_tags(connection, posting_id, tag_list):
+
+    # 소문자로 바꾸고, 중복은 뺀다. (순서는 유지)
+    names = []
+    for tag in tag_list :
+        tag = tag.lower()
+        if tag not in names :
+            names.append(tag)
+    if len(names) == 0 :
+        return []
+
+    cursor = connection.cursor()
+    tag_name_ids = tag_names.get_tag_name_ids(cursor, names)
+
+    # 두 작업이 같은 새 태그들을 반대 순서로 넣으면 tag_name(name) 유니크 인덱스에서
+    # 서로 기다리는 데드락이 날수 있으므로, 이름 순서로 넣는다.
+    missing = sorted(name for name in names if name not in tag_name_ids)
+    if len(missing) != 0 :
+        # 다른 요청이 같은 새 태그를 동시에 넣어도 에러가 나지 않도록
+        # tag_name(name) 유니크 인덱스에 걸리면 아무것도 하지 않는다.
+        query = '''insert into tag_name
+                (name)
+                values ''' + ', '.join(['(%s)'] * len(missing)) + '''
+                on duplicate key update id = id;'''
+        cursor.execute(query, tuple(missing))
+
+        # 다른 트랜잭션이 방금 커밋한 행도 보이도록 잠금 읽기를 한다.
+        tag_name_ids.update(tag_names.select_tag_name_ids(cursor, missing, locking=True))
+
+    query = '''insert into tag
+            (postingId, tagNameId)
+            values
+            (%s, %s);'''
+    # tag 도 같은 이유로 아이디 순서로 넣는다.
+    record_list = sorted((posting_id, tag_name_ids[name]) for name in names)
+    cursor.executemany(query, record_list)
+    cursor.close()
+    return [tag_name_ids[name] for name in names]
+
+
+# 태그별 포스팅 수(tag_name.postingCnt)와, 인기 태그용 날짜별 수(tag_day_count 의
+# 포스팅 작성일 칸)를 늘린다.
+# 인기 태그는 여러 포스팅이 같이 쓰는 행이므로, 포스팅 저장 트랜잭션 안에서 잠그지 않고
+# 커밋한 후에 짧은 트랜잭션으로 따로 늘린다. (아이디 순서로 잠가서 데드락을 피한다)
+# 통계용 값이므로 실패해도 작업을 다시 하지 않고 로그만 남긴다.
+def count_tags(posting_id, tag_name_ids):
+    if len(tag_name_ids) == 0 :
+        return
+    ids = sorted(tag_name_ids)
+    in_clause = ', '.join(['%s'] * len(ids))
+    count_query = '''update tag_name
+            set postingCnt = postingCnt + 1
+            where id in (''' + in_clause + ''');'''
+    day_query = '''insert into tag_day_count
+            (day, tagNameId, postingCnt)
+            select date(p.createdAt), tn.id, 1
+            from posting p
+            join tag_name tn
+            on tn.id in (''' + in_clause + ''')
+            where p.id = %s
+            order by tn.id
+            on duplicate key update postingCnt = tag_day_count.postingCnt + 1;'''
+    try:
+        # 실패하면 커밋하지 않은 채로 반납되고, 풀에서 롤백한다.
+        with get_connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(count_query, tuple(ids))
+            cursor.execute(day_query, tuple(ids) + (posting_id,))
+            cursor.close()
+            connection.commit()
+    except Error as e:
+        logger.warning('tag count failed : %s', e, extra={'tag_name_ids' : ids})
+
+
+# 아직 처리중('processing')인 포스팅만 바꾼다. (다른 워커가 이미 끝낸 포스팅은 그대로)
+def set_status(posting_id, status):
+    connection = get_connection()
+    try:
+        query = '''update posting
+                    set status = %s
+                    where id = %s and status = %s;'''
+        cursor = connection.cursor()
+        cursor.execute(query, (status, posting_id, STATUS_PROCESSING))
+        connection.commit()
+        cursor.close()
+        posting_cache.invalidate(posting_id)
+    finally:
+        connection.close()
+
+
+# 썸네일 파일명. 원본 형식과 상관없이 JPEG 으로 만든다.
+def thumbnail_name(file_name):
+    return THUMBNAIL_PREFIX + os.path.splitext(file_name)[0] + '.jpg'
+
+
+# 원본의 긴 변을 THUMBNAIL_SIZE 로 줄인 JPEG 을 만든다.
+# 설정이 없거나, Pillow 가 없거나, 원본이 이미 작으면 None.
+# 읽을수 없는 이미지면 Pillow 의 예외가 그대로 올라간다.
+def make_thumbnail(file_path):
+    if THUMBNAIL_SIZE is None :
+        return None
+    if Image is None :
+        logger.warning('IMAGE_THUMBNAIL_SIZE is set but Pillow is not installed')
+        return None
+
+    with Image.open(file_path) as image :
+        if max(image.size) <= THUMBNAIL_SIZE :
+            return None
+        if image.size[0] * image.size[1] > MAX_IMAGE_PIXELS :
+            raise Image.DecompressionBombError('image is too large : ' + str(image.size))
+        # draft 는 JPEG 을 읽을때부터 작게 디코딩해서 메모리와 시간을 줄인다.
+        image.draft('RGB', (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        if image.mode not in ('RGB', 'L') :
+            image = image.convert('RGB')
+        out = io.BytesIO()
+        image.save(out, 'JPEG', quality = THUMBNAIL_QUALITY, optimize = True)
+    out.seek(0)
+    return out
+
+
+# 원본과 (있으면) 썸네일을 S3 에 올린다. 썸네일 파일명을 돌려준다.
+def upload_image(job):
+    s3 = get_s3_client()
+    transfer_config = get_transfer_config()
+
+    with open(job['file_path'], 'rb') as file, metrics.timed('s3', 'upload_fileobj'):
+        s3.upload_fileobj(file,
+                          Config.S3_BUCKET,
+                          job['file_name'],
+                          ExtraArgs = {'ACL' : 'public-read' ,
+                                       'ContentType' : job.get('content_type', 'image/jpeg')},
+                          Config = transfer_config)
+
+    # 썸네일은 없어도 되므로, 만들지 못해도 작업은 실패시키지 않는다.
+    # (매직 바이트만 맞고 깨진 파일, 너무 큰 이미지, 지원하지 않는 모드 ...)
+    try :
+        thumbnail = make_thumbnail(job['file_path'])
+    except (OSError, Image.DecompressionBombError, ValueError) as e :
+        logger.warning('thumbnail failed : %s', e, extra={'posting_id' : job['posting_id']})
+        thumbnail = None
+    if thumbnail is None :
+        return None
+
+    thumb_file_name = thumbnail_name(job['file_name'])
+    with metrics.timed('s3', 'upload_fileobj'):
+        s3.upload_fileobj(thumbnail,
+                          Config.S3_BUCKET,
+                          thumb_file_name,
+                          ExtraArgs = {'ACL' : 'public-read' ,
+                                       'ContentType' : 'image/jpeg'},
+                          Config = transfer_config)
+    return thumb_file_name
+
+
+# 포스팅이 아직 처리중이면 True. (삭제되었거나 다른 워커가 이미 처리했으면 False)
+def is_processing(posting_id):
+    connection = get_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('''select status
+                        from posting
+                        where id = %s;''', (posting_id,))
+        row = cursor.fetchone()
+        cursor.close()
+    finally:
+        connection.close()
+    return row is not None and row[0] == STATUS_PROCESSING
+
+
+# 작업 하나를 처리한다. 실패하면 예외를 그대로 올린다.
+# 같은 작업이 두번 처리되어도(큐에서 다시 가져간 경우) 포스팅은 한번만 처리된다.
+def process_job(job):
+    if not is_processing(job['posting_id']):
+        logger.info('image job skipped', extra={'posting_id' : job['posting_id']})
+        return
+
+    digest = job.get('digest')
+
+    # 같은 이미지가 이미 S3 에 있으면 (포스팅 작성때 그 파일명을 받아왔으면)
+    # 업로드와 리코그니션 없이 저장된 태그를 쓴다.
+    known = image_dedup.find(digest)
+    reused = known is not None and known[0] == job['file_name']
+    if reused:
+        tag_list = known[1]
+        thumb_file_name = known[2]
+    else:
+        thumb_file_name = upload_image(job)
+
+        with metrics.timed('rekognition', 'detect_labels'):
+            tag_list = detect_labels(job['file_name'], Config.S3_BUCKET)
+    logger.debug('tags', extra={'posting_id' : job['posting_id'], 'tags' : tag_list,
+                                'reused' : reused})
+
+    thumb_url = None
+    if thumb_file_name is not None :
+        thumb_url = Config.S3_LOCATION + thumb_file_name
+
+    # tag_name, tag 테이블 저장과 상태 변경은 한 트랜잭션으로 처리한다.
+    # 상태를 먼저 바꿔서 posting 행을 잠근다. 같은 포스팅을 처리하는 다른 워커는
+    # 여기서 기다렸다가, 앞의 커밋 후에는 바뀐 행이 없으므로 아무것도 하지 않는다.
+    connection = get_connection()
+    try:
+        query = '''update posting
+                    set status = %s, thumbUrl = %s
+                    where id = %s and status = %s;'''
+        cursor = connection.cursor()
+        cursor.execute(query, (STATUS_DONE, thumb_url, job['posting_id'], STATUS_PROCESSING))
+        changed = cursor.rowcount > 0
+        cursor.close()
+        if not changed:
+            connection.rollback()
+            logger.info('image job skipped', extra={'posting_id' : job['posting_id']})
+            return
+
+        tag_name_ids = save_tags(connection, job['posting_id'], tag_list)
+        if not reused:
+            image_dedup.remember(connection, digest, job['file_name'], tag_list, thumb_file_name)
+
+        # 처리가 끝난 포스팅만 팔로워들의 타임라인에 넣는다.
+        timeline.on_posting_created(connection, job['user_id'], job['posting_id'])
+        connection.commit()
+        posting_cache.invalidate(job['posting_id'])
+    finally:
+        connection.close()
+
+    count_tags(job['posting_id'], tag_name_ids)
+
+
+# 재시도를 포함해서 작업을 처리한다.
+# 성공하면 True, 끝내 실패하면 posting 을 'failed' 로 바꾸고 False.
+def run_job(job):
+    delay = RETRY_DELAY
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        if 'queue_id' in job:
+            job_queue.renew(job)
+        try:
+            process_job(job)
+            _remove_spool_file(job)
+            return True
+        except Exception as e:
+            logger.warning('image job failed : %s', e,
+                           extra={'posting_id' : job['posting_id'], 'attempt' : attempt})
+            if attempt < MAX_ATTEMPTS:
+                time.sleep(delay)
+                delay = delay * 2
+
+    logger.error('image job gave up', extra={'posting_id' : job['posting_id']})
+    try:
+        set_status(job['posting_id'], STATUS_FAILED)
+    except Exception as e:
+        logger.error(str(e))
+    _remove_spool_file(job)
+    return False
+
+
+def _remove_spool_file(job):
+    try:
+        os.remove(job['file_path'])
+    except OSError:
+        pass
+
+
+# 업로드된 파일을 로컬에 임시로 저장한다.
+# 요청이 끝나면 FileStorage 는 사라지므로, 워커가 읽을수 있게 복사해 둔다.
+# 조금씩 읽어서 쓰므로 파일 전체를 메모리에 올리지 않는다.
+#   - 첫 조각의 매직 바이트로 JPEG / PNG 인지 확인하고 (아니면 400)
+#   - MAX_UPLOAD_SIZE 를 넘으면 그만 읽는다 (413)
+#   - 복사하면서 내용의 해시도 같이 계산한다
+# (경로, 해시, ContentType) 을 돌려준다.
+def spool_file(file):
+    first = file.stream.read(SPOOL_CHUNK_SIZE)
+    image_type = None
+    for magic, content_type, extension in IMAGE_TYPES :
+        if first.startswith(magic) :
+            image_type = (content_type, extension)
+            break
+    if image_type is None :
+        raise UploadRejected('JPEG 또는 PNG 이미지만 올릴수 있습니다.', 400)
+
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=SPOOL_DIR, suffix=image_type[1])
+    digest = image_dedup.new_hash()
+    size = 0
+    try :
+        with os.fdopen(fd, 'wb') as out:
+            chunk = first
+            while chunk:
+                size = size + len(chunk)
+                if size > MAX_UPLOAD_SIZE :
+                    raise UploadRejected('파일이 너무 큽니다. 최대 ' +
+                                         str(MAX_UPLOAD_SIZE // (1024 * 1024)) + 'MB 입니다.', 413)
+                digest.update(chunk)
+                out.write(chunk)
+                chunk = file.stream.read(SPOOL_CHUNK_SIZE)
+    except BaseException :
+        os.remove(path)
+        raise
+    return path, digest.hexdigest(), image_type[0]
+
+
+# ContentType 에 맞는 확장자
+def extension_for(content_type):
+    for magic, image_content_type, extension in IMAGE_TYPES :
+        if image_content_type == content_type :
+            return extension
+    return '.jpg'
+
+
+if QUEUE_BACKEND == 'sqlite':
+    job_queue = SQLiteJobQueue(QUEUE_PATH)
+else:
+    job_queue = MemoryJobQueue()
+
+_workers = []
+_workers_lock = threading.Lock()
+_stop = threading.Event()
+
+
+def _worker_loop():
+    while not _stop.is_set():
+        job = job_queue.get(timeout=1)
+        if job is None:
+            continue
+        if run_job(job):
+            job_queue.done(job)
+        else:
+            job_queue.failed(job)
+
+
+# 워커 스레드들을 시작한다. 여러번 호출해도 한번만 시작한다.
+def start_workers(count=WORKERS):
+    with _workers_lock:
+        if len(_workers) != 0:
+            return
+        _stop.clear()
+        for i in range(count):
+            worker = threading.Thread(target=_worker_loop,
+                                      name='image-worker-' + str(i),
+                                      daemon=True)
+            worker.start()
+            _workers.append(worker)
+
+
+def stop_workers(timeout=None):
+    with _workers_lock:
+        _stop.set()
+        for worker in _workers:
+            worker.join(timeout)
+        _workers.clear()
+
+
+# 포스팅 작성 요청에서 호출한다.
+# 비동기 모드면 큐에 넣고 바로 리턴하고, 아니면 여기서 처리까지 한다.
+def submit(posting_id, user_id, file_path, file_name, digest=None, content_type='image/jpeg'):
+    job = {'posting_id' : posting_id,
+           'user_id' : user_id,
+           'file_path' : file_path,
+           'file_name' : file_name,
+           'digest' : digest,
+           'content_type' : content_type}
+    if not ASYNC:
+        run_job(job)
+        return
+    start_workers()
+    job_queue.put(job)
@@ -0,0 +1,112 @@
+# 주기적으로 실행하는 관리용 작업들.
+# 크론 등에서  python jobs.py <작업이름>  으로 실행한다.
+
+import sys
+import time
+
+from mysql_connection import get_connection
+from resources.tag import POPULAR_DAYS
+import timeline
+from token_blocklist import purge_expired_tokens
+
+
+# posting.likeCnt 를 likes 테이블 기준으로 다시 계산하는 함수.
+# 좋아요 수가 실제 likes 행 수와 어긋났을때 맞춰준다.
+# 값이 바뀐 포스팅 수를 리턴한다.
+def reconcile_like_counts():
+    connection = get_connection()
+    try:
+        query = '''update posting p
+                    left join (select postingId, count(*) as cnt
+                               from likes
+                               group by postingId) l
+                    on p.id = l.postingId
+                    set p.likeCnt = ifnull(l.cnt, 0)
+                    where p.likeCnt <> ifnull(l.cnt, 0);'''
+        cursor = connection.cursor()
+        cursor.execute(query)
+        changed = cursor.rowcount
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+    return changed
+
+
+# tag_name.postingCnt 와 인기 태그용 tag_day_count 를 tag 테이블 기준으로 다시 계산하는 함수.
+# image_pipeline.count_tags 는 포스팅 저장후 따로 실행되고 실패해도 다시 하지 않으므로,
+# 어긋난 수를 여기서 맞춘다. postingCnt 가 바뀐 태그 수를 리턴한다.
+def reconcile_tag_counts():
+    connection = get_connection()
+    try:
+        cursor = connection.cursor()
+        query = '''update tag_name tn
+                    left join (select tagNameId, count(*) as cnt
+                               from tag
+                               group by tagNameId) t
+                    on tn.id = t.tagNameId
+                    set tn.postingCnt = ifnull(t.cnt, 0)
+                    where tn.postingCnt <> ifnull(t.cnt, 0);'''
+        cursor.execute(query)
+        changed = cursor.rowcount
+
+        # 날짜별 수는 인기 태그가 보는 기간만 다시 센다.
+        query = '''delete from tag_day_count
+                    where day >= current_date - interval %s day;'''
+        cursor.execute(query, (POPULAR_DAYS,))
+        query = '''insert into tag_day_count
+                    (day, tagNameId, postingCnt)
+                    select date(p.createdAt), t.tagNameId, count(*)
+                    from posting p
+                    join tag t
+                    on p.id = t.postingId
+                    where p.createdAt >= current_date - interval %s day
+                    group by date(p.createdAt), t.tagNameId;'''
+        cursor.execute(query, (POPULAR_DAYS,))
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+    return changed
+
+
+# like_buffer 의 like_version 중 오래된 행을 지운다. 하루가 지난 값보다 옛날 값이
+# 새로 저장될 일은 없으므로 비교할 필요가 없다. 지운 행 수를 리턴한다.
+def prune_like_versions():
+    connection = get_connection()
+    try:
+        query = '''delete from like_version
+                    where changedAt < %s;'''
+        cursor = connection.cursor()
+        cursor.execute(query, (int((time.time() - 24 * 60 * 60) * 1000000),))
+        deleted = cursor.rowcount
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+    return deleted
+
+
+# 셀럽이 된 작성자의 포스팅을 팔로워 타임라인에서 지운다.
+def prune_celebrity_timelines():
+    connection = get_connection()
+    try:
+        return timeline.prune_celebrity_timelines(connection)
+    finally:
+        connection.close()
+
+
+JOBS = {
+    'reconcile_like_counts' : reconcile_like_counts,
+    'reconcile_tag_counts' : reconcile_tag_counts,
+    'prune_like_versions' : prune_like_versions,
+    'purge_expired_tokens' : purge_expired_tokens,
+    'prune_celebrity_timelines' : prune_celebrity_timelines,
+}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2 or sys.argv[1] not in JOBS:
+        print('사용법: python jobs.py [' + ' | '.join(JOBS) + ']')
+        sys.exit(1)
+    print(sys.argv[1], JOBS[sys.argv[1]]())
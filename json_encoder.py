@@ -0,0 +1,50 @@
+# API 응답용 JSON 인코더.
+#
+# orjson 이 설치되어 있으면 orjson 을 쓰고, 없으면 표준 json 을 쓴다.
+# 둘다 datetime 을 바로 ISO 문자열로 바꾸므로, 리소스에서 행마다
+# isoformat() 을 해줄 필요가 없다.
+
+import json
+from datetime import date, datetime
+
+from flask import make_response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(type(obj).__name__ + ' 은 JSON 으로 바꿀수 없습니다.')
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, default=_default,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def _orjson_dumps(obj):
+    return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+# 객체를 JSON bytes 로 바꾼다.
+if orjson is not None:
+    dumps_bytes = _orjson_dumps
+else:
+    dumps_bytes = _stdlib_dumps
+
+
+def dumps(obj):
+    return dumps_bytes(obj).decode('utf-8')
+
+
+# flask_restful 의 application/json 응답 함수.
+#   api.representation('application/json')(output_json)
+def output_json(data, code, headers=None):
+    response = make_response(dumps_bytes(data), code)
+    response.headers.extend(headers or {})
+    response.headers['Content-Type'] = 'application/json'
+    return response
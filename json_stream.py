@@ -0,0 +1,59 @@
+# 큰 피드 응답을 한번에 메모리에 만들지 않고,
+# DB 커서에서 조금씩(fetchmany) 읽으면서 JSON 으로 바로 내보낸다.
+# 페이지 크기와 상관없이 요청 하나가 쓰는 메모리는 CHUNK_SIZE 행 정도로 제한된다.
+
+from config import Config
+from json_encoder import dumps
+from utils import encode_cursor
+
+
+CHUNK_SIZE = getattr(Config, 'STREAM_CHUNK_SIZE', 100)
+
+FORMATS = {'json' : 'application/json',
+           'ndjson' : 'application/x-ndjson'}
+
+
+# 커서의 결과를 JSON 조각으로 만들어 내보내는 제너레이터.
+# 다 보내거나 클라이언트가 끊으면 커서와 커넥션을 닫는다.
+#   json   : {"result ":"success","items":[...],"count ":n,"next_cursor":...}
+#   ndjson : 한줄에 포스팅 하나, 마지막 줄에 {"count ":n,"next_cursor":...}
+def stream_feed(connection, cursor, limit, fmt='json', chunk_size=CHUNK_SIZE):
+    try:
+        if fmt == 'json':
+            yield '{"result ":"success","items":['
+        count = 0
+        last = None
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if len(rows) == 0:
+                break
+            parts = []
+            for row in rows:
+                if fmt == 'json':
+                    parts.append((',' if count != 0 else '') + dumps(row))
+                else:
+                    parts.append(dumps(row) + '\n')
+                count += 1
+            last = rows[-1]
+            yield ''.join(parts)
+
+        # 다음 페이지 커서. 마지막 페이지면 None
+        next_cursor = None
+        if count == limit and last is not None:
+            next_cursor = encode_cursor(last['createdAt'], last['postId'])
+
+        if fmt == 'json':
+            yield '],"count ":' + str(count) + ',"next_cursor":' + dumps(next_cursor) + '}'
+        else:
+            yield dumps({'count ' : count, 'next_cursor' : next_cursor}) + '\n'
+    finally:
+        # 커서를 닫다가 에러가 나도 커넥션은 꼭 풀에 반납한다.
+        try:
+            try:
+                # 클라이언트가 중간에 끊으면 아직 읽지 않은 행이 남아있다.
+                # 먼저 버리지 않으면 cursor.close() 가 "Unread result found" 에러를 낸다.
+                connection.consume_results()
+            finally:
+                cursor.close()
+        finally:
+            connection.close()
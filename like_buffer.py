@@ -0,0 +1,169 @@
+# 좋아요 쓰기 모아서 처리하기 (write-behind).
+#
+# 인기 포스팅에 좋아요 / 좋아요 취소가 몰리면, 요청마다 커밋하는 대신
+# (유저, 포스팅) 별 마지막 상태만 메모리에 모아두었다가
+# FLUSH_INTERVAL 마다 여러행 쿼리 몇개로 한번에 저장한다.
+# 같은 유저가 눌렀다 취소했다를 반복해도 마지막 상태 하나만 저장된다.
+#
+# config.py 의 LIKE_WRITE_BEHIND 가 True 일때만 사용한다.
+# 저장되기 전까지(최대 FLUSH_INTERVAL 초) 는 좋아요 수와 isLike 에 반영되지 않는다.
+#
+# 버퍼는 서버 프로세스마다 따로 있으므로, 워커 A 에서 누른 좋아요보다 워커 B 에서 누른
+# 취소가 먼저 저장될수 있다. 그래서 submit 할때의 시각을 같이 넣고, 저장할때
+# like_version 테이블의 마지막 시각보다 옛날 값이면 버린다.
+# (서버가 여러대면 서버 시계가 맞춰져 있어야 한다)
+
+import atexit
+import threading
+import time
+
+from app_logging import get_logger
+from config import Config
+from mysql_connection import get_connection
+import posting_cache
+
+
+ENABLED = getattr(Config, 'LIKE_WRITE_BEHIND', False)
+FLUSH_INTERVAL = getattr(Config, 'LIKE_FLUSH_INTERVAL', 0.2)   # 초
+MAX_BATCH = getattr(Config, 'LIKE_FLUSH_MAX_BATCH', 1000)
+
+logger = get_logger(__name__)
+
+_pending = {}
+_lock = threading.Lock()
+_flush_thread = None
+_stop = threading.Event()
+
+
+# 좋아요(liked=True) 또는 좋아요 취소(liked=False) 를 버퍼에 넣는다.
+def submit(user_id, posting_id, liked):
+    _start_flush_thread()
+    changed_at = int(time.time() * 1000000)
+    with _lock:
+        _pending[(user_id, posting_id)] = (liked, changed_at)
+
+
+def _in_clause(count, placeholder):
+    return ', '.join([placeholder] * count)
+
+
+# 모아둔 좋아요를 한 트랜잭션으로 저장한다. 저장한 (유저, 포스팅) 수를 리턴한다.
+def flush():
+    with _lock:
+        if len(_pending) == 0:
+            return 0
+        keys = list(_pending)[:MAX_BATCH]
+        batch = {key : _pending.pop(key) for key in keys}
+
+    try:
+        _apply(batch)
+    except Exception as e:
+        logger.error('like flush failed : %s', e, extra={'batch_size' : len(batch)})
+        # 그 사이에 새로 들어온 값이 없으면 다시 넣어서, 다음 flush 때 다시 시도한다.
+        with _lock:
+            for key, value in batch.items():
+                _pending.setdefault(key, value)
+        return 0
+    return len(batch)
+
+
+def _apply(batch):
+    # 여러 프로세스가 같은 행을 잠그므로 항상 같은 순서로 잠근다.
+    keys = sorted(batch)
+    connection = get_connection()
+    try:
+        cursor = connection.cursor()
+
+        # 1. 다른 프로세스가 더 나중에 눌린 값을 이미 저장했으면, 그 (유저, 포스팅)은 버린다.
+        query = '''select userId, postingId, changedAt
+                    from like_version
+                    where (userId, postingId) in (''' + _in_clause(len(keys), '(%s, %s)') + ''')
+                    for update;'''
+        cursor.execute(query, tuple(value for key in keys for value in key))
+        saved = {(row[0], row[1]) : row[2] for row in cursor.fetchall()}
+        keys = [key for key in keys if batch[key][1] > saved.get(key, -1)]
+        if len(keys) == 0:
+            connection.rollback()
+            cursor.close()
+            return
+
+        query = '''insert into like_version
+                    (userId, postingId, changedAt)
+                    values ''' + _in_clause(len(keys), '(%s, %s, %s)') + '''
+                    on duplicate key update changedAt = values(changedAt);'''
+        cursor.execute(query, tuple(value for key in keys for value in (key[0], key[1], batch[key][1])))
+
+        # 2. 지금 DB 에 있는 좋아요를 한번에 읽어서, 실제로 바뀌는 것만 고른다.
+        query = '''select userId, postingId
+                    from likes
+                    where (userId, postingId) in (''' + _in_clause(len(keys), '(%s, %s)') + ''')
+                    for update;'''
+        cursor.execute(query, tuple(value for key in keys for value in key))
+        existing = set((row[0], row[1]) for row in cursor.fetchall())
+
+        to_insert = [key for key in keys if batch[key][0] and key not in existing]
+        to_delete = [key for key in keys if not batch[key][0] and key in existing]
+
+        deltas = {}
+        for user_id, posting_id in to_insert:
+            deltas[posting_id] = deltas.get(posting_id, 0) + 1
+        for user_id, posting_id in to_delete:
+            deltas[posting_id] = deltas.get(posting_id, 0) - 1
+
+        # 3. 여러행 insert / delete 한번씩
+        if len(to_insert) != 0:
+            query = '''insert ignore into likes
+                        (userId, postingId)
+                        values ''' + _in_clause(len(to_insert), '(%s, %s)') + ''';'''
+            cursor.execute(query, tuple(value for key in to_insert for value in key))
+        if len(to_delete) != 0:
+            query = '''delete from likes
+                        where (userId, postingId) in (''' + _in_clause(len(to_delete), '(%s, %s)') + ''');'''
+            cursor.execute(query, tuple(value for key in to_delete for value in key))
+
+        # 4. 포스팅별 좋아요 수도 한번에 바꾼다.
+        deltas = {posting_id : delta for posting_id, delta in deltas.items() if delta != 0}
+        if len(deltas) != 0:
+            posting_ids = list(deltas)
+            query = '''update posting
+                        set likeCnt = greatest(likeCnt + case id ''' + \
+                    ' '.join(['when %s then %s'] * len(posting_ids)) + ''' end, 0)
+                        where id in (''' + _in_clause(len(posting_ids), '%s') + ''');'''
+            record = [value for posting_id in posting_ids for value in (posting_id, deltas[posting_id])]
+            cursor.execute(query, tuple(record + posting_ids))
+
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+
+    for posting_id in set(key[1] for key in keys):
+        posting_cache.invalidate(posting_id)
+
+
+def _flush_loop():
+    while True:
+        _stop.wait(FLUSH_INTERVAL)
+        while flush() >= MAX_BATCH:
+            pass
+        if _stop.is_set():
+            return
+
+
+
+def _start_flush_thread():
+    global _flush_thread
+    if _flush_thread is not None:
+        return
+    with _lock:
+        if _flush_thread is None:
+            _flush_thread = threading.Thread(target=_flush_loop, name='like-flush', daemon=True)
+            _flush_thread.start()
+
+
+# 서버가 꺼질때 남은 좋아요를 저장한다.
+@atexit.register
+def _flush_on_exit():
+    _stop.set()
+    while flush() != 0:
+        pass
@@ -0,0 +1,77 @@
+# 로그인 실패 횟수 제한.
+#
+# 이메일별, IP별로 일정 시간(WINDOW) 동안의 실패 횟수를 세고,
+# 너무 많이 틀리면 비밀번호 확인(PBKDF2)을 하기 전에 바로 거절한다.
+# 저장하는 키 수는 MAX_KEYS 로 제한해서, 무작위 이메일로 공격해도
+# 메모리가 계속 늘어나지 않는다.
+
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+
+
+MAX_FAILURES_PER_EMAIL = getattr(Config, 'LOGIN_MAX_FAILURES_PER_EMAIL', 5)
+MAX_FAILURES_PER_IP = getattr(Config, 'LOGIN_MAX_FAILURES_PER_IP', 30)
+WINDOW = getattr(Config, 'LOGIN_FAILURE_WINDOW', 300)       # 초
+MAX_KEYS = getattr(Config, 'LOGIN_LIMITER_MAX_KEYS', 100000)
+
+
+class FailureCounter:
+    '''키별 실패 횟수. (횟수, 처음 실패한 시간) 을 오래된 순으로 가지고 있는다.'''
+
+    def __init__(self, limit, window, max_keys):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _current(self, key, now):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if now - item[1] >= self.window:
+            del self._data[key]
+            return None
+        return item
+
+    def is_blocked(self, key):
+        with self._lock:
+            item = self._current(key, time.monotonic())
+            return item is not None and item[0] >= self.limit
+
+    def add_failure(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._current(key, now)
+            if item is None:
+                self._data[key] = (1, now)
+            else:
+                self._data[key] = (item[0] + 1, item[1])
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_keys:
+                self._data.popitem(last=False)
+
+    def reset(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+email_failures = FailureCounter(MAX_FAILURES_PER_EMAIL, WINDOW, MAX_KEYS)
+ip_failures = FailureCounter(MAX_FAILURES_PER_IP, WINDOW, MAX_KEYS)
+
+
+def is_blocked(email, ip):
+    return email_failures.is_blocked(email.lower()) or ip_failures.is_blocked(ip)
+
+
+def add_failure(email, ip):
+    email_failures.add_failure(email.lower())
+    ip_failures.add_failure(ip)
+
+
+# 로그인에 성공하면 그 이메일의 실패 횟수는 지운다.
+def reset(email):
+    email_failures.reset(email.lower())
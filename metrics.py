@@ -0,0 +1,171 @@
+# 요청, SQL, 외부 호출 시간 측정.
+#
+# 외부 라이브러리 없이 히스토그램과 카운터를 메모리에 모아두고,
+# /metrics 에서 Prometheus 텍스트 형식으로 보여준다.
+
+import threading
+import time
+from contextlib import contextmanager
+
+from app_logging import get_logger
+from config import Config
+
+
+SLOW_QUERY_SECONDS = getattr(Config, 'SLOW_QUERY_SECONDS', 0.5)   # None 이면 느린 쿼리 로그 안함
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 10000)
+
+logger = get_logger(__name__)
+
+
+class Histogram:
+
+    def __init__(self, name, help_text, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            item = self._values.get(labels)
+            if item is None:
+                item = {'counts' : [0] * len(self.buckets), 'sum' : 0.0, 'count' : 0}
+                self._values[labels] = item
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    item['counts'][i] += 1
+            item['sum'] += value
+            item['count'] += 1
+
+    def render(self):
+        lines = ['# HELP ' + self.name + ' ' + self.help_text,
+                 '# TYPE ' + self.name + ' histogram']
+        with self._lock:
+            for labels, item in sorted(self._values.items()):
+                label_text = _labels(self.label_names, labels)
+                for bound, count in zip(self.buckets, item['counts']):
+                    lines.append(self.name + '_bucket' +
+                                 _labels(self.label_names + ('le',), labels + (_number(bound),)) +
+                                 ' ' + str(count))
+                lines.append(self.name + '_bucket' +
+                             _labels(self.label_names + ('le',), labels + ('+Inf',)) +
+                             ' ' + str(item['count']))
+                lines.append(self.name + '_sum' + label_text + ' ' + _number(item['sum']))
+                lines.append(self.name + '_count' + label_text + ' ' + str(item['count']))
+        return lines
+
+
+class Counter:
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = ['# HELP ' + self.name + ' ' + self.help_text,
+                 '# TYPE ' + self.name + ' counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(self.name + _labels(self.label_names, labels) + ' ' + _number(value))
+        return lines
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    if len(names) == 0:
+        return ''
+    return '{' + ','.join(name + '="' + _escape(value) + '"'
+                          for name, value in zip(names, values)) + '}'
+
+
+request_seconds = Histogram('http_request_duration_seconds',
+                            'HTTP request latency by endpoint.',
+                            ('endpoint', 'method', 'status'))
+sql_seconds = Histogram('sql_statement_duration_seconds',
+                        'SQL statement latency by statement type.',
+                        ('statement',))
+sql_rows = Histogram('sql_statement_rows',
+                     'Rows affected or returned per SQL statement.',
+                     ('statement',), ROW_BUCKETS)
+slow_queries = Counter('sql_slow_statements_total',
+                       'SQL statements slower than SLOW_QUERY_SECONDS.',
+                       ('statement',))
+external_seconds = Histogram('external_call_duration_seconds',
+                             'Latency of calls to external services (S3, Rekognition ...).',
+                             ('service', 'operation'))
+
+
+def observe_request(endpoint, method, status, seconds):
+    request_seconds.observe((endpoint or 'none', method, str(status)), seconds)
+
+
+def observe_query(query, seconds, rows):
+    words = query.split(None, 1)
+    statement = words[0].lower() if len(words) != 0 else 'none'
+    sql_seconds.observe((statement,), seconds)
+    if rows is not None and rows >= 0:
+        sql_rows.observe((statement,), rows)
+    if SLOW_QUERY_SECONDS is not None and seconds >= SLOW_QUERY_SECONDS:
+        slow_queries.inc((statement,))
+        logger.warning('slow query',
+                       extra={'elapsed_ms' : round(seconds * 1000, 2),
+                              'rows' : rows,
+                              'query' : ' '.join(query.split())[:500]})
+
+
+# with metrics.timed('s3', 'upload_fileobj'):  처럼 외부 호출을 감싸서 쓴다.
+@contextmanager
+def timed(service, operation):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        external_seconds.observe((service, operation), time.perf_counter() - start)
+
+
+# 다른 모듈의 통계(커넥션 풀, 캐시 ...)를 /metrics 에 같이 보여주기 위해 등록한다.
+# func 는 {이름 : 숫자} 를 리턴하는 함수.
+_gauge_sources = []
+
+def register_gauges(prefix, func):
+    _gauge_sources.append((prefix, func))
+
+
+def render():
+    lines = []
+    for metric in (request_seconds, sql_seconds, sql_rows, slow_queries, external_seconds):
+        lines.extend(metric.render())
+    for prefix, func in _gauge_sources:
+        try:
+            values = func()
+        except Exception as e:
+            logger.error(str(e))
+            continue
+        for key, value in sorted(values.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = prefix + '_' + key
+            lines.append('# TYPE ' + name + ' gauge')
+            lines.append(name + ' ' + _number(value))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,59 @@
+-- 기본 테이블. resources/*.py 에서 쓰는 모든 테이블과,
+-- 피드 / 상세 / 로그인 쿼리에 필요한 인덱스.
+
+create table if not exists user (
+    id int not null auto_increment,
+    email varchar(100) not null,
+    password varchar(256) not null,
+    createdAt timestamp not null default current_timestamp,
+    primary key (id),
+    unique key user_email (email)
+);
+
+create table if not exists posting (
+    id int not null auto_increment,
+    userId int not null,
+    imgUrl varchar(500) not null,
+    content text,
+    createdAt timestamp not null default current_timestamp,
+    updatedAt timestamp not null default current_timestamp on update current_timestamp,
+    primary key (id),
+    -- 피드: 팔로우한 유저의 포스팅을 최신순으로
+    key posting_user_created (userId, createdAt, id)
+);
+
+create table if not exists follow (
+    id int not null auto_increment,
+    followerId int not null,
+    followeeId int not null,
+    createdAt timestamp not null default current_timestamp,
+    primary key (id),
+    unique key follow_follower_followee (followerId, followeeId),
+    -- 팔로워 목록, 팔로워 수
+    key follow_followee (followeeId, followerId)
+);
+
+create table if not exists likes (
+    id int not null auto_increment,
+    userId int not null,
+    postingId int not null,
+    createdAt timestamp not null default current_timestamp,
+    primary key (id),
+    unique key likes_posting_user (postingId, userId),
+    key likes_user_posting (userId, postingId)
+);
+
+create table if not exists tag_name (
+    id int not null auto_increment,
+    name varchar(100) not null,
+    primary key (id),
+    unique key tag_name_name (name)
+);
+
+create table if not exists tag (
+    id int not null auto_increment,
+    postingId int not null,
+    tagNameId int not null,
+    primary key (id),
+    key tag_posting (postingId, tagNameId)
+);
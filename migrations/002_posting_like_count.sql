@@ -0,0 +1,12 @@
+-- 포스팅별 좋아요 수. LikeResource 가 같은 트랜잭션에서 증가/감소 시킨다.
+-- 어긋나면  python jobs.py reconcile_like_counts  로 다시 계산한다.
+
+alter table posting
+    add column likeCnt int not null default 0;
+
+update posting p
+    left join (select postingId, count(*) as cnt
+               from likes
+               group by postingId) l
+    on p.id = l.postingId
+    set p.likeCnt = ifnull(l.cnt, 0);
@@ -0,0 +1,16 @@
+-- 팔로워 피드 타임라인 (TIMELINE_ENABLED 일때 사용)
+
+create table if not exists timeline (
+    userId int not null,
+    postingId int not null,
+    authorId int not null,
+    createdAt timestamp not null,
+    primary key (userId, createdAt, postingId),
+    key timeline_user_author (userId, authorId),
+    key timeline_posting (postingId)
+);
+
+create table if not exists timeline_celebrity (
+    userId int not null,
+    primary key (userId)
+);
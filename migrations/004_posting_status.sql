@@ -0,0 +1,4 @@
+-- 이미지 처리 상태. 'processing' -> 'done' 또는 'failed'
+
+alter table posting
+    add column status varchar(16) not null default 'done';
@@ -0,0 +1,8 @@
+-- 로그아웃된 JWT 토큰. 만료시간이 지나면 지운다.
+
+create table if not exists token_blocklist (
+    jti varchar(64) not null,
+    expiresAt datetime not null,
+    primary key (jti),
+    key token_blocklist_expires (expiresAt)
+);
@@ -0,0 +1,16 @@
+-- 해시태그 검색. 태그 -> 포스팅 아이디 목록을 인덱스만으로 읽는다.
+-- tag_name.postingCnt 는 태그가 붙은 포스팅 수. 인기 태그 목록에 쓴다.
+
+alter table tag
+    add key tag_tag_name_posting (tagNameId, postingId);
+
+alter table tag_name
+    add column postingCnt int not null default 0,
+    add key tag_name_posting_cnt (postingCnt);
+
+update tag_name tn
+    join (select tagNameId, count(*) as cnt
+          from tag
+          group by tagNameId) t
+    on tn.id = t.tagNameId
+    set tn.postingCnt = t.cnt;
@@ -0,0 +1,10 @@
+-- 업로드된 이미지 내용의 해시 -> S3 파일명, 리코그니션 태그.
+-- 같은 이미지가 다시 올라오면 S3 업로드와 리코그니션 호출을 건너뛴다.
+
+create table if not exists image_hash (
+    hash char(64) not null,
+    fileName varchar(255) not null,
+    labels text not null,
+    createdAt timestamp not null default current_timestamp,
+    primary key (hash)
+);
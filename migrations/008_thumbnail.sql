@@ -0,0 +1,7 @@
+-- 피드용 작은 이미지(썸네일). 만들지 않았으면 null 이고, 그때는 imgUrl 을 쓴다.
+
+alter table posting
+    add column thumbUrl varchar(500) null after imgUrl;
+
+alter table image_hash
+    add column thumbFileName varchar(255) null after fileName;
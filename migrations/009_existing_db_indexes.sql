@@ -0,0 +1,131 @@
+-- 001_initial.sql 은 create table if not exists 라서, 테이블이 이미 있던 DB 에는
+-- 인덱스가 만들어지지 않는다. 여기서 없는 인덱스만 골라서 추가한다.
+-- (MySQL 에는 add index if not exists 가 없으므로, information_schema.statistics 를
+--  보고 없을때만 alter table 을 실행한다.)
+
+-- 유니크 인덱스를 만들기 전에, 예전에 중복으로 들어간 친구 / 좋아요 행을 지운다.
+-- (지운 좋아요 만큼 likeCnt 가 어긋나므로, 적용후 python jobs.py reconcile_like_counts)
+delete f1
+    from follow f1
+    join follow f2
+    on f1.followerId = f2.followerId and f1.followeeId = f2.followeeId
+    and f1.id > f2.id;
+
+delete l1
+    from likes l1
+    join likes l2
+    on l1.postingId = l2.postingId and l1.userId = l2.userId
+    and l1.id > l2.id;
+
+-- 예전 태그 저장 코드(select 후 insert)는 같은 태그 이름을 두번 넣을수 있었다.
+-- 이름마다 가장 작은 id 만 남긴다. tag 는 남긴 id 로 옮기고, 그래서 같은 포스팅에
+-- 같은 태그가 두번 붙게 된 행은 지운다. 태그별 포스팅 수(postingCnt)는 다시 센다.
+update tag t
+    join tag_name tn
+    on t.tagNameId = tn.id
+    join (select name, min(id) as keepId
+          from tag_name
+          group by name
+          having count(*) > 1) k
+    on tn.name = k.name
+    set t.tagNameId = k.keepId
+    where t.tagNameId <> k.keepId;
+
+delete tn1
+    from tag_name tn1
+    join tag_name tn2
+    on tn1.name = tn2.name
+    and tn1.id > tn2.id;
+
+delete t1
+    from tag t1
+    join tag t2
+    on t1.postingId = t2.postingId and t1.tagNameId = t2.tagNameId
+    and t1.id > t2.id;
+
+update tag_name tn
+    left join (select tagNameId, count(*) as cnt
+               from tag
+               group by tagNameId) t
+    on tn.id = t.tagNameId
+    set tn.postingCnt = ifnull(t.cnt, 0);
+
+set @stmt = (select if(count(*) = 0,
+                       'alter table user add unique index user_email (email)',
+                       'do 0')
+             from information_schema.statistics
+             where table_schema = database()
+             and table_name = 'user' and index_name = 'user_email');
+prepare stmt from @stmt;
+execute stmt;
+deallocate prepare stmt;
+
+set @stmt = (select if(count(*) = 0,
+                       'alter table posting add index posting_user_created (userId, createdAt, id)',
+                       'do 0')
+             from information_schema.statistics
+             where table_schema = database()
+             and table_name = 'posting' and index_name = 'posting_user_created');
+prepare stmt from @stmt;
+execute stmt;
+deallocate prepare stmt;
+
+set @stmt = (select if(count(*) = 0,
+                       'alter table follow add unique index follow_follower_followee (followerId, followeeId)',
+                       'do 0')
+             from information_schema.statistics
+             where table_schema = database()
+             and table_name = 'follow' and index_name = 'follow_follower_followee');
+prepare stmt from @stmt;
+execute stmt;
+deallocate prepare stmt;
+
+set @stmt = (select if(count(*) = 0,
+                       'alter table follow add index follow_followee (followeeId, followerId)',
+                       'do 0')
+             from information_schema.statistics
+             where table_schema = database()
+             and table_name = 'follow' and index_name = 'follow_followee');
+prepare stmt from @stmt;
+execute stmt;
+deallocate prepare stmt;
+
+set @stmt = (select if(count(*) = 0,
+                       'alter table likes add unique index likes_posting_user (postingId, userId)',
+                       'do 0')
+             from information_schema.statistics
+             where table_schema = database()
+             and table_name = 'likes' and index_name = 'likes_posting_user');
+prepare stmt from @stmt;
+execute stmt;
+deallocate prepare stmt;
+
+set @stmt = (select if(count(*) = 0,
+                       'alter table likes add index likes_user_posting (userId, postingId)',
+                       'do 0')
+             from information_schema.statistics
+             where table_schema = database()
+             and table_name = 'likes' and index_name = 'likes_user_posting');
+prepare stmt from @stmt;
+execute stmt;
+deallocate prepare stmt;
+
+set @stmt = (select if(count(*) = 0,
+                       'alter table tag_name add unique index tag_name_name (name)',
+                       'do 0')
+             from information_schema.statistics
+             where table_schema = database()
+             and table_name = 'tag_name' and index_name = 'tag_name_name');
+prepare stmt from @stmt;
+execute stmt;
+deallocate prepare stmt;
+
+set @stmt = (select if(count(*) = 0,
+                       'alter table tag add index tag_posting (postingId, tagNameId)',
+                       'do 0')
+             from information_schema.statistics
+             where table_schema = database()
+             and table_name = 'tag' and index_name = 'tag_posting');
+prepare stmt from @stmt;
+execute stmt;
+deallocate prepare stmt;
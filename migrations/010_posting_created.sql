@@ -0,0 +1,11 @@
+-- 인기 태그를 최근 며칠 동안 올라온 포스팅으로 세기 위한 인덱스.
+
+set @stmt = (select if(count(*) = 0,
+                       'alter table posting add index posting_created (createdAt)',
+                       'do 0')
+             from information_schema.statistics
+             where table_schema = database()
+             and table_name = 'posting' and index_name = 'posting_created');
+prepare stmt from @stmt;
+execute stmt;
+deallocate prepare stmt;
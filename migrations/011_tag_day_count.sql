@@ -0,0 +1,30 @@
+-- 인기 태그용 태그별 / 날짜별 포스팅 수.
+-- 포스팅 처리가 끝나면 그 포스팅의 작성일 칸을 1 늘리고(image_pipeline.count_tags),
+-- 포스팅을 지우면 1 줄인다. 인기 태그는 최근 며칠 칸만 더한다.
+
+create table if not exists tag_day_count (
+    day date not null,
+    tagNameId int not null,
+    postingCnt int not null default 0,
+    primary key (day, tagNameId)
+);
+
+insert into tag_day_count
+    (day, tagNameId, postingCnt)
+    select date(p.createdAt), t.tagNameId, count(*)
+    from tag t
+    join posting p
+    on t.postingId = p.id
+    group by date(p.createdAt), t.tagNameId
+on duplicate key update postingCnt = values(postingCnt);
+
+-- 010 의 posting_created 는 인기 태그를 posting 에서 셀때만 쓰던 인덱스라서 지운다.
+set @stmt = (select if(count(*) = 0,
+                       'do 0',
+                       'alter table posting drop index posting_created')
+             from information_schema.statistics
+             where table_schema = database()
+             and table_name = 'posting' and index_name = 'posting_created');
+prepare stmt from @stmt;
+execute stmt;
+deallocate prepare stmt;
@@ -0,0 +1,11 @@
+-- 좋아요 write-behind(like_buffer) 용. (유저, 포스팅) 별로 마지막으로 저장한 좋아요 / 취소의
+-- 시각(마이크로초). 워커마다 따로 모았다가 저장하므로, 더 늦게 눌린 값이 먼저 저장되었으면
+-- 나중에 도착한 옛날 값은 버린다. 오래된 행은 python jobs.py prune_like_versions 로 지운다.
+
+create table if not exists like_version (
+    userId int not null,
+    postingId int not null,
+    changedAt bigint not null,
+    primary key (userId, postingId),
+    key like_version_changed (changedAt)
+);
@@ -1,12 +1,437 @@
+import threading
+import time
+import weakref
+from collections import deque
+
 import mysql.connector
+from mysql.connector import Error
+from mysql.connector.errors import PoolError
 
 from config import Config
+import metrics
+import read_after_write
+
+
+# 커넥션 풀 설정값. config.py 에 없으면 기본값을 사용한다.
+POOL_SIZE = getattr(Config, 'DB_POOL_SIZE', 10)
+POOL_TIMEOUT = getattr(Config, 'DB_POOL_TIMEOUT', 5)      # 풀이 비었을때 기다리는 최대 시간(초)
+POOL_RECYCLE = getattr(Config, 'DB_POOL_RECYCLE', 1800)   # 이 시간(초)보다 오래된 커넥션은 새로 연결
+
+# 읽기 전용 복제 DB. 호스트 이름이나 {'host' : ..., 'port' : ...} 목록.
+# 비어있으면 읽기도 모두 Config.HOST 로 보낸다.
+REPLICA_HOSTS = getattr(Config, 'DB_REPLICA_HOSTS', [])
+REPLICA_POOL_SIZE = getattr(Config, 'DB_REPLICA_POOL_SIZE', POOL_SIZE)
+REPLICA_RETRY_AFTER = getattr(Config, 'DB_REPLICA_RETRY_AFTER', 30)   # 연결 안되는 복제본을 빼두는 시간(초)
+
+
+class InstrumentedCursor:
+    '''쿼리마다 실행 시간과 행 수를 metrics 에 기록하는 커서.
+    풀의 커서는 unbuffered 라서, select 는 execute 직후에는 rowcount 가 -1 이고
+    행은 fetch 할때 DB 에서 읽어온다. 그래서 결과가 있는 쿼리는 fetch 하는 시간까지
+    더해서, 다 읽었을때(또는 커서를 닫거나 다음 쿼리를 실행할때) 기록한다.'''
+
+    def __init__(self, raw):
+        self._raw = raw
+        self._pending = None    # [쿼리, 걸린 시간, 읽은 행 수]
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def _start(self, operation, elapsed):
+        if getattr(self._raw, 'with_rows', False):
+            self._pending = [operation, elapsed, 0]
+        else:
+            metrics.observe_query(operation, elapsed, self._raw.rowcount)
+
+    def _finish(self):
+        if self._pending is not None:
+            operation, elapsed, rows = self._pending
+            self._pending = None
+            metrics.observe_query(operation, elapsed, rows)
+
+    def _fetched(self, elapsed, rows, done):
+        if self._pending is not None:
+            self._pending[1] += elapsed
+            self._pending[2] += rows
+            if done:
+                self._finish()
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return self._raw.execute(operation, params, *args, **kwargs)
+        finally:
+            self._start(operation, time.perf_counter() - start)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return self._raw.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            self._start(operation, time.perf_counter() - start)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        result = self._raw.fetchall()
+        self._fetched(time.perf_counter() - start, len(result), True)
+        return result
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = self._raw.fetchone()
+        self._fetched(time.perf_counter() - start, 0 if row is None else 1, row is None)
+        return row
+
+    def fetchmany(self, size=1):
+        start = time.perf_counter()
+        result = self._raw.fetchmany(size)
+        self._fetched(time.perf_counter() - start, len(result), len(result) == 0)
+        return result
+
+    def close(self):
+        self._finish()
+        return self._raw.close()
+
+
+class PooledConnection:
+    '''풀에서 빌려준 커넥션.
+    close() 를 호출하면 실제로 끊지 않고 풀에 반납한다.
+    with get_connection() as connection: 처럼 쓰면 블록이 끝날때 반납한다.
+    close() 없이 버려지면 GC 될때 끊고 풀의 자리만 돌려준다. (leaked 통계)
+    나머지 메소드(cursor, commit ...)는 원래 커넥션으로 넘긴다.'''
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._closed = False
+        self.replica = pool.replica
+        self._finalizer = weakref.finalize(self, pool.reclaim, raw)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._raw.cursor(*args, **kwargs))
+
+    def close(self):
+        # 두번 close 해도 한번만 반납한다.
+        if self._closed:
+            return
+        self._closed = True
+        self._finalizer.detach()
+        self._pool.release(self._raw, self._created_at)
+
+
+class ConnectionPool:
+    '''스레드에 안전한, 크기가 정해진 MySQL 커넥션 풀.'''
+
+    replica = False     # 복제 DB 풀이면 True
+
+    def __init__(self, size, timeout, recycle, **db_config):
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.db_config = db_config
+
+        self._idle = deque()
+        self._created = 0
+        self._cond = threading.Condition()
+
+        self._stats = {
+            'checkouts': 0,
+            'hits': 0,          # 쉬고있는 커넥션을 바로 재사용
+            'misses': 0,        # 새로 연결
+            'waits': 0,         # 풀이 비어서 기다림
+            'timeouts': 0,      # 기다리다 시간 초과
+            'recycled': 0,      # 오래되거나 끊어져서 다시 연결
+            'leaked': 0,        # close() 없이 버려져서 GC 때 회수
+            'checkout_time_total': 0.0,
+            'checkout_time_max': 0.0,
+        }
+
+    def _connect(self):
+        return mysql.connector.connect(**self.db_config)
+
+    def _is_usable(self, raw, created_at):
+        if time.monotonic() - created_at > self.recycle:
+            return False
+        try:
+            raw.ping(reconnect=False)
+        except Error:
+            return False
+        return True
+
+    def get(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        raw = None
+        created_at = None
+
+        with self._cond:
+            waited = False
+            while True:
+                if self._idle:
+                    raw, created_at = self._idle.pop()
+                    self._stats['hits'] += 1
+                    break
+                if self._created < self.size:
+                    # 자리를 먼저 잡고, 연결은 락 밖에서 한다.
+                    self._created += 1
+                    self._stats['misses'] += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolError(msg='커넥션 풀이 가득 찼습니다. 잠시후 다시 시도하세요.')
+                if not waited:
+                    self._stats['waits'] += 1
+                    waited = True
+                self._cond.wait(remaining)
+
+        try:
+            if raw is None:
+                raw = self._connect()
+                created_at = time.monotonic()
+            elif not self._is_usable(raw, created_at):
+                # 오래됐거나 끊어진 커넥션은 버리고 새로 연결한다.
+                self._stats['recycled'] += 1
+                self._close_quietly(raw)
+                raw = self._connect()
+                created_at = time.monotonic()
+        except Exception:
+            self._discard()
+            raise
+
+        elapsed = time.monotonic() - start
+        with self._cond:
+            self._stats['checkouts'] += 1
+            self._stats['checkout_time_total'] += elapsed
+            if elapsed > self._stats['checkout_time_max']:
+                self._stats['checkout_time_max'] = elapsed
+
+        return PooledConnection(self, raw, created_at)
+
+    def release(self, raw, created_at):
+        # 커밋하지 않은 작업은 반납전에 롤백한다.
+        # (예전처럼 커넥션을 끊었을때와 같은 동작)
+        try:
+            raw.rollback()
+        except Exception:
+            self._close_quietly(raw)
+            self._discard()
+            return
+
+        with self._cond:
+            self._idle.append((raw, created_at))
+            self._cond.notify()
+
+    # close() 없이 버려진 커넥션. 트랜잭션 상태를 알수 없으므로 재사용하지 않고 끊는다.
+    def reclaim(self, raw):
+        with self._cond:
+            self._stats['leaked'] += 1
+        self._close_quietly(raw)
+        self._discard()
+
+    def _discard(self):
+        with self._cond:
+            self._created -= 1
+            self._cond.notify()
+
+    def _close_quietly(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['size'] = self.size
+            stats['open'] = self._created
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._created - len(self._idle)
+        if stats['checkouts'] != 0:
+            stats['checkout_time_avg'] = stats['checkout_time_total'] / stats['checkouts']
+        else:
+            stats['checkout_time_avg'] = 0.0
+        return stats
+
+
+class ReplicaSet:
+    '''읽기 전용 복제 DB 들. 호스트마다 풀을 따로 두고 돌아가면서 빌려준다.
+    연결이 안되는 복제본은 retry_after 초 동안 빼두었다가 다시 시도한다.'''
+
+    def __init__(self, pools, retry_after):
+        self.pools = pools
+        self.retry_after = retry_after
+
+        self._ejected_until = [0.0] * len(pools)
+        self._next = 0
+        self._lock = threading.Lock()
+
+        self._stats = {
+            'checkouts': 0,
+            'ejections': 0,     # 연결이 안되서 뺀 횟수
+            'fallbacks': 0,     # 쓸수 있는 복제본이 없어서 primary 로 보냄
+        }
+
+    def _candidates(self):
+        now = time.monotonic()
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.pools)
+        order = list(range(start, len(self.pools))) + list(range(0, start))
+        return [i for i in order if self._ejected_until[i] <= now]
+
+    def eject(self, index):
+        with self._lock:
+            self._ejected_until[index] = time.monotonic() + self.retry_after
+            self._stats['ejections'] += 1
+
+    # 쓸수 있는 복제본의 커넥션. 모두 안되면 None.
+    def get(self):
+        for i in self._candidates():
+            try:
+                connection = self.pools[i].get()
+            except PoolError:
+                # 풀이 가득찬 것은 장애가 아니므로 빼지 않고 다음 복제본을 본다.
+                continue
+            except Error:
+                self.eject(i)
+                continue
+            with self._lock:
+                self._stats['checkouts'] += 1
+            return connection
+
+        with self._lock:
+            self._stats['fallbacks'] += 1
+        return None
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._stats)
+            stats['replicas'] = len(self.pools)
+            stats['healthy'] = len([until for until in self._ejected_until if until <= now])
+        for i, pool in enumerate(self.pools):
+            pool_stats = pool.stats()
+            stats['replica' + str(i) + '_in_use'] = pool_stats['in_use']
+            stats['replica' + str(i) + '_waits'] = pool_stats['waits']
+        return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_replicas = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    POOL_SIZE,
+                    POOL_TIMEOUT,
+                    POOL_RECYCLE,
+                    host = Config.HOST,
+                    database = Config.DATABASE,
+                    user = Config.DB_USER,
+                    password = Config.DB_PASSWORD
+                )
+    return _pool
+
+
+def _replica_config(replica):
+    db_config = {'host' : Config.HOST,
+                 'database' : Config.DATABASE,
+                 'user' : Config.DB_USER,
+                 'password' : Config.DB_PASSWORD}
+    if isinstance(replica, dict):
+        db_config.update(replica)
+    else:
+        db_config['host'] = replica
+    return db_config
+
+
+# 복제 DB 가 설정되어 있지 않으면 None
+def get_replicas():
+    global _replicas
+    if _replicas is None and len(REPLICA_HOSTS) != 0:
+        with _pool_lock:
+            if _replicas is None:
+                pools = [ConnectionPool(REPLICA_POOL_SIZE,
+                                        POOL_TIMEOUT,
+                                        POOL_RECYCLE,
+                                        **_replica_config(replica))
+                         for replica in REPLICA_HOSTS]
+                for pool in pools:
+                    pool.replica = True
+                _replicas = ReplicaSet(pools, REPLICA_RETRY_AFTER)
+    return _replicas
+
+
 # 파이썬으로 MySQL에 접속할 수 있는 함수.
+# 매번 새로 연결하지 않고, 풀에서 커넥션을 빌려온다.
+# 다 쓰고 connection.close() 하면 풀에 반납된다.
 def get_connection():
-    connection = mysql.connector.connect(
-        host = Config.HOST,
-        database = Config.DATABASE,
-        user = Config.DB_USER,
-        password = Config.DB_PASSWORD
-    )
-    return connection
\ No newline at end of file
+    return get_pool().get()
+
+
+# GET 요청에서 쓰는 읽기 전용 커넥션.
+# 복제 DB 가 있으면 복제본에서 빌려오고, 없거나 모두 장애면 primary 에서 빌려온다.
+# 방금 쓰기를 한 유저(mark_written)는 복제가 늦어서 자기가 쓴 내용이
+# 안보이는 일이 없도록 DB_STICKY_WINDOW 초 동안 primary 에서 읽는다.
+# (표시는 응답 쿠키 / 헤더로 클라이언트가 들고 있으므로, 다른 워커에서도 통한다.
+#  read_after_write.py 참고)
+def get_read_connection(user_id=None):
+    replicas = get_replicas()
+    if replicas is None:
+        return get_connection()
+    if user_id is not None and read_after_write.must_read_primary(user_id):
+        return get_connection()
+
+    connection = replicas.get()
+    if connection is None:
+        return get_connection()
+    return connection
+
+
+# 포스팅, 좋아요, 친구추가 같은 쓰기를 커밋한 후에 호출한다.
+def mark_written(user_id):
+    if len(REPLICA_HOSTS) != 0:
+        read_after_write.mark_written(user_id)
+
+
+# 풀 사용 통계 (hits, waits, checkout 시간 등)
+def get_pool_stats():
+    return get_pool().stats()
+
+
+# 복제 DB 통계. 복제 DB 가 없으면 빈 dict.
+def get_replica_stats():
+    replicas = get_replicas()
+    if replicas is None:
+        return {}
+    return replicas.stats()
+
+
+metrics.register_gauges('db_pool', get_pool_stats)
+metrics.register_gauges('db_replica', get_replica_stats)
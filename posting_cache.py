@@ -0,0 +1,135 @@
+# 포스팅 상세 정보 캐시.
+#
+# 인기 포스팅은 1분에 수천번씩 조회되므로, 모든 유저에게 같은
+# 내용(content, imgUrl, 태그, 좋아요 수 ...)은 캐시해두고
+# 유저마다 다른 isLike 만 따로 조회해서 덮어쓴다.
+# 수정, 삭제, 좋아요가 바뀌면 invalidate() 로 캐시에서 지운다.
+# 복제 DB 에서 읽은 값은 아직 복제되지 않은 옛날 값일수 있으므로,
+# DB_STICKY_WINDOW 초 동안만 캐시한다. (다른 프로세스에서 invalidate 한 포스팅도
+# 이 시간이 지나면 새로 읽는다.)
+
+import copy
+
+from cache import LRUCache
+from config import Config
+import metrics
+
+
+CACHE_SIZE = getattr(Config, 'POSTING_CACHE_SIZE', 5000)
+CACHE_TTL = getattr(Config, 'POSTING_CACHE_TTL', 30)     # 초
+MAX_BULK_IDS = getattr(Config, 'POSTING_MAX_BULK_IDS', 100)
+REPLICA_TTL = getattr(Config, 'DB_STICKY_WINDOW', 5)     # 초
+
+detail_cache = LRUCache(CACHE_SIZE, CACHE_TTL)
+
+
+def invalidate(posting_id):
+    detail_cache.delete(posting_id)
+
+
+# ?ids=1,2,3 을 포스팅 아이디 목록으로 바꾼다. (Flask 와 asgi.py 가 같이 쓴다)
+# 잘못된 값이면 응답에 그대로 쓸 메세지로 ValueError 를 발생시킨다.
+def parse_ids(ids):
+    try:
+        posting_ids = [int(posting_id) for posting_id in ids.split(',') if posting_id != '']
+    except ValueError:
+        raise ValueError("ids 는 숫자여야 합니다.")
+    if len(posting_ids) == 0 or len(posting_ids) > MAX_BULK_IDS:
+        raise ValueError("ids 는 1개 이상, " + str(MAX_BULK_IDS) + "개 이하로 보내주세요.")
+    return posting_ids
+
+
+# 포스팅들의 상세 정보를 태그와 함께 한번에 가져오는 쿼리
+def details_query(posting_ids):
+    query = '''select p.id postId, p.imgUrl, p.thumbUrl, p.content,
+                u.id userId, u.email ,
+                p.createdAt, p.likeCnt, p.status,
+                group_concat(tn.name separator ',') as tags
+                from posting p
+                join user u
+                on p.userId = u.id
+                left join tag t
+                on p.id = t.postingId
+                left join tag_name tn
+                on t.tagNameId = tn.id
+                where p.id in (''' + ', '.join(['%s'] * len(posting_ids)) + ''')
+                group by p.id;'''
+    return query, tuple(posting_ids)
+
+
+# 유저가 좋아요 한 포스팅 아이디를 가져오는 쿼리
+def liked_query(user_id, posting_ids):
+    query = '''select postingId
+                from likes
+                where userId = %s
+                and postingId in (''' + ', '.join(['%s'] * len(posting_ids)) + ''');'''
+    return query, tuple([user_id] + list(posting_ids))
+
+
+# details_query 결과를 { 포스팅아이디 : {'post' : {...}, 'tag' : [...]} } 로 바꿔서 캐시에 넣는다.
+# ttl 을 주면 캐시 기본값 대신 그 시간(초)만 캐시한다.
+def store_rows(result_list, ttl=None):
+    details = {}
+    for row in result_list:
+        tags = row.pop('tags')
+        tag = []
+        if tags is not None:
+            tag = ['#' + name for name in tags.split(',')]
+        details[row['postId']] = {'post' : row, 'tag' : tag}
+        detail_cache.set(row['postId'], details[row['postId']], ttl)
+    return details
+
+
+# 캐시에 있는 것과 없는 포스팅 아이디를 나눈다.
+def lookup(posting_ids):
+    details = {}
+    missing = []
+    for posting_id in posting_ids:
+        detail = detail_cache.get(posting_id)
+        if detail is None:
+            missing.append(posting_id)
+        else:
+            details[posting_id] = detail
+    return details, missing
+
+
+# 캐시된 값은 여러 요청이 같이 보므로, 복사해서 isLike 를 넣는다.
+def overlay_likes(details, liked):
+    result = {}
+    for posting_id, detail in details.items():
+        detail = copy.deepcopy(detail)
+        detail['post']['isLike'] = 1 if posting_id in liked else 0
+        result[posting_id] = detail
+    return result
+
+
+# 포스팅 여러개의 상세 정보를 가져온다. 없는 포스팅은 빠진다.
+# 결과의 post 에는 이 유저의 isLike 가 들어있다.
+def get_details(connection, user_id, posting_ids):
+    details, missing = lookup(posting_ids)
+
+    if len(missing) != 0:
+        query, record = details_query(missing)
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(query, record)
+        ttl = REPLICA_TTL if getattr(connection, 'replica', False) else None
+        details.update(store_rows(cursor.fetchall(), ttl))
+        cursor.close()
+
+    if len(details) == 0:
+        return {}
+
+    query, record = liked_query(user_id, list(details))
+    cursor = connection.cursor()
+    cursor.execute(query, record)
+    liked = set(row[0] for row in cursor.fetchall())
+    cursor.close()
+
+    return overlay_likes(details, liked)
+
+
+def cache_stats():
+    return detail_cache.stats()
+
+
+metrics.register_gauges('posting_cache', cache_stats)
@@ -0,0 +1,109 @@
+# 쓰기 직후의 읽기를 primary DB 로 보내기 위한 표시 (read-your-writes).
+#
+# 포스팅, 좋아요, 친구추가를 한 응답에 서명된 표시를 쿠키와 헤더로 붙여준다.
+#   Set-Cookie: read_after_write=...      (쿠키를 쓰는 클라이언트는 자동으로 다시 보낸다)
+#   X-Read-After-Write: ...               (쿠키를 안쓰는 클라이언트는 이 값을 같은 헤더로 보낸다)
+# 다음 요청에 이 표시가 있고 DB_STICKY_WINDOW 초가 지나지 않았으면, 어느 워커가 받든
+# 복제 DB 대신 primary 에서 읽는다. 표시는 서버 비밀키로 서명하므로 유저가 바꿀수 없다.
+#
+# 친구추가 / 삭제는 따로 read_after_follow 표시(X-Read-After-Follow)를 붙인다.
+# 팔로우 캐시(follow_graph)는 워커마다 FOLLOW_GRAPH_CACHE_TTL 초 동안 옛날 목록을
+# 들고 있을수 있으므로, 이 표시는 그 시간 동안 유효하다.
+
+from http.cookies import CookieError, SimpleCookie
+
+from flask import g, has_request_context, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+from config import Config
+
+
+WINDOW = getattr(Config, 'DB_STICKY_WINDOW', 5)    # 초
+FOLLOW_WINDOW = getattr(Config, 'FOLLOW_GRAPH_CACHE_TTL', 60)   # 초. follow_graph.CACHE_TTL 과 같은 값
+COOKIE_NAME = 'read_after_write'
+HEADER_NAME = 'X-Read-After-Write'
+
+
+class Marker:
+    '''서명된 "이 유저가 방금 썼다" 표시 하나.
+    window 초가 지나면 무시한다. 쿠키와 헤더 중 하나로 돌아오면 된다.'''
+
+    def __init__(self, cookie_name, header_name, window):
+        self.cookie_name = cookie_name
+        self.header_name = header_name
+        self.window = window
+        self._attr = 'marked_' + cookie_name
+        self._serializer = URLSafeTimedSerializer(Config.JWT_SECRET_KEY,
+                                                  salt=cookie_name.replace('_', '-'))
+
+    def make(self, user_id):
+        return self._serializer.dumps(str(user_id))
+
+    # 이 유저의 표시이고, window 초가 지나지 않았으면 True
+    def check(self, marker, user_id):
+        try:
+            return self._serializer.loads(marker, max_age=self.window) == str(user_id)
+        except BadSignature:
+            # 서명이 틀리거나 시간이 지난 표시 (SignatureExpired 도 여기로 온다)
+            return False
+
+    # 요청 안에서 쓰기를 커밋한 후에 호출한다. 응답을 보낼때 set_markers 가 표시를 붙인다.
+    def mark(self, user_id):
+        if has_request_context():
+            setattr(g, self._attr, str(user_id))
+
+    def is_active(self, user_id):
+        if not has_request_context():
+            return False
+        if g.get(self._attr) == str(user_id):
+            return True
+        marker = request.headers.get(self.header_name) or request.cookies.get(self.cookie_name)
+        return marker is not None and self.check(marker, user_id)
+
+    # Flask 요청이 아닐때(asgi.py). headers 는 소문자 이름 : 값 딕셔너리
+    def check_headers(self, headers, user_id):
+        marker = headers.get(self.header_name.lower())
+        if marker is None:
+            try:
+                cookie = SimpleCookie(headers.get('cookie', ''))
+            except CookieError:
+                return False
+            if self.cookie_name not in cookie:
+                return False
+            marker = cookie[self.cookie_name].value
+        return self.check(marker, user_id)
+
+    def set_on(self, response):
+        user_id = g.get(self._attr)
+        if user_id is not None:
+            marker = self.make(user_id)
+            response.headers[self.header_name] = marker
+            response.set_cookie(self.cookie_name, marker, max_age=self.window,
+                                httponly=True, samesite='Lax')
+
+    # asgi.py 응답에 붙일 (이름, 값) 헤더들
+    def asgi_headers(self, user_id):
+        marker = self.make(user_id)
+        cookie = (self.cookie_name + '=' + marker + '; Max-Age=' + str(self.window) +
+                  '; Path=/; HttpOnly; SameSite=Lax')
+        return [(self.header_name.lower().encode('ascii'), marker.encode('ascii')),
+                (b'set-cookie', cookie.encode('ascii'))]
+
+
+written = Marker(COOKIE_NAME, HEADER_NAME, WINDOW)
+followed = Marker('read_after_follow', 'X-Read-After-Follow', FOLLOW_WINDOW)
+
+
+def mark_written(user_id):
+    written.mark(user_id)
+
+
+def must_read_primary(user_id):
+    return written.is_active(user_id)
+
+
+# app.after_request 에서 호출한다.
+def set_marker(response):
+    written.set_on(response)
+    followed.set_on(response)
+    return response
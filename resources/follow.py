@@ -1,21 +1,42 @@
 from flask import request
 from flask_jwt_extended import get_jwt_identity, jwt_required #요청 받기
 from flask_restful import Resource
-from mysql_connection import get_connection
+from mysql_connection import get_connection, mark_written
 from mysql.connector import Error
+from mysql.connector.errors import PoolError
+from app_logging import get_logger
+import follow_graph
+import timeline
+
+logger = get_logger(__name__)
 
 
 # 팔로워 팔로위 관련
 class FollowResource(Resource):
+    # 내가 이 유저를 팔로우 하는지
+    @jwt_required()
+    def get(self,followee_id):
+        user_id = get_jwt_identity()
+        try:
+            following = follow_graph.is_following(user_id, followee_id)
+        except PoolError:
+            raise
+        except Error as e:
+            logger.error(str(e))
+            return{"ERROR" : str(e)},500
+
+        return{"isFollowing" : 1 if following else 0},200
+
     # 친구추가 
     @jwt_required()
     def post(self,followee_id):
         user_id = get_jwt_identity()
-        print(followee_id)
+        logger.debug('follow %s', followee_id)
 
+        connection = get_connection()
         try:
-            connection = get_connection()
-            query = '''insert into follow
+            # 이미 친구면 아무것도 하지 않는다. (에러 없이 200)
+            query = '''insert ignore into follow
                         (followerId,followeeId)
                         values
                         (%s,%s);'''
@@ -23,13 +44,21 @@ class FollowResource(Resource):
             record = (user_id,followee_id)
             cursor = connection.cursor()
             cursor.execute(query,record)
+
+            # 새로 친구가 됐을때만, 친구의 최근 포스팅을 내 타임라인에 채운다.
+            changed = cursor.rowcount > 0
+            if changed:
+                timeline.on_follow(connection, user_id, followee_id)
             connection.commit()
+            mark_written(user_id)
+            if changed:
+                follow_graph.invalidate(user_id, followee_id)
 
             cursor.close()
             connection.close()
 
         except Error as e:
-            print(e)
+            logger.error(str(e))
             cursor.close()
             connection.close()
             return{"ERROR" : str(e)},500
@@ -39,33 +68,95 @@ class FollowResource(Resource):
     @jwt_required()
     def delete(self,followee_id):
         user_id = get_jwt_identity()
-        print(followee_id)
+        logger.debug('unfollow %s', followee_id)
 
+        connection = get_connection()
         try:
-            connection = get_connection()
             query = '''delete from follow
                        where followerId =%s and followeeId =%s;'''
             
             record = (user_id,followee_id)
             cursor = connection.cursor()
             cursor.execute(query,record)
+
+            # 친구의 포스팅을 내 타임라인에서 뺀다.
+            # 친구가 아니었으면 지워진 행이 없으므로 아무것도 하지 않는다.
+            changed = cursor.rowcount > 0
+            if changed:
+                timeline.on_unfollow(connection, user_id, followee_id)
             connection.commit()
+            mark_written(user_id)
+            if changed:
+                follow_graph.invalidate(user_id, followee_id)
 
             cursor.close()
             connection.close()
 
         except Error as e:
-            print(e)
+            logger.error(str(e))
             cursor.close()
             connection.close()
             return{"ERROR" : str(e)},500
         
         return{"Result " : "Success" },200
-    
 
 
+# 팔로위 / 팔로워 아이디 목록. 캐시에 있으면 DB 를 보지 않는다.
+def id_list_response(ids):
+    try:
+        limit = int(request.args.get('limit', 100))
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return {"error" : "offset, limit 은 숫자여야 합니다."},400
+    if limit <= 0 or offset < 0:
+        return {"error" : "offset, limit 값이 올바르지 않습니다."},400
 
+    items = ids[offset:offset + limit].tolist()
+    return {"result " : "success",
+            "items" : items,
+            "count " : len(items),
+            "total" : len(ids)},200
 
-    
 
+class FolloweeListResource(Resource):
+    # 이 유저가 팔로우한 유저들
+    @jwt_required()
+    def get(self,user_id):
+        try:
+            ids = follow_graph.get_followees(user_id)
+        except PoolError:
+            raise
+        except Error as e:
+            logger.error(str(e))
+            return{"ERROR" : str(e)},500
+        return id_list_response(ids)
 
+
+class FollowerListResource(Resource):
+    # 이 유저를 팔로우한 유저들
+    @jwt_required()
+    def get(self,user_id):
+        try:
+            ids = follow_graph.get_followers(user_id)
+        except PoolError:
+            raise
+        except Error as e:
+            logger.error(str(e))
+            return{"ERROR" : str(e)},500
+        return id_list_response(ids)
+
+
+class FollowCountResource(Resource):
+    # 팔로위 수, 팔로워 수
+    @jwt_required()
+    def get(self,user_id):
+        try:
+            followee_cnt = len(follow_graph.get_followees(user_id))
+            follower_cnt = len(follow_graph.get_followers(user_id))
+        except PoolError:
+            raise
+        except Error as e:
+            logger.error(str(e))
+            return{"ERROR" : str(e)},500
+        return {"followeeCnt" : followee_cnt,
+                "followerCnt" : follower_cnt},200
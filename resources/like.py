@@ -1,8 +1,13 @@
 from flask import request
 from flask_jwt_extended import get_jwt_identity, jwt_required #요청 받기
 from flask_restful import Resource
-from mysql_connection import get_connection
+from mysql_connection import get_connection, mark_written
 from mysql.connector import Error
+from app_logging import get_logger
+import like_buffer
+import posting_cache
+
+logger = get_logger(__name__)
 
 
 # 좋아요, 관련 
@@ -11,11 +16,17 @@ class LikeResource(Resource):
     @jwt_required()
     def post(self,posting_id):
         user_id = get_jwt_identity()
-        print(posting_id)
+        logger.debug('like %s', posting_id)
+
+        # 모아서 저장하는 모드면, 버퍼에 넣고 바로 응답한다.
+        if like_buffer.ENABLED:
+            like_buffer.submit(user_id, posting_id, True)
+            return{"Result " : "Success" },200
 
+        connection = get_connection()
         try:
-            connection = get_connection()
-            query = '''insert into likes
+            # 이미 좋아요 한 포스팅이면 아무것도 하지 않는다. (에러 없이 200)
+            query = '''insert ignore into likes
                         (userId, postingId)
                         values
                         (%s,%s);'''
@@ -23,13 +34,24 @@ class LikeResource(Resource):
             record = (user_id,posting_id)
             cursor = connection.cursor()
             cursor.execute(query,record)
+
+            # 좋아요 수를 posting 테이블에 같이 저장해 둔다.
+            # 새로 들어간 좋아요가 있을때만 증가한다.
+            if cursor.rowcount > 0:
+                query = '''update posting
+                            set likeCnt = likeCnt + 1
+                            where id = %s;'''
+                record = (posting_id,)
+                cursor.execute(query,record)
             connection.commit()
+            mark_written(user_id)
+            posting_cache.invalidate(posting_id)
 
             cursor.close()
             connection.close()
 
         except Error as e:
-            print(e)
+            logger.error(str(e))
             cursor.close()
             connection.close()
             return{"ERROR" : str(e)},500
@@ -40,22 +62,36 @@ class LikeResource(Resource):
     def delete(self,posting_id):
         user_id = get_jwt_identity()
     
+        if like_buffer.ENABLED:
+            like_buffer.submit(user_id, posting_id, False)
+            return{"Result " : "Success" },200
 
+        connection = get_connection()
         try:
-            connection = get_connection()
+            # 좋아요 하지 않은 포스팅이면 지워지는 행이 없을 뿐, 에러는 아니다.
             query = '''delete from likes
                        where userId = %s and postingId = %s;'''
             
             record = (user_id,posting_id)
             cursor = connection.cursor()
             cursor.execute(query,record)
+
+            # 실제로 지워진 좋아요가 있을때만 좋아요 수를 줄인다.
+            if cursor.rowcount > 0:
+                query = '''update posting
+                            set likeCnt = greatest(likeCnt - %s, 0)
+                            where id = %s;'''
+                record = (cursor.rowcount, posting_id)
+                cursor.execute(query,record)
             connection.commit()
+            mark_written(user_id)
+            posting_cache.invalidate(posting_id)
 
             cursor.close()
             connection.close()
 
         except Error as e:
-            print(e)
+            logger.error(str(e))
             cursor.close()
             connection.close()
             return{"ERROR" : str(e)},500
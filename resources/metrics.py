@@ -0,0 +1,12 @@
+from flask import make_response
+from flask_restful import Resource
+
+import metrics
+
+
+# Prometheus 가 가져가는 통계 페이지
+class MetricsResource(Resource):
+    def get(self):
+        response = make_response(metrics.render(), 200)
+        response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+        return response
@@ -1,46 +1,72 @@
-from flask import request
+from flask import Response, request
 from flask_jwt_extended import get_jwt_identity, jwt_required
 from flask_restful import Resource
 from config import Config
-from mysql_connection import get_connection
+from mysql_connection import get_connection, get_read_connection, mark_written
 from mysql.connector import Error
-import boto3
+from mysql.connector.errors import PoolError
+from app_logging import get_logger
+from utils import decode_cursor, encode_cursor
+import follow_graph
+import image_dedup
+import image_pipeline
+import json_stream
+import posting_cache
+import timeline
 from datetime import datetime
+import os
+
+logger = get_logger(__name__)
+
+
+# 팔로우한 유저들의 포스팅을 최신순으로 가져오는 쿼리와 파라미터.
+# before 가 있으면 (createdAt, id) 커서 다음부터, 없으면 offset 부터 가져온다.
+# followee_ids 를 주면 follow 조인 대신 userId in (...) 으로 가져온다. (비어있으면 안된다)
+# (asgi.py 의 비동기 모드에서도 같이 쓴다.)
+def feed_query(user_id, before, offset, limit, followee_ids=None):
+    if followee_ids is None:
+        query = '''select p.id postId, p.imgUrl, p.thumbUrl, p.content,
+                    u.id userId, u.email ,
+                    p.createdAt, p.likeCnt, if(l2.id is null, 0,1) as isLike
+                    from follow f
+                    join posting p
+                    on f.followeeId = p.userId
+                    join user u 
+                    on p.userId = u.id
+                    left join likes l2
+                    on p.id = l2.postingId and l2.userId = %s
+                    where f.followerId = %s and p.status = 'done' '''
+        record = [user_id, user_id]
+    else:
+        query = '''select p.id postId, p.imgUrl, p.thumbUrl, p.content,
+                    u.id userId, u.email ,
+                    p.createdAt, p.likeCnt, if(l2.id is null, 0,1) as isLike
+                    from posting p
+                    join user u 
+                    on p.userId = u.id
+                    left join likes l2
+                    on p.id = l2.postingId and l2.userId = %s
+                    where p.userId in (''' + ', '.join(['%s'] * len(followee_ids)) + ''')
+                    and p.status = 'done' '''
+        record = [user_id] + list(followee_ids)
+
+    if before is not None:
+        query = query + '''and (p.createdAt < %s
+                        or (p.createdAt = %s and p.id < %s))
+                order by p.createdAt desc, p.id desc
+                limit %s ;'''
+        record = record + [before[0], before[0], before[1], limit]
+    else:
+        query = query + '''
+                order by p.createdAt desc, p.id desc
+                limit %s , %s ;'''
+        record = record + [offset, limit]
+
+    return query, tuple(record)
 
 
 class PostingListResource(Resource):
 
-
-    def detect_labels(self, photo, bucket):
-
-        client = boto3.client('rekognition',
-                              'ap-northeast-2',
-                              aws_access_key_id=Config.AWS_ACCESS_KEY_ID,
-                              aws_secret_access_key=Config.AWS_SECRET_ACCESS_KEY)
-
-        response = client.detect_labels(Image={'S3Object':{'Bucket':bucket,'Name':photo}},
-        MaxLabels=5,
-        # Uncomment to use image properties and filtration settings
-        #Features=["GENERAL_LABELS", "IMAGE_PROPERTIES"],
-        #Settings={"GeneralLabels": {"LabelInclusionFilters":["Cat"]},
-        # "ImageProperties": {"MaxDominantColors":10}} 
-        )
-
-        print('Detected labels for ' + photo)
-        print()
-
-        label_list = [] 
-        for label in response['Labels']:
-            print("Label: " + label['Name']) 
-            print("Confidence: " + str(label['Confidence']))
-            if label['Confidence'] >= 90: #Confidence 가 90 이상인것만 출력하도록 .
-                label_list.append(label['Name'])
-            
-
-        return label_list
-
-
-
     @jwt_required()
     def post(self) :
 
@@ -50,204 +76,294 @@ class PostingListResource(Resource):
 
         user_id = get_jwt_identity()
 
-        # 2. 사진을 s3에 저장한다.
         if file is None :
             return {'error' : '파일을 업로드 하세요'}, 400
         
 
+        # 2. 파일은 로컬에 임시로 저장해두고,
+        #    S3 업로드와 리코그니션 태그 처리는 백그라운드 워커가 한다.
+        #    JPEG / PNG 가 아니거나 너무 큰 파일은 여기서 거절한다.
+        try :
+            file_path, digest, content_type = image_pipeline.spool_file(file)
+        except image_pipeline.UploadRejected as e :
+            return {'error' : e.message}, e.status
+        except OSError as e :
+            logger.error(str(e))
+            return {'error' : str(e)}, 500
+
         # 파일명을 회사의 파일명 정책에 맞게 변경한다.
         # 파일명은 유니크 해야 한다. 
 
         current_time = datetime.now()
 
-        new_file_name = current_time.isoformat().replace(':', '_') + str(user_id) + '.jpg'  
+        new_file_name = (current_time.isoformat().replace(':', '_') + str(user_id) +
+                         image_pipeline.extension_for(content_type))
 
         # 유저가 올린 파일의 이름을, 
         # 새로운 파일 이름으로 변경한다. 
         file.filename = new_file_name
 
-        s3 = boto3.client('s3',
-                    aws_access_key_id = Config.AWS_ACCESS_KEY_ID,
-                    aws_secret_access_key = Config.AWS_SECRET_ACCESS_KEY )
-
+        # 전에 올라온 적 있는 이미지면, S3 에 있는 파일을 그대로 쓴다.
         try :
-            s3.upload_fileobj(file, 
-                              Config.S3_BUCKET,
-                              file.filename,
-                              ExtraArgs = {'ACL' : 'public-read' , 
-                                           'ContentType' : 'image/jpeg'} )
-        except Exception as e :
-            print(e)
-            return {'error' : str(e)}, 500
-        
-        # rekogintion 서비스를 이용해서
-        # object detection 하여, 태그 이름을 가져온다.
-
-        tag_list = self.detect_labels(new_file_name, Config.S3_BUCKET)
-
-        print(tag_list)
-
-        # DB의 posting 테이블에 데이터를 넣어야 하고,
-        # tag_name 테이블과 tag 테이블에도 데이터를
-        # 넣어줘야 한다.
-
+            known = image_dedup.find(digest)
+        except Error as e :
+            logger.warning(str(e))
+            known = None
+        if known is not None :
+            new_file_name = known[0]
+
+        # 3. posting 테이블에 'processing' 상태로 먼저 넣어준다.
+        #    태그와 타임라인은 워커가 처리를 끝낸 후에 저장된다.
         try :
             connection = get_connection()
-
-            # 1. posting 테이블에 데이터를 넣어준다.
+        except PoolError :
+            os.remove(file_path)
+            raise
+        try :
             query = '''insert into posting
-                    (userId, imgUrl, content)
+                    (userId, imgUrl, content, status)
                     values
-                    (%s, %s, %s);'''
+                    (%s, %s, %s, %s);'''
             record = (user_id, 
                       Config.S3_LOCATION+new_file_name,
-                      content)
+                      content,
+                      image_pipeline.STATUS_PROCESSING)
             cursor = connection.cursor()
             cursor.execute(query, record)
 
             posting_id = cursor.lastrowid
 
-            # 2. tag_name 테이블 처리를 해준다.
-            #    리코그니션을 이용해서 받아온 label이,
-            #    tag_name테이블에 이미 존재하면, 
-            #    그 아이디만 가져오고,
-            #    그렇지 않으면, 테이블에 인서트 한후에
-            #    그 아이디를 가져온다. 
-
-            for tag in tag_list :
-                tag = tag.lower()
-                query = '''select *
-                        from tag_name
-                        where name = %s;'''
-                record = (tag , )
-                
-                cursor = connection.cursor(dictionary=True)
-                cursor.execute(query, record)
-
-                result_list = cursor.fetchall()
-
-                # 태그가 이미 테이블에 있으면, 아이디만 가져오고
-                if len(result_list) != 0 :
-                    tag_name_id = result_list[0]['id']
-                else :
-                    # 태그가 테이블에 없으면, 인서트 한다.
-                    query = '''insert into tag_name
-                            (name)
-                            values
-                            (%s);'''
-                    record = (tag, )
-                    cursor = connection.cursor()
-                    cursor.execute(query, record)
-
-                    tag_name_id = cursor.lastrowid
-
-                # 3. 위의 태그네임 아이디와, 포스팅 아이디를
-                #    이용해서, tag 테이블에 데이터를 넣어준다.   
-                    
-                query = '''insert into tag
-                        (postingId, tagNameId)
-                        values
-                        (%s, %s);'''
-                record = (posting_id, tag_name_id)
-
-                cursor = connection.cursor()
-                cursor.execute(query, record)                            
-            
-            # 트랜잭션 처리를 위해서
-            # 커밋은 테이블 처리를 다 하고나서
-            # 마지막에 한번 해준다.
-            # 이렇게 해주면, 중간에 다른 테이블에서
-            # 문제가 발생하면, 모든 테이블이 원상복구(롤백)
-            # 된다. 이 기능을 트랜잭션 이라고 한다.
             connection.commit()
+            mark_written(user_id)
 
             cursor.close()
             connection.close()
 
         except Error as e:
-            print(e)
+            logger.error(str(e))
             cursor.close()
             connection.close()
+            os.remove(file_path)
             return {'error' : str(e)}, 500
 
+        # 4. 이미지 처리 작업을 큐에 넣고 바로 응답한다.
+        image_pipeline.submit(posting_id, user_id, file_path, new_file_name, digest, content_type)
 
-        return {'result' : 'success'}, 200
+        return {'result' : 'success',
+                'postingId' : posting_id,
+                'status' : image_pipeline.STATUS_PROCESSING}, 200
     
     @jwt_required()
     def get(self):
         user_id = get_jwt_identity()
+
+        # ?ids=1,2,3 이면 피드 대신, 그 포스팅들의 상세정보를 한번에 가져온다.
+        if request.args.get('ids') is not None:
+            return self.get_bulk(user_id, request.args.get('ids'))
+
         offset = request.args.get('offset')
         limit = request.args.get('limit')
+        cursor_token = request.args.get('cursor')
+        # ?stream=json 또는 ?stream=ndjson 이면 응답을 나눠서 보낸다.
+        # (타임라인 모드에서는 한 페이지를 한번에 가져오므로 쓰지 않는다.)
+        stream = request.args.get('stream')
+        if stream is not None and stream not in json_stream.FORMATS:
+            return {"error" : "stream 은 json 또는 ndjson 입니다."},400
+
+        # limit 과 offset 은 숫자만 허용한다.
+        # 쿼리 문자열에 직접 붙이지 않고, 파라미터로 넘긴다.
         try:
-            connection = get_connection()
-            query = '''select p.id postId, p.imgUrl, p.content,
-                        u.id userId, u.email ,
-                        p.createdAt, count(l.id) as likeCnt, if(l2.id is null, 0,1) as isLike
-                        from follow f
-                        join posting p
-                        on f.followeeId = p.userId
-                        join user u 
-                        on p.userId = u.id
-                        left join likes l 
-                        on p.id = l.postingId
-                        left join likes l2
-                        on p.id = l2.postingId and l2.userId = %s
-                        where f.followerId = %s
-                        group by p.id
-                        order by p.createdAt desc
-                        limit '''+offset+''' , '''+limit+''' ;'''
-            
-            record = (user_id,user_id)
+            limit = int(limit) if limit is not None else 20
+            offset = int(offset) if offset is not None else 0
+        except ValueError:
+            return {"error" : "offset, limit 은 숫자여야 합니다."},400
+        if limit <= 0 or offset < 0:
+            return {"error" : "offset, limit 값이 올바르지 않습니다."},400
+
+        # 커서가 있으면 (createdAt, id) 기준으로 그 다음 행부터 가져온다.
+        # offset 처럼 앞의 행들을 읽고 버리지 않으므로,
+        # 몇번째 페이지든 첫 페이지와 비용이 같다.
+        before = None
+        if cursor_token is not None:
+            try:
+                before = decode_cursor(cursor_token)
+            except ValueError as e:
+                return {"error" : str(e)},400
+
+        # 타임라인 모드면, 미리 만들어둔 타임라인에서 가져온다.
+        if timeline.ENABLED:
+            connection = get_read_connection(user_id)
+            try:
+                result_list = self.get_from_timeline(connection, user_id, before, offset, limit)
+                connection.close()
+
+            except Error as e:
+                logger.error(str(e))
+                connection.close()
+                return{"ERROR" : str(e)},500
+
+            return self.feed_response(result_list, limit)
+
+        # 팔로우한 유저 목록은 캐시에서 가져와서 쿼리에 직접 넣는다.
+        # 너무 많이 팔로우한 유저는 기존처럼 follow 조인으로 가져온다.
+        followee_ids = None
+        if follow_graph.FEED_ENABLED:
+            try:
+                followee_ids = follow_graph.get_followees(user_id)
+            except PoolError:
+                raise
+            except Error as e:
+                logger.error(str(e))
+                return{"ERROR" : str(e)},500
+
+            if len(followee_ids) == 0 and stream is None:
+                return self.feed_response([], limit)
+            if len(followee_ids) == 0 or len(followee_ids) > follow_graph.FEED_MAX_IDS:
+                followee_ids = None
+
+        connection = get_read_connection(user_id)
+        try:
+            query, record = feed_query(user_id, before, offset, limit, followee_ids)
+
             cursor = connection.cursor(dictionary=True)
             cursor.execute(query,record)
 
+            # 스트리밍 모드면, 커서에서 조금씩 읽으면서 바로 응답을 보낸다.
+            # 커서와 커넥션은 다 보낸 다음 stream_feed 안에서 닫힌다.
+            if stream is not None:
+                return Response(json_stream.stream_feed(connection, cursor, limit, stream),
+                                mimetype=json_stream.FORMATS[stream])
+
             result_list = cursor.fetchall()
-            print(result_list)
+            logger.debug('feed', extra={'items' : result_list})
 
-            # date time 은 파이썬에서 사용하는 데이터 타입이므로
-            # JSON 형식이 아니다. 따라서,
-            # JSOON은 문자열이나 숫자만 가능하므로
-            # datetime을 문자열로 바꿔주어야 한다. 
+            # createdAt 같은 datetime 은 응답을 만들때
+            # json_encoder 가 문자열로 바꿔준다.
             cursor.close()
             connection.close()
 
         except Error as e:
-            print(Error)
+            logger.error(str(e))
             cursor.close()
             connection.close()
             return{"ERROR" : str(e)},500 
 
-        # 날짜 포맷 변경 
-        i = 0
-        for row in result_list:
-            result_list[i]['createdAt'] = row['createdAt'].isoformat()
-            i = i+1
+        return self.feed_response(result_list, limit)
+
+    # 타임라인에서 포스팅 아이디를 읽고,
+    # 한번의 쿼리로 포스팅 내용을 채워서 가져온다.
+    def get_from_timeline(self, connection, user_id, before, offset, limit):
+        entries = timeline.read_feed(connection, user_id, before, offset + limit)
+        entries = entries[offset:]
+        if len(entries) == 0:
+            return []
+
+        posting_ids = [entry[1] for entry in entries]
+        query = '''select p.id postId, p.imgUrl, p.thumbUrl, p.content,
+                    u.id userId, u.email ,
+                    p.createdAt, p.likeCnt, if(l2.id is null, 0,1) as isLike
+                    from posting p
+                    join user u
+                    on p.userId = u.id
+                    left join likes l2
+                    on p.id = l2.postingId and l2.userId = %s
+                    where p.id in (''' + ', '.join(['%s'] * len(posting_ids)) + ''')
+                    order by p.createdAt desc, p.id desc;'''
+        record = tuple([user_id] + posting_ids)
+
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(query, record)
+        result_list = cursor.fetchall()
+        cursor.close()
+        return result_list
+
+    def get_bulk(self, user_id, ids):
+        try:
+            posting_ids = posting_cache.parse_ids(ids)
+        except ValueError as e:
+            return {"error" : str(e)},400
+
+        connection = get_read_connection(user_id)
+        try:
+            details = posting_cache.get_details(connection, user_id, posting_ids)
+            connection.close()
+
+        except Error as e:
+            logger.error(str(e))
+            connection.close()
+            return{"ERROR" : str(e)},500
+
+        # 요청한 순서대로 돌려준다.
+        items = []
+        for posting_id in posting_ids:
+            if posting_id in details:
+                item = details[posting_id]['post']
+                item['tag'] = details[posting_id]['tag']
+                items.append(item)
+
+        return {"result " : "success",
+            "items" : items,
+            "count " : len(items)},200
+
+    def feed_response(self, result_list, limit):
+        # 다음 페이지 커서. 마지막 페이지면 None
+        next_cursor = None
+        if len(result_list) == limit:
+            last = result_list[-1]
+            next_cursor = encode_cursor(last['createdAt'], last['postId'])
 
         return {"result " : "success",
             "items" : result_list,
-            "count " : len(result_list)},200
+            "count " : len(result_list),
+            "next_cursor" : next_cursor},200
     
 
 class PostingResource(Resource):
     @jwt_required()
     def delete(self,posting_id):
         user_id = get_jwt_identity()
+        connection = get_connection()
         try:
-            connection = get_connection()
+            cursor = connection.cursor()
+
+            # 인기 태그용 날짜별 수를 줄인다. 포스팅 작성일이 필요하므로 지우기 전에 한다.
+            query = '''update tag_day_count d
+                        join tag t
+                        on d.tagNameId = t.tagNameId
+                        join posting p
+                        on t.postingId = p.id and d.day = date(p.createdAt)
+                        set d.postingCnt = greatest(d.postingCnt - 1, 0)
+                        where p.id = %s and p.userId = %s;'''
+            cursor.execute(query,(posting_id, user_id))
+
             query = ''' delete from posting
                         where id =%s and userId =%s;'''
             
             record = (posting_id, user_id)
             
-            cursor = connection.cursor()
             cursor.execute(query,record)
+            if cursor.rowcount > 0:
+                timeline.on_posting_deleted(connection, posting_id)
+
+                # 포스팅에 붙어있던 태그의 포스팅 수를 줄이고, 태그를 지운다.
+                query = '''update tag_name tn
+                            join tag t
+                            on tn.id = t.tagNameId
+                            set tn.postingCnt = greatest(tn.postingCnt - 1, 0)
+                            where t.postingId = %s;'''
+                cursor.execute(query,(posting_id,))
+                query = '''delete from tag
+                            where postingId = %s;'''
+                cursor.execute(query,(posting_id,))
             connection.commit()
+            mark_written(user_id)
+            posting_cache.invalidate(posting_id)
 
             cursor.close()
             connection.close()
 
         except Error as e:
-            print(e)
+            logger.error(str(e))
             cursor.close()
             connection.close()
             return{"Error" : str(e)},500
@@ -258,13 +374,12 @@ class PostingResource(Resource):
     def put(self,posting_id):
         data = request.get_json()
         user_id = get_jwt_identity()
-        print(user_id)
-        print(posting_id)
+        logger.debug('update posting %s', posting_id)
         
+        connection = get_connection()
         try:
-            connection = get_connection()
             query = ''' update posting
-                        set content = %s,
+                        set content = %s
                         where id = %s and userId = %s;'''
             
             record = (data['content'],
@@ -273,12 +388,14 @@ class PostingResource(Resource):
             cursor = connection.cursor()
             cursor.execute(query,record)
             connection.commit()
+            mark_written(user_id)
+            posting_cache.invalidate(posting_id)
 
             cursor.close()
             connection.close()
 
         except Error as e:
-            print(e)
+            logger.error(str(e))
             cursor.close()
             connection.close()
             return{"Error" : str(e)},500
@@ -289,64 +406,27 @@ class PostingResource(Resource):
     @jwt_required()
     def get(self,posting_id):
         user_id = get_jwt_identity()
+        connection = get_read_connection(user_id)
         try:
-            connection = get_connection()
-            query = '''select p.id postId, p.imgUrl, p.content,
-                        u.id userId, u.email , 
-                        p.createdAt, count(l.id) as likeCnt,if(l2.id is null, 0,1) as isLike
-                        from posting p
-                        join user u 
-                        on p.userId = u.id
-                        left join likes l 
-                        on p.id = l.postingId
-                        left join likes l2
-                        on p.id = l2.postingId and l2.userId = %s
-                        where p.id = %s;'''
-            
-            record = (user_id,posting_id)
-            cursor = connection.cursor(dictionary=True)
-            cursor.execute(query,record)
-
-            result_list = cursor.fetchall()
-            if result_list[0]['postId'] == None:
-                return {'error' : '데이터 없음'},400
-            
-            post = result_list[0]
-            
-           
-
-            query = '''select concat('#',name) as tag
-                        from tag t
-                        join tag_name tn
-                        on t.tagNameId = tn.id
-                        where t.postingId = %s;'''
-            
-            record = (posting_id,)
-            cursor = connection.cursor(dictionary=True)
-            cursor.execute(query,record)
-
-            result_list  = cursor.fetchall()
-            #print(result_list)
-
-            tag = []
-            for tag_dict in result_list:
-                tag.append(tag_dict['tag'])
 
+            # 모든 유저에게 같은 내용은 캐시에서 가져오고,
+            # isLike 만 이 유저 기준으로 조회한다.
+            details = posting_cache.get_details(connection, user_id, [posting_id])
 
-            cursor.close()
             connection.close()
 
         except Error as e:
-            print(e)
-            cursor.close()
+            logger.error(str(e))
             connection.close()
             return{"Error" : str(e)},500
         
-    
-        post['createdAt'] = post['createdAt'].isoformat()
-        print(post)
-        print(tag)
+        if posting_id not in details:
+            return {'error' : '데이터 없음'},400
+
+        post = details[posting_id]['post']
+        tag = details[posting_id]['tag']
+        logger.debug('posting detail', extra={'post' : post, 'tag' : tag})
 
         return {
             "post" : post,
-            "tag " : tag},200
\ No newline at end of file
+            "tag " : tag},200
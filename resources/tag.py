@@ -0,0 +1,263 @@
+import heapq
+
+from flask import request
+from flask_jwt_extended import get_jwt_identity, jwt_required
+from flask_restful import Resource
+from mysql_connection import get_read_connection
+from mysql.connector import Error
+from app_logging import get_logger
+from cache import LRUCache
+from config import Config
+import posting_cache
+import tag_names
+
+logger = get_logger(__name__)
+
+# 태그 하나에서 한번에 읽는 포스팅 아이디 수
+SCAN_SIZE = getattr(Config, 'TAG_SEARCH_SCAN_SIZE', 2000)
+MAX_TAGS = getattr(Config, 'TAG_SEARCH_MAX_TAGS', 5)
+# 요청 하나에서 태그마다 읽는 최대 횟수. 넘으면 거기까지의 결과와 다음 커서를 돌려준다.
+MAX_SCAN_ROUNDS = getattr(Config, 'TAG_SEARCH_MAX_SCAN_ROUNDS', 10)
+
+popular_cache = LRUCache(16, getattr(Config, 'POPULAR_TAG_CACHE_TTL', 60))
+POPULAR_DAYS = getattr(Config, 'POPULAR_TAG_DAYS', 7)     # 최근 며칠 동안 올라온 포스팅으로 센다
+
+
+# 내림차순으로 정렬된 아이디 목록들에 모두 들어있는 아이디 (AND)
+def intersect_sorted(lists):
+    if len(lists) == 0:
+        return []
+    result = lists[0]
+    for other in lists[1:]:
+        merged = []
+        i = 0
+        j = 0
+        while i < len(result) and j < len(other):
+            if result[i] == other[j]:
+                merged.append(result[i])
+                i += 1
+                j += 1
+            elif result[i] > other[j]:
+                i += 1
+            else:
+                j += 1
+        result = merged
+    return result
+
+
+# 내림차순으로 정렬된 아이디 목록들 중 하나에라도 들어있는 아이디 (OR)
+def union_sorted(lists):
+    result = []
+    for posting_id in heapq.merge(*lists, reverse=True):
+        if len(result) == 0 or result[-1] != posting_id:
+            result.append(posting_id)
+    return result
+
+
+# 태그 하나의 포스팅 아이디를 최신순으로 읽는 쿼리와 파라미터.
+# (tagNameId, postingId) 인덱스만 읽는다. (schema.py explain 에서도 쓴다)
+def posting_ids_query(tag_name_id, before, size):
+    if before is None:
+        query = '''select postingId
+                    from tag
+                    where tagNameId = %s
+                    order by postingId desc
+                    limit %s;'''
+        record = (tag_name_id, size)
+    else:
+        query = '''select postingId
+                    from tag
+                    where tagNameId = %s and postingId < %s
+                    order by postingId desc
+                    limit %s;'''
+        record = (tag_name_id, before, size)
+    return query, record
+
+
+def select_posting_ids(cursor, tag_name_id, before, size):
+    query, record = posting_ids_query(tag_name_id, before, size)
+    cursor.execute(query, record)
+    return [row[0] for row in cursor.fetchall()]
+
+
+# AND 검색에서 bound 보다 작은 아이디 중 다음에 나올수 있는 가장 큰 아이디 + 1.
+# 교집합의 아이디는 모든 목록에 있어야 하므로, 목록마다
+#   - 읽은 구간 안에 bound 보다 작은 아이디가 있으면 그 중 가장 큰것 이하이고
+#   - 없으면 그 목록의 마지막(가장 작은) 아이디 미만이다. (끝까지 읽은 목록이면 더 없다)
+# 이 중 가장 작은 값부터 다시 읽는다. 없으면 None
+def next_and_before(lists, bound):
+    before = bound
+    for ids in lists:
+        below = [posting_id for posting_id in ids if posting_id < bound]
+        if len(below) != 0:
+            before = min(before, below[0] + 1)
+        elif len(ids) == SCAN_SIZE:
+            before = min(before, ids[-1])
+        else:
+            return None
+    return before
+
+
+# 태그들이 붙은 포스팅 아이디를 최신순으로 limit 개 찾는다.
+# 태그마다 아이디 목록을 SCAN_SIZE 개씩 읽어서 합치고(AND 는 교집합, OR 는 합집합),
+# 모자라면 그 다음 구간을 다시 읽는다. 최대 MAX_SCAN_ROUNDS 번까지만 읽는다.
+# (아이디 목록, 다음 페이지 커서) 를 리턴한다. 더 없으면 커서는 None
+def search_posting_ids(cursor, tag_name_ids, op, before, limit):
+    result = []
+    for scan_round in range(MAX_SCAN_ROUNDS):
+        lists = [select_posting_ids(cursor, tag_name_id, before, SCAN_SIZE)
+                 for tag_name_id in tag_name_ids]
+        if op == 'and':
+            merged = intersect_sorted(lists)
+        else:
+            merged = union_sorted(lists)
+
+        # 끝까지 읽지 못한 목록이 있으면, 그 목록의 마지막 아이디보다
+        # 작은 아이디는 아직 모르므로, 거기까지만 결과로 쓴다.
+        bounds = [ids[-1] for ids in lists if len(ids) == SCAN_SIZE]
+        if len(bounds) == 0:
+            result.extend(merged)
+            break
+        bound = max(bounds)
+        result.extend([posting_id for posting_id in merged if posting_id >= bound])
+        if len(result) >= limit:
+            break
+
+        if op == 'and':
+            before = next_and_before(lists, bound)
+            if before is None:
+                break
+        else:
+            before = bound
+    else:
+        # 읽는 횟수를 다 썼다. before 이상의 아이디는 모두 찾았으므로 다음은 before 부터.
+        return result, before
+
+    if len(result) >= limit:
+        return result[:limit], result[limit - 1]
+    return result, None
+
+
+# 인기 태그 쿼리와 파라미터
+# 최근 days 일 동안 올라온 포스팅에 붙은 수(recentCnt) 순서. postingCnt 는 전체 기간의 수.
+# tag 테이블을 세지 않고, 포스팅을 저장 / 삭제할때 같이 바꾸는 tag_day_count 의
+# 날짜별 칸(days 일 x 태그 수)만 더한다.
+def popular_tags_query(limit, days=POPULAR_DAYS):
+    query = '''select concat('#', tn.name) as tag,
+                sum(d.postingCnt) as recentCnt, tn.postingCnt
+                from tag_day_count d
+                join tag_name tn
+                on d.tagNameId = tn.id
+                where d.day >= current_date - interval %s day
+                group by tn.id
+                having recentCnt > 0
+                order by recentCnt desc, tn.id
+                limit %s;'''
+    return query, (days, limit)
+
+
+class TagPostingResource(Resource):
+    # 해시태그로 포스팅 검색
+    #   /tag/food/posting
+    #   /tag/food,dog/posting?op=and   (둘다 붙은 포스팅)
+    #   /tag/food,dog/posting?op=or    (하나라도 붙은 포스팅)
+    @jwt_required()
+    def get(self, name):
+        user_id = get_jwt_identity()
+
+        names = []
+        for tag in name.split(','):
+            tag = tag.strip().lstrip('#').lower()
+            if tag != '' and tag not in names:
+                names.append(tag)
+        if len(names) == 0 or len(names) > MAX_TAGS:
+            return {"error" : "태그는 1개 이상, " + str(MAX_TAGS) + "개 이하로 보내주세요."},400
+
+        op = request.args.get('op', 'and')
+        if op not in ('and', 'or'):
+            return {"error" : "op 는 and 또는 or 입니다."},400
+
+        try:
+            limit = int(request.args.get('limit', 20))
+            before = request.args.get('cursor')
+            before = int(before) if before is not None else None
+        except ValueError:
+            return {"error" : "limit, cursor 는 숫자여야 합니다."},400
+        if limit <= 0:
+            return {"error" : "limit 값이 올바르지 않습니다."},400
+
+        connection = get_read_connection(user_id)
+        try:
+            cursor = connection.cursor()
+
+            tag_name_ids = tag_names.get_tag_name_ids(cursor, names)
+            if op == 'and' and len(tag_name_ids) != len(names):
+                # 없는 태그가 하나라도 있으면, 모두 붙은 포스팅도 없다.
+                posting_ids = []
+                next_cursor = None
+            else:
+                posting_ids, next_cursor = search_posting_ids(cursor, list(tag_name_ids.values()),
+                                                              op, before, limit)
+            cursor.close()
+
+            details = {}
+            if len(posting_ids) != 0:
+                details = posting_cache.get_details(connection, user_id, posting_ids)
+
+            connection.close()
+
+        except Error as e:
+            logger.error(str(e))
+            connection.close()
+            return{"ERROR" : str(e)},500
+
+        items = []
+        for posting_id in posting_ids:
+            if posting_id in details and details[posting_id]['post']['status'] == 'done':
+                item = details[posting_id]['post']
+                item['tag'] = details[posting_id]['tag']
+                items.append(item)
+
+        if next_cursor is not None:
+            next_cursor = str(next_cursor)
+
+        return {"result " : "success",
+                "items" : items,
+                "count " : len(items),
+                "next_cursor" : next_cursor},200
+
+
+class PopularTagResource(Resource):
+    # 인기 태그. 최근 POPULAR_DAYS 일 동안의 tag_day_count 를 더하고,
+    # 결과는 popular_cache 에 잠깐 들고 있는다.
+    @jwt_required()
+    def get(self):
+        try:
+            limit = int(request.args.get('limit', 10))
+        except ValueError:
+            return {"error" : "limit 은 숫자여야 합니다."},400
+        if limit <= 0 or limit > 100:
+            return {"error" : "limit 은 1 ~ 100 입니다."},400
+
+        items = popular_cache.get(limit)
+        if items is None:
+            connection = get_read_connection()
+            try:
+                query, record = popular_tags_query(limit)
+                cursor = connection.cursor(dictionary=True)
+                cursor.execute(query, record)
+                items = cursor.fetchall()
+                cursor.close()
+                connection.close()
+
+            except Error as e:
+                logger.error(str(e))
+                cursor.close()
+                connection.close()
+                return{"ERROR" : str(e)},500
+
+            popular_cache.set(limit, items)
+
+        return {"result " : "success",
+                "items" : items,
+                "count " : len(items)},200
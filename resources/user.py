@@ -1,10 +1,21 @@
+import time
 from flask import request
 from flask_jwt_extended import create_access_token, get_jwt, get_jwt_identity, jwt_required
 from flask_restful import Resource
 from mysql_connection import get_connection
 from mysql.connector import Error
+from app_logging import get_logger
 from email_validator import validate_email, EmailNotValidError
-from utils import check_password, hash_password
+from utils import check_password, hash_password, password_needs_update, record_timing
+from token_blocklist import revoke_token
+import login_limiter
+
+logger = get_logger(__name__)
+
+# 로그인할때 이메일로 아이디와 암호화된 비밀번호만 가져오는 쿼리 (schema.py explain 에서도 쓴다)
+LOGIN_QUERY = '''select id, password
+                from user
+                where email = %s;'''
 
 
 class UserRegisterResource(Resource):
@@ -25,7 +36,7 @@ class UserRegisterResource(Resource):
             validate_email(data['email'])
 
         except EmailNotValidError as e :
-            print(e)
+            logger.info(str(e))
             return {"error" : str(e)},400
         
         #3. 비밀번호 길이가 유효한지 체크한다.
@@ -36,11 +47,10 @@ class UserRegisterResource(Resource):
 
         #4. 비밀번호를 암호화 한다.
         password = hash_password(data['password'])
-        print(password)
 
         #5. DB의 user 테이블에 저장 
+        connection = get_connection()
         try:
-            connection = get_connection()
             query = ''' insert into user
                         (email,password)
                         values(%s,%s);'''
@@ -62,7 +72,7 @@ class UserRegisterResource(Resource):
 
     
         except Error as e:
-            print(e)
+            logger.error(str(e))
             cursor.close()
             connection.close()
             return {'error' : str(e)},500
@@ -84,62 +94,103 @@ class UserLoginResource(Resource):
 
         data = request.get_json()
 
+        # 실패가 너무 많은 이메일이나 IP 는, 비밀번호 확인 전에 바로 거절한다.
+        ip = request.remote_addr
+        if login_limiter.is_blocked(data['email'], ip):
+            return {"error" : "로그인 시도가 너무 많습니다. 잠시후 다시 시도하세요."},429
+
         # 2. 유저 테이블에서, 이 이메일주소로 
-        # 데이터를 가져온다.
+        # 아이디와 암호화된 비밀번호만 가져온다.
 
+        # DB 시간과 비밀번호 확인 시간을 따로 기록한다.
+        start = time.perf_counter()
+        connection = get_connection()
         try:
-            connection = get_connection()
-            query = '''  select * 
-                         from user
-                         where email = %s;  '''
-            
             record = (data['email'] , )
 
-            cursor  = connection.cursor(dictionary=True) #select 시 딕셔너리 true
-            cursor.execute(query,record)
+            cursor  = connection.cursor()
+            cursor.execute(LOGIN_QUERY,record)
             
-            result_list = cursor.fetchall() #가져온 데이터
-            print(result_list)
+            row = cursor.fetchone() #가져온 데이터. 없으면 None
 
             cursor.close()
             connection.close()
+            record_timing('login.db', time.perf_counter() - start)
 
         except Error as e:
-            print(e)
+            logger.error(str(e))
             cursor.close()
             connection.close()
             return{"error" : str(e)},500
 
-        # 회원 가입을 안한경우, 리스트에 데이터가 없다.
-        if len(result_list) == 0 :
+        # 회원 가입을 안한경우, 데이터가 없다.
+        if row is None :
+            login_limiter.add_failure(data['email'], ip)
             return {"error" : "회원가입을 하시지 않았습니다."},400
         
+        user_id, hashed_password = row
+
         # 회원 ID 정보가 일치하였으니, 비밀번호를 체크한다.
         # 로그인한 사람이 마지막에 입력한 비밀번호 data['password']
         # 회원가입할때 입력했던, 암호화된 비밀번호 DB에있음
-        # result_list에 들어있고
-        # 리스트의 첫번째 데이터에 들어있다
-        check = check_password(data['password'] , result_list[0]['password'] ) 
+        check = check_password(data['password'] , hashed_password ) 
 
         # #비밀번호가 틀렸을떄
         if check == False:
+            login_limiter.add_failure(data['email'], ip)
             return {"error" : "비밀번호가 맞지 않습니다."},406
         
+        login_limiter.reset(data['email'])
+
+        # 예전 반복 횟수로 암호화된 비밀번호는, 지금 설정으로 다시 암호화해서 저장한다.
+        if password_needs_update(hashed_password):
+            self.rehash_password(user_id, data['password'])
+
         # jwt 토큰을 만들어서 , 클라이언트에게 응답한다.
-        access_token = create_access_token(result_list[0]['id'])
-        #access_token = create_access_token(result_list[0]['id'], expires_delta = datetime.timedelta(minutes=2))
+        access_token = create_access_token(user_id)
+        #access_token = create_access_token(user_id, expires_delta = datetime.timedelta(minutes=2))
         return {"result" : "success", "accessToken" :access_token },205
-    
-jwt_blocklist = set()
 
+    def rehash_password(self, user_id, original_password):
+        password = hash_password(original_password)
+        try:
+            connection = get_connection()
+        except Error as e:
+            # 다시 암호화하는 것은 실패해도 로그인은 계속 진행한다.
+            logger.error(str(e))
+            return
+        try:
+            query = '''update user
+                        set password = %s
+                        where id = %s;'''
+            record = (password, user_id)
+            cursor = connection.cursor()
+            cursor.execute(query,record)
+            connection.commit()
+
+            cursor.close()
+            connection.close()
+
+        except Error as e:
+            # 다시 암호화하는 것은 실패해도 로그인은 계속 진행한다.
+            logger.error(str(e))
+            cursor.close()
+            connection.close()
+    
 class UserLogoutResource(Resource):
     #jwt 필수
     @jwt_required()
     def delete(self):
-        jti = get_jwt()['jti']
-        print(jti)
+        token = get_jwt()
+        jti = token['jti']
+        logger.debug('logout %s', jti)
         
-        jwt_blocklist.add(jti)
+        # 모든 서버가 같이 보는 저장소에, 토큰 만료시간과 함께 저장한다.
+        try:
+            revoke_token(jti, token.get('exp'))
+        except Error as e:
+            logger.error(str(e))
+            return {"error" : str(e)},500
 
 
         return {"result" : "success"},200
\ No newline at end of file
@@ -0,0 +1,211 @@
+# 스키마 마이그레이션과 쿼리 실행계획 검사.
+#
+#   python schema.py migrate     migrations/ 의 .sql 파일 중 아직 적용 안된 것을 순서대로 적용
+#   python schema.py status      적용된 버전 / 적용 안된 버전 보기
+#   python schema.py explain     자주 쓰는 쿼리들을 EXPLAIN 해서,
+#                                테이블 전체를 읽는(type = ALL) 쿼리가 있으면 실패(종료코드 1)
+#   python schema.py explain --seed 2000
+#                                빈 DB 면 검사용 행을 먼저 넣고 EXPLAIN 한다
+#
+# config.py 의 DB 로 접속한다. CI 에서는 로컬 MySQL 에 migrate 후 explain --seed 를 실행한다.
+
+import argparse
+import os
+import random
+import sys
+
+import mysql.connector
+
+from config import Config
+
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# EXPLAIN 으로 검사할 쿼리들. (이름, 쿼리, 예시 파라미터) 목록.
+# 쿼리를 여기에 옮겨 적지 않고, 실제로 쓰는 모듈의 쿼리 함수에서 만든다.
+# (그쪽 모듈은 flask 등을 import 하므로, explain 할때만 불러온다)
+def checked_queries():
+    import follow_graph
+    import posting_cache
+    import tag_names
+    import timeline
+    import token_blocklist
+    from resources.posting import feed_query
+    from resources.tag import popular_tags_query, posting_ids_query
+    from resources.user import LOGIN_QUERY
+
+    cursor = ('2030-01-01 00:00:00', 1000000)
+    return [
+        ('feed (offset)',) + feed_query(1, None, 0, 20),
+        ('feed (cursor)',) + feed_query(1, cursor, 0, 20),
+        ('feed (followee ids)',) + feed_query(1, None, 0, 20, [1, 2, 3]),
+        ('feed (ids, cursor)',) + feed_query(1, cursor, 0, 20, [1, 2, 3]),
+        ('followee list', follow_graph.FOLLOWEE_QUERY, (1,)),
+        ('follower list', follow_graph.FOLLOWER_QUERY, (1,)),
+        ('posting detail',) + posting_cache.details_query([1, 2]),
+        ('posting isLike',) + posting_cache.liked_query(1, [1, 2]),
+        ('tag_name lookup',) + tag_names.tag_name_ids_query(['person', 'food']),
+        ('tag search',) + posting_ids_query(1, None, 2000),
+        ('tag search next',) + posting_ids_query(1, 1000000, 2000),
+        ('popular tags',) + popular_tags_query(10),
+        ('login', LOGIN_QUERY, ('test@naver.com',)),
+        ('timeline page',) + timeline.page_query(1, None, 20),
+        ('timeline next',) + timeline.page_query(1, cursor, 20),
+        ('token blocklist', token_blocklist.IS_REVOKED_QUERY, ('x',)),
+    ]
+
+
+def connect():
+    return mysql.connector.connect(host = Config.HOST,
+                                   database = Config.DATABASE,
+                                   user = Config.DB_USER,
+                                   password = Config.DB_PASSWORD)
+
+
+def migration_files():
+    names = [name for name in os.listdir(MIGRATIONS_DIR) if name.endswith('.sql')]
+    return sorted(names)
+
+
+def split_statements(sql):
+    # 주석 줄을 빼고, ; 로 나눈다. (마이그레이션 파일에는 문자열 안에 ; 를 쓰지 않는다)
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [statement.strip() for statement in '\n'.join(lines).split(';')
+            if statement.strip() != '']
+
+
+def applied_versions(connection):
+    cursor = connection.cursor()
+    cursor.execute('''create table if not exists schema_migrations (
+                        version varchar(100) not null,
+                        appliedAt timestamp not null default current_timestamp,
+                        primary key (version))''')
+    cursor.execute('select version from schema_migrations')
+    versions = set(row[0] for row in cursor.fetchall())
+    cursor.close()
+    return versions
+
+
+def migrate():
+    connection = connect()
+    applied = applied_versions(connection)
+    for name in migration_files():
+        if name in applied:
+            continue
+        print('applying', name)
+        with open(os.path.join(MIGRATIONS_DIR, name), encoding='utf-8') as file:
+            statements = split_statements(file.read())
+        cursor = connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute('insert into schema_migrations (version) values (%s)', (name,))
+        connection.commit()
+        cursor.close()
+    connection.close()
+    return 0
+
+
+def status():
+    connection = connect()
+    applied = applied_versions(connection)
+    connection.close()
+    for name in migration_files():
+        print(('applied  ' if name in applied else 'pending  ') + name)
+    return 0
+
+
+# 검사용 DB 에 테이블마다 rows 개 정도의 행을 넣는다.
+# 행이 거의 없으면 옵티마이저가 인덱스 대신 전체 읽기를 고르므로,
+# 비어있는 CI DB 에서도 운영과 비슷한 실행계획이 나오게 한다.
+# 이미 rows 개 이상 있는 테이블은 건드리지 않는다. (운영 DB 에는 쓰지 말것)
+def seed(connection, rows):
+    rand = random.Random(0)
+    cursor = connection.cursor()
+
+    def count(table):
+        cursor.execute('select count(*) from ' + table)
+        return cursor.fetchone()[0]
+
+    def fill(table, query, record_list):
+        if count(table) < rows:
+            cursor.executemany(query, record_list)
+            connection.commit()
+
+    users = range(1, rows + 1)
+    fill('user',
+         'insert ignore into user (id, email, password) values (%s, %s, %s)',
+         [(i, 'explain' + str(i) + '@example.com', 'x') for i in users])
+    fill('posting',
+         """insert ignore into posting (id, userId, imgUrl, content, status, createdAt)
+            values (%s, %s, %s, %s, 'done', from_unixtime(%s))""",
+         [(i, rand.choice(users), 'x', 'x', 1700000000 + i) for i in range(1, rows + 1)])
+    fill('follow',
+         'insert ignore into follow (followerId, followeeId) values (%s, %s)',
+         [(rand.choice(users), rand.choice(users)) for i in range(rows)])
+    fill('likes',
+         'insert ignore into likes (userId, postingId) values (%s, %s)',
+         [(rand.choice(users), rand.randint(1, rows)) for i in range(rows)])
+    fill('tag_name',
+         'insert ignore into tag_name (id, name, postingCnt) values (%s, %s, %s)',
+         [(i, 'tag' + str(i), rand.choice([0, 0, 0, 1, 5])) for i in range(1, rows + 1)])
+    fill('tag',
+         'insert into tag (postingId, tagNameId) values (%s, %s)',
+         [(rand.randint(1, rows), rand.randint(1, rows)) for i in range(rows)])
+    fill('tag_day_count',
+         """insert ignore into tag_day_count (day, tagNameId, postingCnt)
+            values (current_date - interval %s day, %s, %s)""",
+         [(rand.randint(0, 30), rand.randint(1, rows), rand.randint(1, 5)) for i in range(rows)])
+    fill('timeline',
+         """insert ignore into timeline (userId, postingId, authorId, createdAt)
+            values (%s, %s, %s, from_unixtime(%s))""",
+         [(rand.choice(users), i, rand.choice(users), 1700000000 + i) for i in range(1, rows + 1)])
+    fill('token_blocklist',
+         'insert ignore into token_blocklist (jti, expiresAt) values (%s, now())',
+         [('explain' + str(i),) for i in range(rows)])
+
+    # 통계를 다시 계산해야 옵티마이저가 늘어난 행 수를 본다.
+    cursor.execute('analyze table user, posting, follow, likes, tag_name, tag, tag_day_count, '
+                   'timeline, timeline_celebrity, token_blocklist')
+    cursor.fetchall()
+    cursor.close()
+
+
+# type 이 ALL 이면 테이블 전체를 읽는다. 검사하는 쿼리는 모두 인덱스로 찾아야 하므로
+# 행 수와 상관없이 실패로 본다. (빈 DB 에서는 --seed 로 행을 먼저 넣는다)
+def explain(seed_rows=0):
+    connection = connect()
+    if seed_rows > 0:
+        seed(connection, seed_rows)
+
+    cursor = connection.cursor(dictionary=True)
+    failed = False
+    for name, query, params in checked_queries():
+        cursor.execute('explain ' + query.strip().rstrip(';'), params)
+        for row in cursor.fetchall():
+            bad = row.get('type') == 'ALL'
+            print('%-4s %-20s table=%-16s type=%-8s key=%-28s rows=%s' %
+                  ('FAIL' if bad else 'ok', name, row.get('table'), row.get('type'),
+                   row.get('key'), row.get('rows')))
+            if bad:
+                failed = True
+    cursor.close()
+    connection.close()
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['migrate', 'status', 'explain'])
+    parser.add_argument('--seed', type=int, default=0,
+                        help='explain 전에 테이블마다 이만큼 검사용 행을 넣는다 (CI 용 DB 에서만)')
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        return migrate()
+    if args.command == 'status':
+        return status()
+    return explain(args.seed)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+# tag_name 테이블의 이름 -> 아이디 조회.
+# tag_name 은 작고 거의 추가만 되는 테이블이므로,
+# 자주 나오는 태그("person", "food" ...)는 메모리 캐시에서 바로 찾는다.
+
+from cache import LRUCache
+from config import Config
+import metrics
+
+
+CACHE_SIZE = getattr(Config, 'TAG_CACHE_SIZE', 10000)
+CACHE_TTL = getattr(Config, 'TAG_CACHE_TTL', 3600)       # 초. None 이면 만료 없음
+WARM_SIZE = getattr(Config, 'TAG_CACHE_WARM_SIZE', 1000)  # 서버 시작할때 미리 읽어둘 태그 수
+
+tag_name_cache = LRUCache(CACHE_SIZE, CACHE_TTL)
+
+
+# 태그 이름 목록의 {이름 : 아이디} 를 가져온다.
+# 캐시에 없는 이름만 한번의 쿼리로 DB 에서 찾는다.
+# DB 에도 없는 이름은 결과에 들어있지 않다.
+def get_tag_name_ids(cursor, names):
+    result = {}
+    missing = []
+    for name in names:
+        tag_name_id = tag_name_cache.get(name)
+        if tag_name_id is None:
+            missing.append(name)
+        else:
+            result[name] = tag_name_id
+
+    if len(missing) != 0:
+        found = select_tag_name_ids(cursor, missing)
+        # 일반 select 로 읽은 행은 이미 커밋된 행이므로 캐시에 넣어도 된다.
+        for name, tag_name_id in found.items():
+            tag_name_cache.set(name, tag_name_id)
+        result.update(found)
+
+    return result
+
+
+# 태그 이름 목록의 아이디를 찾는 쿼리와 파라미터
+def tag_name_ids_query(names, locking=False):
+    query = '''select id, name
+            from tag_name
+            where name in (''' + ', '.join(['%s'] * len(names)) + ''')'''
+    if locking :
+        query = query + '''
+            lock in share mode'''
+    return query + ';', tuple(names)
+
+
+# 태그 이름 목록의 {이름 : 아이디} 를 한번의 쿼리로 가져온다.
+def select_tag_name_ids(cursor, names, locking=False):
+    query, record = tag_name_ids_query(names, locking)
+    cursor.execute(query, record)
+    return {row[1] : row[0] for row in cursor.fetchall()}
+
+
+# 많이 쓰인 태그들을 캐시에 미리 넣어둔다.
+def warm_tag_cache(connection, size=WARM_SIZE):
+    query = '''select tn.id, tn.name
+            from tag t
+            join tag_name tn
+            on t.tagNameId = tn.id
+            group by tn.id
+            order by count(*) desc
+            limit %s;'''
+    cursor = connection.cursor()
+    cursor.execute(query, (size,))
+    result_list = cursor.fetchall()
+    cursor.close()
+    for row in result_list:
+        tag_name_cache.set(row[1], row[0])
+    return len(result_list)
+
+
+def tag_cache_stats():
+    return tag_name_cache.stats()
+
+
+metrics.register_gauges('tag_cache', tag_cache_stats)
@@ -0,0 +1,363 @@
+# 팔로워 피드용 타임라인 (fan-out on write).
+#
+# 포스팅을 작성하면, 작성자를 팔로우하는 유저들의 타임라인에
+# 포스팅 아이디를 미리 넣어둔다. 피드를 볼때는 follow / posting 조인 대신
+# 자기 타임라인에서 아이디만 읽어오면 된다.
+#
+# 팔로워가 아주 많은 계정(셀럽)은 글 하나에 수많은 행을 써야 하므로
+# 타임라인에 넣지 않고, 피드를 볼때 기존처럼 조인해서 가져온다.
+# 셀럽이 되기 전에 타임라인에 들어간 포스팅은 타임라인을 읽을때 빼고
+# (jobs.py prune_celebrity_timelines 로 지운다), 셀럽 쪽에서만 가져온다.
+#
+# config.py 의 TIMELINE_ENABLED 가 True 일때만 동작한다.
+
+import bisect
+import threading
+
+from config import Config
+
+
+ENABLED = getattr(Config, 'TIMELINE_ENABLED', False)
+STORE = getattr(Config, 'TIMELINE_STORE', 'mysql')                # 'mysql' 또는 'memory'
+MAX_LENGTH = getattr(Config, 'TIMELINE_MAX_LENGTH', 800)          # 유저별 타임라인 최대 길이
+CELEBRITY_FOLLOWERS = getattr(Config, 'TIMELINE_CELEBRITY_FOLLOWERS', 10000)
+
+
+# 유저 타임라인 한 페이지를 읽는 쿼리와 파라미터. (schema.py explain 에서도 쓴다)
+# 셀럽이 된 작성자의 포스팅은 read_feed 에서 따로 가져오므로 뺀다.
+def page_query(owner_id, before, limit):
+    if before is None:
+        query = '''select t.createdAt, t.postingId
+                    from timeline t
+                    left join timeline_celebrity c
+                    on t.authorId = c.userId
+                    where t.userId = %s and c.userId is null
+                    order by t.createdAt desc, t.postingId desc
+                    limit %s;'''
+        record = (owner_id, limit)
+    else:
+        query = '''select t.createdAt, t.postingId
+                    from timeline t
+                    left join timeline_celebrity c
+                    on t.authorId = c.userId
+                    where t.userId = %s and c.userId is null
+                    and (t.createdAt < %s
+                         or (t.createdAt = %s and t.postingId < %s))
+                    order by t.createdAt desc, t.postingId desc
+                    limit %s;'''
+        record = (owner_id, before[0], before[0], before[1], limit)
+    return query, record
+
+
+class MySQLTimelineStore:
+    '''timeline / timeline_celebrity 테이블에 저장하는 타임라인.
+    요청에서 쓰는 커넥션을 그대로 받아서, 같은 트랜잭션으로 처리한다.'''
+
+    def add(self, connection, owner_ids, entry):
+        if len(owner_ids) == 0:
+            return
+        created_at, posting_id, author_id = entry
+        query = '''insert ignore into timeline
+                    (userId, postingId, authorId, createdAt)
+                    values
+                    (%s, %s, %s, %s);'''
+        record_list = [(owner_id, posting_id, author_id, created_at) for owner_id in owner_ids]
+        cursor = connection.cursor()
+        cursor.executemany(query, record_list)
+        cursor.close()
+        self._trim(connection, owner_ids)
+
+    def add_many(self, connection, owner_id, entries):
+        if len(entries) == 0:
+            return
+        query = '''insert ignore into timeline
+                    (userId, postingId, authorId, createdAt)
+                    values
+                    (%s, %s, %s, %s);'''
+        record_list = [(owner_id, posting_id, author_id, created_at)
+                       for created_at, posting_id, author_id in entries]
+        cursor = connection.cursor()
+        cursor.executemany(query, record_list)
+        cursor.close()
+        self._trim(connection, [owner_id])
+
+    def _trim(self, connection, owner_ids):
+        # MAX_LENGTH 번째 보다 오래된 항목은 지운다.
+        query = '''delete t
+                    from timeline t
+                    join (select createdAt, postingId
+                          from timeline
+                          where userId = %s
+                          order by createdAt desc, postingId desc
+                          limit 1 offset %s) c
+                    on t.userId = %s
+                    and (t.createdAt < c.createdAt
+                         or (t.createdAt = c.createdAt and t.postingId <= c.postingId));'''
+        record_list = [(owner_id, MAX_LENGTH, owner_id) for owner_id in owner_ids]
+        cursor = connection.cursor()
+        cursor.executemany(query, record_list)
+        cursor.close()
+
+    def remove_author(self, connection, owner_id, author_id):
+        query = '''delete from timeline
+                    where userId = %s and authorId = %s;'''
+        cursor = connection.cursor()
+        cursor.execute(query, (owner_id, author_id))
+        cursor.close()
+
+    def remove_posting(self, connection, posting_id):
+        query = '''delete from timeline
+                    where postingId = %s;'''
+        cursor = connection.cursor()
+        cursor.execute(query, (posting_id,))
+        cursor.close()
+
+    def page(self, connection, owner_id, before, limit):
+        query, record = page_query(owner_id, before, limit)
+        cursor = connection.cursor()
+        cursor.execute(query, record)
+        result_list = cursor.fetchall()
+        cursor.close()
+        return [(row[0], row[1]) for row in result_list]
+
+    def mark_celebrity(self, connection, author_id):
+        query = '''insert ignore into timeline_celebrity
+                    (userId)
+                    values
+                    (%s);'''
+        cursor = connection.cursor()
+        cursor.execute(query, (author_id,))
+        cursor.close()
+
+    def is_celebrity(self, connection, author_id):
+        query = '''select userId
+                    from timeline_celebrity
+                    where userId = %s;'''
+        cursor = connection.cursor()
+        cursor.execute(query, (author_id,))
+        result_list = cursor.fetchall()
+        cursor.close()
+        return len(result_list) != 0
+
+    def followed_celebrities(self, connection, user_id):
+        query = '''select f.followeeId
+                    from follow f
+                    join timeline_celebrity c
+                    on f.followeeId = c.userId
+                    where f.followerId = %s;'''
+        cursor = connection.cursor()
+        cursor.execute(query, (user_id,))
+        result_list = cursor.fetchall()
+        cursor.close()
+        return [row[0] for row in result_list]
+
+
+class MemoryTimelineStore:
+    '''프로세스 메모리에 저장하는 타임라인. 테스트나 서버 한대일때 사용.
+    유저별로 (createdAt, postingId, authorId) 를 오름차순 리스트로 가지고 있는다.'''
+
+    def __init__(self):
+        self._timelines = {}
+        self._celebrities = set()
+        self._lock = threading.Lock()
+
+    def _insert(self, owner_id, entry):
+        timeline = self._timelines.setdefault(owner_id, [])
+        i = bisect.bisect_left(timeline, entry)
+        if i < len(timeline) and timeline[i][:2] == entry[:2]:
+            return
+        timeline.insert(i, entry)
+        if len(timeline) > MAX_LENGTH:
+            del timeline[:len(timeline) - MAX_LENGTH]
+
+    def add(self, connection, owner_ids, entry):
+        with self._lock:
+            for owner_id in owner_ids:
+                self._insert(owner_id, tuple(entry))
+
+    def add_many(self, connection, owner_id, entries):
+        with self._lock:
+            for entry in entries:
+                self._insert(owner_id, tuple(entry))
+
+    def remove_author(self, connection, owner_id, author_id):
+        with self._lock:
+            timeline = self._timelines.get(owner_id)
+            if timeline is not None:
+                timeline[:] = [entry for entry in timeline if entry[2] != author_id]
+
+    def remove_posting(self, connection, posting_id):
+        with self._lock:
+            for timeline in self._timelines.values():
+                timeline[:] = [entry for entry in timeline if entry[1] != posting_id]
+
+    def page(self, connection, owner_id, before, limit):
+        with self._lock:
+            timeline = self._timelines.get(owner_id, [])
+            if before is None:
+                end = len(timeline)
+            else:
+                end = bisect.bisect_left(timeline, (before[0], before[1]))
+            start = max(end - limit, 0)
+            return [(entry[0], entry[1]) for entry in reversed(timeline[start:end])]
+
+    def mark_celebrity(self, connection, author_id):
+        # 메모리에서는 지우는 비용이 작으므로, 이미 들어간 포스팅도 바로 뺀다.
+        with self._lock:
+            self._celebrities.add(author_id)
+            for timeline in self._timelines.values():
+                timeline[:] = [entry for entry in timeline if entry[2] != author_id]
+
+    def is_celebrity(self, connection, author_id):
+        return author_id in self._celebrities
+
+    def followed_celebrities(self, connection, user_id):
+        if len(self._celebrities) == 0:
+            return []
+        query = '''select followeeId
+                    from follow
+                    where followerId = %s;'''
+        cursor = connection.cursor()
+        cursor.execute(query, (user_id,))
+        result_list = cursor.fetchall()
+        cursor.close()
+        return [row[0] for row in result_list if row[0] in self._celebrities]
+
+
+if STORE == 'memory':
+    store = MemoryTimelineStore()
+else:
+    store = MySQLTimelineStore()
+
+
+def _follower_count(connection, user_id):
+    query = '''select count(*)
+                from follow
+                where followeeId = %s;'''
+    cursor = connection.cursor()
+    cursor.execute(query, (user_id,))
+    count = cursor.fetchone()[0]
+    cursor.close()
+    return count
+
+
+# 포스팅 작성후, 팔로워들의 타임라인에 넣는다.
+def on_posting_created(connection, author_id, posting_id):
+    if not ENABLED:
+        return
+
+    if store.is_celebrity(connection, author_id):
+        return
+    if _follower_count(connection, author_id) >= CELEBRITY_FOLLOWERS:
+        # 셀럽은 fan-out 하지 않고, 피드 조회때 조인으로 가져온다.
+        store.mark_celebrity(connection, author_id)
+        return
+
+    query = '''select createdAt
+                from posting
+                where id = %s;'''
+    cursor = connection.cursor()
+    cursor.execute(query, (posting_id,))
+    created_at = cursor.fetchone()[0]
+
+    query = '''select followerId
+                from follow
+                where followeeId = %s;'''
+    cursor.execute(query, (author_id,))
+    follower_ids = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+
+    store.add(connection, follower_ids, (created_at, posting_id, author_id))
+
+
+# 친구추가 하면, 그 친구의 최근 포스팅을 타임라인에 채워 넣는다.
+def on_follow(connection, follower_id, followee_id):
+    if not ENABLED:
+        return
+    if store.is_celebrity(connection, followee_id):
+        return
+
+    query = '''select createdAt, id, userId
+                from posting
+                where userId = %s and status = 'done'
+                order by createdAt desc, id desc
+                limit %s;'''
+    cursor = connection.cursor()
+    cursor.execute(query, (followee_id, MAX_LENGTH))
+    entries = [(row[0], row[1], row[2]) for row in cursor.fetchall()]
+    cursor.close()
+
+    store.add_many(connection, follower_id, entries)
+
+
+# 친구 삭제하면, 그 친구의 포스팅을 타임라인에서 뺀다.
+def on_unfollow(connection, follower_id, followee_id):
+    if not ENABLED:
+        return
+    store.remove_author(connection, follower_id, followee_id)
+
+
+# 포스팅이 삭제되면, 모든 타임라인에서 뺀다.
+def on_posting_deleted(connection, posting_id):
+    if not ENABLED:
+        return
+    store.remove_posting(connection, posting_id)
+
+
+# 피드에 보여줄 (createdAt, postingId) 목록을 최신순으로 가져온다.
+# before 는 (createdAt, postingId) 커서. 타임라인과,
+# 팔로우한 셀럽의 포스팅을 합쳐서 limit 개를 돌려준다.
+def read_feed(connection, user_id, before, limit):
+    entries = store.page(connection, user_id, before, limit)
+
+    celebrity_ids = store.followed_celebrities(connection, user_id)
+    if len(celebrity_ids) != 0:
+        query = '''select createdAt, id
+                    from posting
+                    where userId in (''' + ', '.join(['%s'] * len(celebrity_ids)) + ''')
+                    and status = 'done' '''
+        record = list(celebrity_ids)
+        if before is not None:
+            query = query + '''and (createdAt < %s
+                                or (createdAt = %s and id < %s)) '''
+            record = record + [before[0], before[0], before[1]]
+        query = query + '''order by createdAt desc, id desc
+                    limit %s;'''
+        record.append(limit)
+
+        cursor = connection.cursor()
+        cursor.execute(query, tuple(record))
+        entries = entries + [(row[0], row[1]) for row in cursor.fetchall()]
+        cursor.close()
+
+        # 같은 포스팅이 타임라인과 셀럽 쪽에서 둘다 나올수 있으므로
+        # 포스팅 아이디로 중복을 빼고 자른다.
+        entries.sort(reverse=True)
+        seen = set()
+        unique = []
+        for entry in entries:
+            if entry[1] not in seen:
+                seen.add(entry[1])
+                unique.append(entry)
+        entries = unique[:limit]
+
+    return entries
+
+
+# 셀럽이 되기 전에 팔로워들의 타임라인에 들어간 포스팅을 지운다.
+# (읽을때는 이미 빼고 있으므로, 공간을 정리하는 작업)
+# 한번에 batch 행씩 지우고, 지운 행 수를 리턴한다.
+def prune_celebrity_timelines(connection, batch=10000):
+    query = '''delete from timeline
+                where authorId in (select userId from timeline_celebrity)
+                limit %s;'''
+    total = 0
+    cursor = connection.cursor()
+    while True:
+        cursor.execute(query, (batch,))
+        connection.commit()
+        total = total + cursor.rowcount
+        if cursor.rowcount < batch:
+            break
+    cursor.close()
+    return total
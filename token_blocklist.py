@@ -0,0 +1,195 @@
+# 로그아웃된 JWT 토큰 저장소.
+#
+# 예전에는 프로세스 메모리의 set 에 저장해서, 서버를 재시작하면 사라지고
+# gunicorn 워커끼리 공유되지 않았다. 이제는 MySQL 테이블(또는 SQLite 파일)에
+# jti 와 토큰 만료시간을 저장해서, 모든 워커가 같은 목록을 본다.
+# 매 요청마다 DB 를 보지 않도록, 앞에 작은 로컬 캐시를 둔다.
+
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from app_logging import get_logger
+from cache import LRUCache
+from config import Config
+from mysql_connection import get_connection
+
+
+BACKEND = getattr(Config, 'TOKEN_BLOCKLIST_BACKEND', 'mysql')     # 'mysql' 또는 'sqlite'
+SQLITE_PATH = getattr(Config, 'TOKEN_BLOCKLIST_PATH', 'token_blocklist.sqlite3')
+CACHE_SIZE = getattr(Config, 'TOKEN_BLOCKLIST_CACHE_SIZE', 10000)
+# 로그아웃 안된 토큰은 짧게만 캐시한다. 다른 워커에서 로그아웃하면
+# 최대 이 시간(초) 동안은 이 워커에서 토큰이 통과될수 있다.
+NEGATIVE_TTL = getattr(Config, 'TOKEN_BLOCKLIST_NEGATIVE_TTL', 5)
+POSITIVE_TTL = getattr(Config, 'TOKEN_BLOCKLIST_POSITIVE_TTL', 3600)
+PURGE_INTERVAL = getattr(Config, 'TOKEN_BLOCKLIST_PURGE_INTERVAL', 3600)
+
+NEVER_EXPIRES = datetime(9999, 12, 31)
+
+IS_REVOKED_QUERY = '''select jti
+                        from token_blocklist
+                        where jti = %s;'''
+
+logger = get_logger(__name__)
+
+
+class MySQLRevocationStore:
+    '''token_blocklist 테이블 (jti primary key, expiresAt)'''
+
+    def revoke(self, jti, expires_at):
+        connection = get_connection()
+        try:
+            query = '''insert ignore into token_blocklist
+                        (jti, expiresAt)
+                        values
+                        (%s, %s);'''
+            cursor = connection.cursor()
+            cursor.execute(query, (jti, expires_at))
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+
+    def is_revoked(self, jti):
+        connection = get_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(IS_REVOKED_QUERY, (jti,))
+            row = cursor.fetchone()
+            cursor.close()
+        finally:
+            connection.close()
+        return row is not None
+
+    def purge(self, now):
+        connection = get_connection()
+        try:
+            query = '''delete from token_blocklist
+                        where expiresAt < %s;'''
+            cursor = connection.cursor()
+            cursor.execute(query, (now,))
+            deleted = cursor.rowcount
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+        return deleted
+
+
+class SQLiteRevocationStore:
+    '''MySQL 대신 쓰는 SQLite 파일 저장소. 서버 한대나 테스트용.'''
+
+    def __init__(self, path):
+        self.path = path
+        connection = self._connect()
+        connection.execute('''create table if not exists token_blocklist
+                            (jti text primary key,
+                             expiresAt timestamp not null)''')
+        connection.execute('''create index if not exists token_blocklist_expires
+                            on token_blocklist (expiresAt)''')
+        connection.commit()
+        connection.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def revoke(self, jti, expires_at):
+        connection = self._connect()
+        connection.execute('''insert or ignore into token_blocklist
+                            (jti, expiresAt) values (?, ?)''',
+                           (jti, expires_at.isoformat()))
+        connection.commit()
+        connection.close()
+
+    def is_revoked(self, jti):
+        connection = self._connect()
+        row = connection.execute('select jti from token_blocklist where jti = ?',
+                                 (jti,)).fetchone()
+        connection.close()
+        return row is not None
+
+    def purge(self, now):
+        connection = self._connect()
+        deleted = connection.execute('delete from token_blocklist where expiresAt < ?',
+                                     (now.isoformat(),)).rowcount
+        connection.commit()
+        connection.close()
+        return deleted
+
+
+if BACKEND == 'sqlite':
+    store = SQLiteRevocationStore(SQLITE_PATH)
+else:
+    store = MySQLRevocationStore()
+
+_revoked_cache = LRUCache(CACHE_SIZE, POSITIVE_TTL)
+_not_revoked_cache = LRUCache(CACHE_SIZE, NEGATIVE_TTL)
+
+
+def _utcnow():
+    # DB 에는 UTC 기준, 타임존 없는 datetime 으로 저장한다.
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# 토큰을 로그아웃 처리한다.
+# exp 는 JWT 의 exp (유닉스 시간). 이 시간이 지나면 purge 로 지워진다.
+# 만료시간이 없는 토큰(exp 가 None)은 지우지 않는다.
+def revoke_token(jti, exp):
+    if exp is None:
+        expires_at = NEVER_EXPIRES
+    else:
+        expires_at = datetime.fromtimestamp(exp, timezone.utc).replace(tzinfo=None)
+    store.revoke(jti, expires_at)
+    _not_revoked_cache.delete(jti)
+    _revoked_cache.set(jti, True)
+
+
+def is_token_revoked(jti):
+    if _revoked_cache.get(jti) is not None:
+        return True
+    if _not_revoked_cache.get(jti) is not None:
+        return False
+
+    revoked = store.is_revoked(jti)
+    if revoked:
+        _revoked_cache.set(jti, True)
+    else:
+        _not_revoked_cache.set(jti, False)
+    return revoked
+
+
+# 만료된 토큰은 어차피 JWT 검증에서 걸리므로 목록에서 지운다.
+def purge_expired_tokens():
+    return store.purge(_utcnow())
+
+
+def blocklist_cache_stats():
+    return {'revoked' : _revoked_cache.stats(),
+            'not_revoked' : _not_revoked_cache.stats()}
+
+
+_purge_thread = None
+_purge_lock = threading.Lock()
+
+
+def _purge_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            purge_expired_tokens()
+        except Exception as e:
+            logger.error(str(e))
+
+
+# PURGE_INTERVAL 초마다 만료된 토큰을 지우는 스레드를 시작한다.
+def start_purge_thread(interval=PURGE_INTERVAL):
+    global _purge_thread
+    with _purge_lock:
+        if _purge_thread is not None:
+            return
+        _purge_thread = threading.Thread(target=_purge_loop,
+                                         args=(interval,),
+                                         name='token-blocklist-purge',
+                                         daemon=True)
+        _purge_thread.start()
@@ -1,11 +1,67 @@
+import base64
+import binascii
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
 from passlib.hash import pbkdf2_sha256
 
 from config import Config
+import metrics
+
+# 비밀번호 암호화 반복 횟수. 바꾸면 기존 유저는 로그인할때 새 횟수로 다시 암호화된다.
+PASSWORD_ROUNDS = getattr(Config, 'PASSWORD_HASH_ROUNDS', 29000)
+# 암호화를 처리할 프로세스 수. 0 이면 요청 스레드에서 바로 처리한다.
+PASSWORD_WORKERS = getattr(Config, 'PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+
+_hasher = pbkdf2_sha256.using(rounds=PASSWORD_ROUNDS)
+
+_executor = None
+_executor_lock = threading.Lock()
+# 한번에 대기할수 있는 작업 수를 제한한다. 넘치면 앞의 작업이 끝날때까지 기다린다.
+_slots = threading.BoundedSemaphore(max(PASSWORD_WORKERS, 1) * 4)
+
+
+def _hash(password, rounds):
+    return pbkdf2_sha256.using(rounds=rounds).hash(password)
+
+def _verify(password, hashed_password):
+    return pbkdf2_sha256.verify(password, hashed_password)
+
+# CPU 를 많이 쓰는 암호화는 프로세스 풀에서 실행해서,
+# 다른 요청을 처리하는 스레드가 멈추지 않게 한다.
+def _run(func, *args):
+    global _executor
+    if PASSWORD_WORKERS == 0:
+        return func(*args)
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # 요청 스레드와 DB 커넥션 풀 락을 가진 채로 fork 하면 자식 프로세스가
+                # 멈출수 있으므로, fork 대신 forkserver(없으면 spawn)로 프로세스를 만든다.
+                if 'forkserver' in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context('forkserver')
+                    # 기본값(['__main__'])이면 forkserver 가 python app.py 의 app.py 를 다시
+                    # import 해서 워커, 스레드 같은 import 할때의 일을 또 하므로, 암호화 함수만
+                    # 있는 이 모듈을 미리 읽어둔다.
+                    context.set_forkserver_preload(['utils'])
+                else:
+                    context = multiprocessing.get_context('spawn')
+                _executor = ProcessPoolExecutor(max_workers=PASSWORD_WORKERS,
+                                                mp_context=context)
+    with _slots:
+        return _executor.submit(func, *args).result()
+
 
 # 원문비밀번호를  단방향 암호화 하는 함수 
 def hash_password(original_password) :
     original_password = original_password + Config.PASSWORD_SALT
-    password=pbkdf2_sha256.hash(original_password)
+    start = time.perf_counter()
+    password = _run(_hash, original_password, PASSWORD_ROUNDS)
+    record_timing('password.hash', time.perf_counter() - start)
     return password
 
 # 유저가 로그인할때,
@@ -13,5 +69,58 @@ def hash_password(original_password) :
 # 체크하는 함수 
 def check_password(original_password, hashed_password):
     original_password = original_password + Config.PASSWORD_SALT
-    check = pbkdf2_sha256.verify(original_password, hashed_password)
-    return check
\ No newline at end of file
+    start = time.perf_counter()
+    check = _run(_verify, original_password, hashed_password)
+    record_timing('password.verify', time.perf_counter() - start)
+    return check
+
+# 저장된 암호가 예전 반복 횟수로 만들어졌으면 True
+def password_needs_update(hashed_password):
+    return _hasher.needs_update(hashed_password)
+
+
+# 구간별 처리 시간 통계 (횟수, 합계, 최대)
+_timings = {}
+_timings_lock = threading.Lock()
+
+def record_timing(name, seconds):
+    with _timings_lock:
+        timing = _timings.setdefault(name, {'count' : 0, 'total' : 0.0, 'max' : 0.0})
+        timing['count'] += 1
+        timing['total'] += seconds
+        if seconds > timing['max']:
+            timing['max'] = seconds
+
+def timing_stats():
+    with _timings_lock:
+        stats = {}
+        for name, timing in _timings.items():
+            stats[name] = dict(timing)
+            stats[name]['avg'] = timing['total'] / timing['count']
+        return stats
+
+# /metrics 용. {'password_hash_count' : 3, 'password_hash_avg' : 0.1, ...}
+def timing_gauges():
+    gauges = {}
+    for name, timing in timing_stats().items():
+        for key, value in timing.items():
+            gauges[name.replace('.', '_') + '_' + key] = value
+    return gauges
+
+metrics.register_gauges('timing', timing_gauges)
+
+# 피드 페이징용 커서를 만드는 함수.
+# 마지막 행의 (createdAt, id) 를 클라이언트가 알아볼수 없는 문자열로 바꾼다.
+def encode_cursor(created_at, posting_id):
+    raw = created_at.isoformat() + '|' + str(posting_id)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+# 클라이언트가 보낸 커서를 (createdAt, id) 로 되돌리는 함수.
+# 형식이 잘못되면 ValueError 를 발생시킨다.
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, posting_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(posting_id)
+    except (ValueError, UnicodeError, binascii.Error) :
+        raise ValueError('잘못된 커서 입니다.')